@@ -3,45 +3,163 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import json
-import orjson
-from pandas import json_normalize
+import threading
+from collections import OrderedDict
 import duckdb
 from langchain_openai import ChatOpenAI
 from langgraph.prebuilt import create_react_agent
 from langchain_core.tools import tool
-from typing import Annotated
+from typing import Annotated, Any, Dict
+
+from agents.json_loader import JSON_BACKEND, NESTED_FIELDS_HINTS, load_sections, normalize_section, read_json_file, select_sections
 
 
 # Load model
 model = ChatOpenAI(model="gpt-4o")
 
 
+# === Loaded JSON sections ===
+# Memory budget for normalized sections kept between queries
+SECTION_CACHE_BYTES = int(os.getenv("SECTION_CACHE_BYTES", str(512 * 1024 * 1024)))
+
+# Long-lived connection; each loaded section is exposed as json_data on its own cursor
+section_conn = duckdb.connect()
+# (file path, mtime, section) -> {"cursor", "table", "bytes", "lock"}, least recently used first
+loaded_sections: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+sections_lock = threading.Lock()
+sections_bytes = 0
+section_ids = 0
+
+
+def section_memory() -> int:
+    """Memory held by the section connection, used to size natively loaded sections."""
+    return section_conn.execute("SELECT SUM(memory_usage_bytes) FROM duckdb_memory()").fetchone()[0] or 0
+
+
+def drop_section(key: tuple):
+    """Unregister a loaded section and free its cursor; callers hold sections_lock."""
+    global sections_bytes
+    entry = loaded_sections.pop(key)
+    sections_bytes -= entry["bytes"]
+    with entry["lock"]:
+        if entry["table"]:
+            entry["cursor"].execute(f"DROP TABLE {entry['table']}")
+        else:
+            entry["cursor"].unregister("json_data")
+        entry["cursor"].close()
+        entry["cursor"] = None
+
+
+def load_section(json_file_path: str, section: str) -> Dict[str, Any]:
+    """
+    Return the cursor entry with a section of a JSON file available as json_data,
+    loading it only when the file changed since it was last loaded.
+    Least recently used sections are dropped once SECTION_CACHE_BYTES is exceeded.
+    """
+    global sections_bytes, section_ids
+    path = os.path.abspath(json_file_path)
+    key = (path, os.stat(path).st_mtime_ns, section)
+    
+    with sections_lock:
+        entry = loaded_sections.get(key)
+        if entry is not None:
+            loaded_sections.move_to_end(key)
+            return entry
+        
+        # Older versions of this section are stale now
+        for stale in [k for k in loaded_sections if k[0] == path and k[2] == section]:
+            drop_section(stale)
+        
+        cursor = section_conn.cursor()
+        try:
+            if JSON_BACKEND == "native":
+                # Materialize the section as a table and expose it to this cursor as json_data
+                section_ids += 1
+                table = f"section_{section_ids}"
+                memory_before = section_memory()
+                load_sections(cursor, path, [section], {section: table}, backend="native")
+                cursor.execute(f"CREATE TEMP VIEW json_data AS SELECT * FROM {table}")
+                entry = {"cursor": cursor, "table": table, "bytes": max(section_memory() - memory_before, 0), "lock": threading.Lock()}
+            else:
+                section_data = select_sections(read_json_file(path), [section])[section]
+                # Use pandas json_normalize to flatten nested structures
+                df = normalize_section(section_data)
+                del section_data
+                cursor.register('json_data', df)
+                entry = {"cursor": cursor, "table": None, "bytes": int(df.memory_usage(deep=True).sum()), "lock": threading.Lock()}
+        except Exception:
+            cursor.close()
+            raise
+        loaded_sections[key] = entry
+        sections_bytes += entry["bytes"]
+        
+        # Evict least recently used sections, but always keep the one just loaded
+        while sections_bytes > SECTION_CACHE_BYTES and len(loaded_sections) > 1:
+            drop_section(next(iter(loaded_sections)))
+        
+        return entry
+
+
 # === Schema Agent and Functions ===
+# Path indexes of schema files: absolute path -> {"mtime_ns", "nodes", "children", "rendered"}
+schema_indexes: Dict[str, Dict[str, Any]] = {}
+schema_lock = threading.Lock()
+
+
+def schema_items(node):
+    """The schema that a node's children are looked up in; arrays describe their items."""
+    if isinstance(node, dict) and node.get('type') == 'array':
+        return node.get('items', {})
+    return node
+
+
+def build_schema_index(schema) -> Dict[str, Any]:
+    """
+    Index every section of a schema by dot path: the section's subtree and the names of
+    its subsections. Array sections are stepped through to their items.
+    """
+    nodes = {"": schema}
+    children = {}
+    stack = [""]
+    while stack:
+        path = stack.pop()
+        container = schema_items(nodes[path])
+        properties = container.get('properties', {}) if isinstance(container, dict) else {}
+        children[path] = list(properties) if isinstance(properties, dict) else []
+        for name in children[path]:
+            child_path = f"{path}.{name}" if path else name
+            nodes[child_path] = properties[name]
+            stack.append(child_path)
+    return {"nodes": nodes, "children": children, "rendered": {}}
+
+
+def get_schema_index(schema_path: str) -> Dict[str, Any]:
+    """Return the path index of a schema file, rebuilding it when the file's mtime changes."""
+    path = os.path.abspath(schema_path)
+    mtime_ns = os.stat(path).st_mtime_ns
+    with schema_lock:
+        index = schema_indexes.get(path)
+        if index is None or index["mtime_ns"] != mtime_ns:
+            with open(path, "r") as f:
+                index = build_schema_index(json.load(f))
+            index["mtime_ns"] = mtime_ns
+            schema_indexes[path] = index
+        return index
+
+
 def load_json_schema_section(schema_path: str, section_path: str) -> str:
     """Load any section or subsection of the large JSON schema using dot notation."""
-    with open(schema_path, "r") as f:
-        schema = json.load(f)
+    index = get_schema_index(schema_path)
     
-    # Handle empty/root path
-    if not section_path:
-        return json.dumps(schema, indent=2)
-        
-    # Navigate through the path
-    current = schema
-    path_parts = section_path.split('.')
+    if section_path not in index["nodes"]:
+        return json.dumps({"error": f"Invalid path: {section_path}"}, indent=2)
     
-    for part in path_parts:
-        # Handle array items
-        if isinstance(current, dict) and current.get('type') == 'array':
-            current = current.get('items', {})
-            
-        # Navigate to next level
-        if isinstance(current, dict):
-            current = current.get('properties', {}).get(part, {})
-        else:
-            return json.dumps({"error": f"Invalid path: {section_path}"}, indent=2)
-            
-    return json.dumps(current, indent=2)
+    # Sections are rendered once per schema version
+    rendered = index["rendered"].get(section_path)
+    if rendered is None:
+        rendered = json.dumps(index["nodes"][section_path], indent=2)
+        index["rendered"][section_path] = rendered
+    return rendered
 
 
 @tool("view_schema_section")
@@ -85,23 +203,8 @@ def view_available_sections(
     - "users" - Shows subsections under users like profile, addresses, orders
     - "users.profile" - Shows subsections under profile like preferences, security
     """
-    with open(schema_path, "r") as f:
-        schema = json.load(f)
-    
-    # Navigate to the specified section if provided
-    current = schema
-    if section_path:
-        try:
-            for part in section_path.split('.'):
-                current = current.get('properties', {}).get(part, {})
-                # Handle array items
-                if current.get('type') == 'array':
-                    current = current.get('items', {})
-        except (KeyError, AttributeError):
-            return f"Invalid section path: {section_path}"
-            
-    # Get available properties at current level
-    properties = current.get('properties', {}).keys()
+    # Get available properties at the section from the schema's path index
+    properties = get_schema_index(schema_path)["children"].get(section_path)
     if not properties:
         return "No subsections available at this path"
         
@@ -112,13 +215,16 @@ def view_available_sections(
 
 def query_json(query: str, json_file_path: str, section: str = "") -> str:
     """
-    Query a specific section of a JSON file using DuckDB with flattened data structure.
+    Query a specific section of a JSON file using DuckDB.
     
     This function loads the JSON file using orjson for speed, extracts the specified section,
     normalizes the nested structure using pandas json_normalize, and then queries it using DuckDB.
+    With the default native backend (JSON_BACKEND), DuckDB's JSON reader loads the section
+    into a table instead, with nested objects as STRUCT columns.
+    Loaded sections stay registered between calls until the file changes or they are evicted.
     
     Args:
-        query: SQL query to execute on the flattened data
+        query: SQL query to execute on the section, registered as json_data
         json_file_path: Path to the JSON file to query
         section: Top-level section key to query (empty string means query entire file)
         
@@ -126,48 +232,37 @@ def query_json(query: str, json_file_path: str, section: str = "") -> str:
         The query results as a string
     """
     try:
-        # Read JSON with orjson for better performance
-        with open(json_file_path, 'rb') as f:
-            data = orjson.loads(f.read())
-        
-        # Extract specific section if provided
-        if section:
-            if section not in data:
-                return f"Error: Section '{section}' not found in JSON data"
-            data = data[section]
-            
-        # Handle both single object and list of objects
-        if isinstance(data, dict):
-            data = [data]
-            
-        # Use pandas json_normalize to flatten nested structures
-        df = json_normalize(data, sep='.')
-        
-        # Create DuckDB connection and register DataFrame
-        con = duckdb.connect()
-        con.register('json_data', df)
-        
-        # Execute query
-        result = con.execute(query).df()
+        result = None
+        while result is None:
+            entry = load_section(json_file_path, section)
+            # Execute query; a cursor runs one query at a time. Retry if the
+            # section was evicted between loading and querying.
+            with entry["lock"]:
+                if entry["cursor"] is not None:
+                    result = entry["cursor"].execute(query).df()
         
         # Convert result to string representation
         return result.to_string()
         
+    except KeyError as e:
+        return f"Error: {e.args[0]}"
     except Exception as e:
         return f"Error querying JSON: {str(e)}"
 
 
 @tool("query_json_data")
 def query_json_tool(
-    query: Annotated[str, """The SQL query to execute against the flattened JSON data. Uses standard SQL syntax."""],
+    query: Annotated[str, """The SQL query to execute against the JSON section (json_data). Uses standard SQL syntax."""],
     json_file_path: Annotated[str, "Path to the JSON file to query"],
     section: Annotated[str, "Optional top-level section key to query (e.g., 'users', 'transactions'). Leave empty to query entire file."] = ""
 ) -> Annotated[str, "Query results as a string"]:
     """
     Use this tool to query a specific section of the JSON data file using SQL via DuckDB.
     
-    The JSON data is automatically flattened with nested objects and arrays expanded
-    into columns using dot notation. Arrays are properly maintained as lists where appropriate.
+    Each key of the section's objects becomes a column. Nested objects are STRUCT columns
+    whose fields are accessed with dot notation (e.g., job_record.status); with
+    JSON_BACKEND=pandas they are flattened into quoted columns such as "job_record.status".
+    Arrays are properly maintained as lists where appropriate.
     
     You can specify a top-level section to query, which helps focus the analysis on a specific
     part of the data. For example:
@@ -203,12 +298,12 @@ def query_json_tool(
 
 
 
-system_prompt = """
+system_prompt = f"""
 You are an expert JSON data analyst specializing in SQL queries over complex nested JSON data structures.
 You have access to a JSON schema and a JSON data file, which you'll use to answer questions about the data.
 
 The data is automatically normalized into a SQL-queryable format where:
-- Nested objects are flattened using dot notation (e.g., user.profile.name)
+- {NESTED_FIELDS_HINTS[JSON_BACKEND]}
 - Arrays are preserved as queryable lists
 - Complex nested structures are maintained in a way that enables sophisticated queries
 
@@ -0,0 +1,166 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator
+
+import duckdb
+
+# Seconds a database may go unused before its shared connection is closed
+IDLE_TIMEOUT = float(os.getenv("DUCKDB_IDLE_TIMEOUT", "300"))
+
+# Shared read-only connection per database:
+# db_name -> {"conn", "signature", "version", "generation", "last_used", "borrowed", "retired"}
+db_handles: Dict[str, Dict[str, Any]] = {}
+handles_lock = threading.Lock()
+# Notified whenever a borrowed cursor is released
+handles_released = threading.Condition(handles_lock)
+generations = 0
+
+# Per-thread cursors: db_name -> (generation, cursor)
+thread_cursors = threading.local()
+
+
+def db_path(db_name: str) -> str:
+    """Path of the DuckDB file for a database name."""
+    return f"{db_name}.duckdb"
+
+
+def file_signature(path: str) -> tuple:
+    """Identifies a database file version; changes when the file is rebuilt or replaced."""
+    stat = os.stat(path)
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def close_handle(handle: Dict[str, Any]):
+    """
+    Retire a shared connection and close it once none of its cursors is borrowed (closing
+    it closes them too). Callers hold handles_lock.
+    """
+    handle["retired"] = True
+    if handle["borrowed"]:
+        return
+    try:
+        handle["conn"].close()
+    except duckdb.Error:
+        pass
+
+
+def evict_idle(now: float = None):
+    """Close shared connections that have not been used for IDLE_TIMEOUT seconds."""
+    now = now or time.monotonic()
+    with handles_lock:
+        for db_name in [name for name, handle in db_handles.items() if not handle["borrowed"] and now - handle["last_used"] > IDLE_TIMEOUT]:
+            close_handle(db_handles.pop(db_name))
+
+
+def invalidate(db_name: str = None):
+    """
+    Retire the cached connection for a database (or all databases), e.g. after it was
+    re-indexed. Queries still running on it finish before it is closed; threads pick up
+    a fresh cursor on their next call.
+    """
+    with handles_lock:
+        names = [db_name] if db_name else list(db_handles)
+        for name in names:
+            if name in db_handles:
+                close_handle(db_handles[name])
+
+
+def read_version(conn: duckdb.DuckDBPyConnection, signature: tuple):
+    """
+    Ingestion version of an open database, recorded by index_json in prompt_context.
+    Databases without it are identified by their file signature instead.
+    """
+    try:
+        row = conn.execute("SELECT ingestion_version FROM prompt_context").fetchone()
+    except duckdb.Error:
+        row = None
+    return row[0] if row else signature
+
+
+def get_handle(db_name: str, borrow: bool = False) -> Dict[str, Any]:
+    """
+    Return the shared read-only connection entry for a database, reopening it when the
+    file on disk was rebuilt since it was opened or it was invalidated. With borrow, the
+    caller must release it (see borrow_cursor).
+
+    DuckDB hands out the already open database for a path as long as any connection to
+    it is open, so reopening waits until the cursors of the old connection are released.
+    Threads must not call this while they have a cursor of the same database borrowed.
+    """
+    global generations
+    path = db_path(db_name)
+    signature = file_signature(path)
+    now = time.monotonic()
+
+    evict_idle(now)
+    with handles_lock:
+        handle = db_handles.get(db_name)
+        if handle is None or handle["retired"] or handle["signature"] != signature:
+            if handle is not None:
+                close_handle(handle)
+                handles_released.wait_for(lambda: not handle["borrowed"])
+            generations += 1
+            conn = duckdb.connect(path, read_only=True)
+            handle = {
+                "conn": conn,
+                "signature": signature,
+                "version": read_version(conn, signature),
+                "generation": generations,
+                "last_used": now,
+                "borrowed": 0,
+                "retired": False,
+            }
+            db_handles[db_name] = handle
+        handle["last_used"] = now
+        if borrow:
+            handle["borrowed"] += 1
+        return handle
+
+
+def get_version(db_name: str):
+    """Ingestion version of the database file currently on disk."""
+    return get_handle(db_name)["version"]
+
+
+@contextmanager
+def borrow_cursor(db_name: str) -> Iterator[duckdb.DuckDBPyConnection]:
+    """
+    Lend the calling thread its read-only cursor for a database for the duration of a
+    with block.
+
+    Cursors are created from the shared connection and reused across calls on the same
+    thread until the connection is invalidated, evicted or the file is rebuilt. A
+    connection is not closed while any of its cursors is borrowed.
+    """
+    handle = get_handle(db_name, borrow=True)
+    try:
+        yield thread_cursor(db_name, handle)
+    finally:
+        with handles_lock:
+            handle["borrowed"] -= 1
+            handle["last_used"] = time.monotonic()
+            if handle["retired"]:
+                close_handle(handle)
+            handles_released.notify_all()
+
+
+def thread_cursor(db_name: str, handle: Dict[str, Any]) -> duckdb.DuckDBPyConnection:
+    """The calling thread's cursor of a borrowed handle, replacing one of an older connection."""
+    cursors = getattr(thread_cursors, "cursors", None)
+    if cursors is None:
+        cursors = thread_cursors.cursors = {}
+
+    cached = cursors.get(db_name)
+    if cached is not None and cached[0] == handle["generation"]:
+        return cached[1]
+
+    if cached is not None:
+        try:
+            cached[1].close()
+        except duckdb.Error:
+            pass
+    cursor = handle["conn"].cursor()
+    cursors[db_name] = (handle["generation"], cursor)
+    return cursor
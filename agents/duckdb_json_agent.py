@@ -3,79 +3,173 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import json
-import orjson
-from pandas import json_normalize
+import threading
 import duckdb
 from langchain_openai import ChatOpenAI
 from langgraph.prebuilt import create_react_agent
 from langchain_core.tools import tool
-from typing import Annotated, Dict
+from typing import Annotated, Any, Dict, List, Optional
 from pathlib import Path
 
+from agents import query_cache
+from agents.json_loader import JSON_BACKEND, NESTED_FIELDS_HINTS, load_sections
+
 # Initialize model
 model = ChatOpenAI(model="gpt-4o")
 
+# Store sections as tables in /tmp/duckdb_dbs/{db}.db, so Python objects are released after
+# loading and unchanged files are not reloaded on restart. When off, databases are in memory
+# and the pandas backend keeps its json_normalize DataFrames registered.
+PERSIST_SECTIONS = os.getenv("PERSIST_SECTIONS", "true").lower() == "true"
+# Optional DuckDB memory limit per database (e.g. "256MB"); persisted tables are paged from disk
+JSON_DB_MEMORY_LIMIT = os.getenv("JSON_DB_MEMORY_LIMIT")
+DB_DIR = Path('/tmp/duckdb_dbs')
+
 # Global storage
-db_connections: Dict[str, duckdb.DuckDBPyConnection] = {}
-initialized_data: Dict[str, Dict] = {}  # Store loaded JSON data
+db_connections: Dict[str, duckdb.DuckDBPyConnection] = {}  # Databases that finished loading
 db_tables: Dict[str, list] = {}  # Store table names for each database
+db_versions: Dict[str, tuple] = {}  # Source file version each database was loaded from
+json_agents: Dict[str, Any] = {}  # Agents built so far, per database
 
-def initialize_databases():
-    """Initialize databases for all JSON files in the data directory."""
-    data_dir = Path("data")
+# Databases and agents are created on first use; each database has its own lock
+init_lock = threading.Lock()
+db_locks: Dict[str, threading.Lock] = {}
+
+def read_json_source(conn: duckdb.DuckDBPyConnection) -> Optional[tuple]:
+    """Source file version and tables recorded in a persisted database, if any."""
+    try:
+        return conn.execute("SELECT source_path, size, mtime_ns, tables FROM json_source").fetchone()
+    except duckdb.Error:
+        return None
+
+def write_json_source(conn: duckdb.DuckDBPyConnection, json_file: Path, stat: os.stat_result, tables: List[str]):
+    """Record which source file version the persisted tables were loaded from."""
+    conn.execute("CREATE OR REPLACE TABLE json_source (source_path VARCHAR, size BIGINT, mtime_ns BIGINT, tables VARCHAR[])")
+    conn.execute("INSERT INTO json_source VALUES (?, ?, ?, ?)", [str(json_file.resolve()), stat.st_size, stat.st_mtime_ns, tables])
+    conn.execute("CHECKPOINT")
+
+def find_json_files(data_dir: str = "data") -> Dict[str, Path]:
+    """Map database names (file names without extension) to the JSON files in the data directory."""
+    data_dir = Path(data_dir)
     if not data_dir.exists():
         raise Exception("Data directory not found")
-    
-    for json_file in data_dir.glob("*.json"):
-        db_name = json_file.stem  # Use filename without extension as db name
+    return {json_file.stem: json_file for json_file in sorted(data_dir.glob("*.json"))}
+
+def load_database(db_name: str, json_file: Path) -> duckdb.DuckDBPyConnection:
+    """Open the database for a JSON file and load its sections, reusing unchanged persisted tables."""
+    # Create database connection with unique file per database
+    if PERSIST_SECTIONS:
+        DB_DIR.mkdir(parents=True, exist_ok=True)
+        conn = duckdb.connect(str(DB_DIR / f'{db_name}.db'), read_only=False)
+    else:
+        conn = duckdb.connect()
+    try:
+        if JSON_DB_MEMORY_LIMIT:
+            conn.execute(f"SET memory_limit = '{JSON_DB_MEMORY_LIMIT}'")
         
-        # Skip if already initialized
-        if db_name in db_connections:
-            continue
-            
-        try:
-            # Create database connection with unique file per database
-            db_dir = Path('/tmp/duckdb_dbs')
-            db_dir.mkdir(parents=True, exist_ok=True)
-            db_path = db_dir / f'{db_name}.db'
-            conn = duckdb.connect(str(db_path), read_only=False)
+        stat = json_file.stat()
+        db_versions[db_name] = ("json", stat.st_size, stat.st_mtime_ns)
+        
+        # Tables persisted from an unchanged file are used as they are
+        source = read_json_source(conn) if PERSIST_SECTIONS else None
+        if source and source[:3] == (str(json_file.resolve()), stat.st_size, stat.st_mtime_ns):
+            db_tables[db_name] = list(source[3])
+            print(f"Using persisted tables {', '.join(db_tables[db_name])} in database {db_name}")
+            return conn
+        
+        # Load each top-level section as a table, natively by default (see JSON_BACKEND)
+        db_tables[db_name] = load_sections(conn, str(json_file), persist=PERSIST_SECTIONS)
+        for section in db_tables[db_name]:
+            print(f"Initialized table {section} in database {db_name}")
+        if PERSIST_SECTIONS:
+            write_json_source(conn, json_file, stat, db_tables[db_name])
+        
+        print(f"Successfully initialized database: {db_name}")
+        return conn
+    except Exception:
+        conn.close()
+        raise
+
+def database_lock(db_name: str) -> threading.Lock:
+    """The lock guarding initialization of one database."""
+    with init_lock:
+        return db_locks.setdefault(db_name, threading.Lock())
+
+def ensure_database(db_name: str) -> duckdb.DuckDBPyConnection:
+    """
+    Return the connection for a database, loading it on first use. Concurrent callers
+    wait for a single load; other databases load independently.
+    """
+    conn = db_connections.get(db_name)
+    if conn is not None:
+        return conn
+    
+    with database_lock(db_name):
+        conn = db_connections.get(db_name)
+        if conn is None:
+            json_files = find_json_files()
+            if db_name not in json_files:
+                raise ValueError(f"Database {db_name} not found: no data/{db_name}.json")
+            conn = load_database(db_name, json_files[db_name])
             db_connections[db_name] = conn
-            
-            # Load JSON data
-            with open(json_file, 'rb') as f:
-                data = orjson.loads(f.read())
-            initialized_data[db_name] = data
-            
-            # Initialize tables list for this database
-            db_tables[db_name] = []
-            
-            # Load tables
-            for section, section_data in data.items():
-                if isinstance(section_data, dict):
-                    section_data = [section_data]
-                elif not isinstance(section_data, list):
-                    continue
-                    
-                try:
-                    df = json_normalize(section_data, sep='.')
-                    conn.register(section, df)
-                    db_tables[db_name].append(section)
-                    print(f"Initialized table {section} in database {db_name}")
-                except Exception as e:
-                    print(f"Error processing section {section} in {db_name}: {str(e)}")
-                    continue
-                    
-            print(f"Successfully initialized database: {db_name}")
-            
+        return conn
+
+def initialize_databases():
+    """Initialize databases for all JSON files in the data directory."""
+    warm_up()
+
+def warm_up(db_names: Optional[List[str]] = None, agents: bool = True) -> List[str]:
+    """
+    Preload databases (all JSON files in the data directory by default) and, unless agents
+    is False, build their agents, so the first request doesn't pay for loading.
+    Returns the databases that are ready; failures are reported and skipped.
+    """
+    ready = []
+    for db_name in db_names if db_names is not None else find_json_files():
+        try:
+            if agents:
+                get_agent(db_name)
+            else:
+                ensure_database(db_name)
         except Exception as e:
             print(f"Error initializing database {db_name}: {str(e)}")
             continue
+        ready.append(db_name)
+    return ready
+
+def memory_report(db_name: str = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Per-database memory use: rows per table, memory held by DuckDB and, for persisted
+    databases, the size of the database file.
+    """
+    report = {}
+    for name, conn in db_connections.items():
+        if db_name and name != db_name:
+            continue
+        # Use the connection itself; registered DataFrames are not visible to other cursors
+        memory_bytes = conn.execute("SELECT SUM(memory_usage_bytes) FROM duckdb_memory()").fetchone()[0] or 0
+        db_file = conn.execute("SELECT path FROM duckdb_databases() WHERE database_name = current_database()").fetchone()[0]
+        report[name] = {
+            "tables": {
+                table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                for table in db_tables.get(name, [])
+            },
+            "duckdb_memory_bytes": int(memory_bytes),
+            "file_bytes": os.path.getsize(db_file) if db_file else None,
+        }
+    return report
 
 def get_named_db(db_name: str) -> duckdb.DuckDBPyConnection:
-    """Get an initialized DuckDB connection."""
-    if db_name not in db_connections:
-        raise ValueError(f"Database {db_name} not initialized")
-    return db_connections[db_name]
+    """Get a DuckDB connection, initializing the database on first use."""
+    return ensure_database(db_name)
+
+def run_query(con: duckdb.DuckDBPyConnection, query: str) -> str:
+    """Execute a query and convert the result to its string representation."""
+    result = con.execute(query).df()
+    
+    if len(result) == 0:
+        return "No results found"
+    return result.to_string()
 
 def query_json(query: str, db_name: str) -> str:
     """
@@ -95,13 +189,8 @@ def query_json(query: str, db_name: str) -> str:
         # Get initialized database connection
         con = get_named_db(db_name)
         
-        # Execute query
-        result = con.execute(query).df()
-        
-        # Convert result to string representation
-        if len(result) == 0:
-            return "No results found"
-        return result.to_string()
+        # Repeated queries are answered from the cache until the source file changes
+        return query_cache.cached(db_name, db_versions[db_name], query, lambda: run_query(con, query))
         
     except Exception as e:
         return f"Error querying JSON: {str(e)}"
@@ -117,7 +206,9 @@ def create_query_json_tool(db_name: str):
         Use this tool to query the JSON data file using SQL via DuckDB.
         
         The JSON data is automatically loaded with each top-level section as a separate table.
-        Nested objects and arrays within each section are expanded into columns using dot notation.
+        Each key of a section's objects becomes a column. Nested objects are STRUCT columns
+        whose fields are accessed with dot notation (e.g., job_record.status); with
+        JSON_BACKEND=pandas they are flattened into quoted columns such as "job_record.status".
         Arrays are properly maintained as lists where appropriate.
         
         Available tables in database '{db_name}':
@@ -141,7 +232,7 @@ You have access to a JSON schema and a JSON data file, which you'll use to answe
 
 The data is automatically loaded into separate tables for each top-level section where:
 - Each top-level section (metadata, users, products, transactions, logs, analytics) is a separate table
-- Nested objects are flattened using dot notation (e.g., profile.name)
+- {NESTED_FIELDS_HINTS[JSON_BACKEND]}
 - Arrays are preserved as queryable lists
 - Complex nested structures are maintained in a way that enables sophisticated queries
 
@@ -235,11 +326,20 @@ def get_json_agent(db_name: str = "default"):
         prompt=prompt
     )
 
-# Initialize databases during module import
-initialize_databases()
-
-# Create agents for each database
-json_agents = {db_name: get_json_agent(db_name) for db_name in db_connections}
+def get_agent(db_name: str = "llamacloud"):
+    """Return the JSON agent for a database, loading the database and building the agent once."""
+    agent = json_agents.get(db_name)
+    if agent is not None:
+        return agent
+    
+    ensure_database(db_name)
+    with database_lock(db_name):
+        if db_name not in json_agents:
+            json_agents[db_name] = get_json_agent(db_name)
+        return json_agents[db_name]
 
-# Create default agent for backward compatibility (using llamacloud database)
-large_json_agent = json_agents.get("llamacloud")
+def __getattr__(name: str):
+    # Default agent for backward compatibility (using llamacloud database), built on first access
+    if name == "large_json_agent":
+        return get_agent("llamacloud")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,194 @@
+import os
+from typing import Dict, Iterable, List, Optional
+
+import duckdb
+import orjson
+from pandas import DataFrame, json_normalize
+
+# How top-level JSON sections are turned into tables:
+# "native" - DuckDB's JSON reader materializes each section as a table with STRUCT/LIST columns
+# "pandas" - the file is parsed in Python and each section registered as a json_normalize DataFrame
+JSON_BACKEND = os.getenv("JSON_BACKEND", "native")
+
+# How each backend exposes nested objects, as described to the agents
+NESTED_FIELDS_HINTS = {
+    "native": "Nested objects are STRUCT columns; access their fields with dot notation on the column (e.g., job_record.status)",
+    "pandas": 'Nested objects are flattened into columns named with dot notation, which must be quoted (e.g., "job_record.status")',
+}
+
+# Files with one JSON record per line
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
+
+# A regular JSON file is read as a single document, which DuckDB caps at 4 GB
+MAX_OBJECT_SIZE = 2**32 - 1
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def json_source(path: str) -> str:
+    """DuckDB table function reading a JSON file, with one row per document or NDJSON line."""
+    literal = "'" + path.replace("'", "''") + "'"
+    if path.endswith(NDJSON_SUFFIXES):
+        return f"read_ndjson_auto({literal})"
+    # The whole file is one document, so the object size limit has to cover it
+    size = min(os.path.getsize(path) + 1, MAX_OBJECT_SIZE)
+    return f"read_json({literal}, format = 'auto', maximum_object_size = {size})"
+
+
+def describe_sections(conn: duckdb.DuckDBPyConnection, relation: str) -> Dict[str, str]:
+    """Top-level sections of a JSON document relation and the DuckDB types inferred for them."""
+    rows = conn.execute(f"DESCRIBE SELECT * FROM {relation}").fetchall()
+    return {row[0]: row[1] for row in rows}
+
+
+def section_query(source: str, section: str, column_type: str) -> Optional[str]:
+    """
+    SELECT producing one row per record of a section: arrays of objects become one row
+    per element and a single object one row, with the objects' keys as columns and nested
+    objects kept as STRUCTs. Arrays of scalars become a value column; scalar sections
+    (e.g. total_count) have no table.
+    """
+    column = quote_identifier(section)
+    if column_type.endswith("[]"):
+        if column_type.startswith("STRUCT("):
+            return f"SELECT unnest(item) FROM (SELECT unnest({column}) AS item FROM {source})"
+        return f"SELECT unnest({column}) AS value FROM {source}"
+    if column_type.startswith("STRUCT("):
+        return f"SELECT unnest({column}) FROM {source}"
+    return None
+
+
+def load_sections_native(conn: duckdb.DuckDBPyConnection, path: str, sections: Optional[Iterable[str]], table_names: Dict[str, str]) -> List[str]:
+    """Materialize sections of a JSON file as tables with DuckDB's JSON reader."""
+    # Parse the file once (type inference included) and split the sections out of the staged document
+    conn.execute(f"CREATE OR REPLACE TEMP TABLE json_document AS SELECT * FROM {json_source(path)}")
+    source = "temp.json_document"
+    try:
+        types = describe_sections(conn, source)
+        if sections is None:
+            # Every object or array section
+            queries = {section: section_query(source, section, column_type) for section, column_type in types.items()}
+            queries = {section: query for section, query in queries.items() if query is not None}
+        else:
+            queries = {}
+            for section in sections:
+                if section == "":
+                    # The whole document as one row, one column per top-level key
+                    queries[section] = f"SELECT * FROM {source}"
+                elif section not in types:
+                    raise KeyError(f"Section '{section}' not found in JSON data")
+                else:
+                    queries[section] = section_query(source, section, types[section])
+                    if queries[section] is None:
+                        raise ValueError(f"Section '{section}' is a {types[section]} value, not an object or array")
+
+        return load_each(queries, table_names, sections is None,
+                         lambda table, query: conn.execute(f"CREATE OR REPLACE TABLE {quote_identifier(table)} AS {query}"))
+    finally:
+        conn.execute("DROP TABLE temp.json_document")
+
+
+def read_json_file(path: str):
+    # Read JSON with orjson for better performance
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
+
+def select_sections(data: dict, sections: Optional[Iterable[str]]) -> Dict[str, object]:
+    """Pick sections out of a parsed JSON document; every object and array section by default."""
+    if sections is None:
+        return {key: value for key, value in data.items() if isinstance(value, (dict, list))}
+
+    selected = {}
+    for section in sections:
+        if section == "":
+            selected[section] = data
+        elif section not in data:
+            raise KeyError(f"Section '{section}' not found in JSON data")
+        elif not isinstance(data[section], (dict, list)):
+            raise ValueError(f"Section '{section}' is a {type(data[section]).__name__} value, not an object or array")
+        else:
+            selected[section] = data[section]
+    return selected
+
+
+def normalize_section(section_data) -> DataFrame:
+    """Flatten a section into a DataFrame with dot-separated column names."""
+    # Handle both single object and list of objects
+    if isinstance(section_data, dict):
+        section_data = [section_data]
+    return json_normalize(section_data, sep='.')
+
+
+def load_sections_pandas(conn: duckdb.DuckDBPyConnection, path: str, sections: Optional[Iterable[str]], table_names: Dict[str, str], persist: bool = False) -> List[str]:
+    """
+    Register sections of a JSON file as json_normalize DataFrames, or with persist, copy
+    them into tables and release the DataFrames and parsed document.
+    """
+    selected = select_sections(read_json_file(path), sections)
+
+    def load(table, section_data):
+        df = normalize_section(section_data)
+        if not persist:
+            conn.register(table, df)
+            return
+        conn.register("json_section", df)
+        try:
+            conn.execute(f"CREATE OR REPLACE TABLE {quote_identifier(table)} AS SELECT * FROM json_section")
+        finally:
+            conn.unregister("json_section")
+
+    return load_each(selected, table_names, sections is None, load)
+
+
+def load_each(sections: Dict[str, object], table_names: Dict[str, str], skip_errors: bool, load) -> List[str]:
+    """
+    Load each section with load(table, section) and return the loaded table names.
+    When loading every section of a file, a section that fails is reported and skipped.
+    """
+    loaded = []
+    for section, value in sections.items():
+        table = table_names.get(section, section)
+        try:
+            load(table, value)
+        except Exception as e:
+            if not skip_errors:
+                raise
+            print(f"Error processing section {section}: {str(e)}")
+            continue
+        loaded.append(table)
+    return loaded
+
+
+def load_sections(
+    conn: duckdb.DuckDBPyConnection,
+    path: str,
+    sections: Optional[Iterable[str]] = None,
+    table_names: Optional[Dict[str, str]] = None,
+    backend: str = JSON_BACKEND,
+    persist: bool = False
+) -> List[str]:
+    """
+    Load top-level sections of a JSON file into a DuckDB connection, one table per section.
+
+    Args:
+        conn: Connection to load into
+        path: JSON file (or NDJSON file, whose records are the document rows)
+        sections: Sections to load; every object and array section by default, skipping
+            sections that fail to load. "" loads the whole document as a single row.
+        table_names: Table name per section; defaults to the section name
+        backend: "native" or "pandas"
+        persist: With the pandas backend, store sections as tables instead of keeping the
+            DataFrames registered (native sections are always tables)
+
+    Returns:
+        The names of the loaded tables
+    """
+    table_names = table_names or {}
+    if backend == "pandas":
+        return load_sections_pandas(conn, path, sections, table_names, persist)
+    if backend == "native":
+        return load_sections_native(conn, path, sections, table_names)
+    raise ValueError(f"Unknown JSON backend: {backend}")
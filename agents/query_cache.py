@@ -0,0 +1,107 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+# Formatted query results kept across agent runs
+QUERY_CACHE_BYTES = int(os.getenv("QUERY_CACHE_BYTES", str(32 * 1024 * 1024)))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "600"))
+
+# Only statements that read data are cached
+CACHEABLE_STATEMENTS = ("select", "with", "from", "describe", "show", "summarize", "values", "table")
+
+# Quoted literals and identifiers are kept verbatim; whitespace elsewhere is collapsed
+SQL_TOKENS = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")|\s+""")
+
+# (db_name, version, normalized sql) -> {"value", "size", "expires_at", "cost_ms"}, least recently used first
+entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+cache_lock = threading.Lock()
+cache_bytes = 0
+stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "saved_ms": 0.0}
+
+
+def normalize_sql(query: str) -> str:
+    """Normalize a query so trivially different spellings share a cache entry."""
+    query = SQL_TOKENS.sub(lambda m: m.group(1) or " ", query.strip())
+    return query.rstrip("; ")
+
+
+def is_cacheable(query: str) -> bool:
+    """Whether a query only reads data, so its result can be reused."""
+    words = query.split(None, 1)
+    return bool(words) and words[0].lower().lstrip("(") in CACHEABLE_STATEMENTS
+
+
+def remove_entry(key: tuple):
+    """Drop an entry; callers hold cache_lock."""
+    global cache_bytes
+    cache_bytes -= entries.pop(key)["size"]
+
+
+def get(db_name: str, version: Hashable, query: str):
+    """Return the cached result for a query, or None when it is missing or expired."""
+    key = (db_name, version, normalize_sql(query))
+    with cache_lock:
+        entry = entries.get(key)
+        if entry is not None and entry["expires_at"] < time.monotonic():
+            remove_entry(key)
+            entry = None
+        if entry is None:
+            stats["misses"] += 1
+            return None
+        entries.move_to_end(key)
+        stats["hits"] += 1
+        stats["saved_ms"] += entry["cost_ms"]
+        return entry["value"]
+
+
+def put(db_name: str, version: Hashable, query: str, value: str, cost_ms: float = 0.0):
+    """Cache a formatted result, evicting least recently used entries beyond the byte budget."""
+    global cache_bytes
+    size = len(value)
+    if size > QUERY_CACHE_BYTES:
+        return
+    key = (db_name, version, normalize_sql(query))
+    with cache_lock:
+        if key in entries:
+            remove_entry(key)
+        entries[key] = {"value": value, "size": size, "expires_at": time.monotonic() + QUERY_CACHE_TTL, "cost_ms": cost_ms}
+        cache_bytes += size
+        while cache_bytes > QUERY_CACHE_BYTES:
+            remove_entry(next(iter(entries)))
+            stats["evictions"] += 1
+
+
+def cached(db_name: str, version: Hashable, query: str, compute: Callable[[], str]) -> str:
+    """Return the cached result for a query, computing and caching it on a miss."""
+    if not is_cacheable(query):
+        return compute()
+    value = get(db_name, version, query)
+    if value is None:
+        start = time.perf_counter()
+        value = compute()
+        put(db_name, version, query, value, (time.perf_counter() - start) * 1000)
+    return value
+
+
+def invalidate(db_name: str = None):
+    """Forget cached results for a database (or all databases), e.g. after it was re-indexed."""
+    with cache_lock:
+        for key in [key for key in entries if db_name is None or key[0] == db_name]:
+            remove_entry(key)
+            stats["invalidations"] += 1
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters, the database time saved by hits and the current size."""
+    with cache_lock:
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            **stats,
+            "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+            "entries": len(entries),
+            "bytes": cache_bytes,
+            "max_bytes": QUERY_CACHE_BYTES,
+        }
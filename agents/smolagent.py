@@ -13,7 +13,7 @@ from smolagents import (
     LiteLLMModel
 )
 
-from agents.tools import query_duckdb, semantic_search, get_hierarchical_data_info
+from agents.tools import query_duckdb, semantic_search, hybrid_search, get_hierarchical_data_info
 
 # configure the Phoenix tracer
 #tracer_provider = register(
@@ -34,27 +34,45 @@ llm = LiteLLMModel(
 
 
 # Tool Calling Agents
-sql_query_agent = ToolCallingAgent(
-    tools=[query_duckdb, get_hierarchical_data_info],
-    model=llm,
-    max_steps=10,
-    name="sql_query_agent",
-    description="This agent is used for structured queries on the DuckDB database and analyzing hierarchical data structures."
-)
+def create_sql_query_agent(step_callbacks=None):
+    """Build a SQL query agent with its own memory."""
+    return ToolCallingAgent(
+        tools=[query_duckdb, hybrid_search, get_hierarchical_data_info],
+        model=llm,
+        max_steps=10,
+        step_callbacks=step_callbacks,
+        name="sql_query_agent",
+        description="This agent is used for structured queries on the DuckDB database and analyzing hierarchical data structures."
+    )
 
-semantic_search_agent = ToolCallingAgent(
-    tools=[semantic_search],
-    model=llm,
-    max_steps=10,
-    name="semantic_search_agent",
-    description="This agent is used for semantic search on the Qdrant collection."
-)
+def create_semantic_search_agent():
+    """Build a semantic search agent with its own memory."""
+    return ToolCallingAgent(
+        tools=[semantic_search],
+        model=llm,
+        max_steps=10,
+        name="semantic_search_agent",
+        description="This agent is used for semantic search over the embedded records of a database."
+    )
 
 
 # Manager CodeAgent
-task_agent = CodeAgent(
-    tools=[],
-    model=llm,
-    managed_agents=[sql_query_agent],
-    additional_authorized_imports=["time", "numpy", "pandas"]
-)
+def create_task_agent(step_callbacks=None):
+    """
+    Build a task agent together with its managed agents. Agents keep their run memory
+    on the instance, so concurrent requests must each use their own.
+    step_callbacks (smolagents format) are registered on the manager and managed agents,
+    so callers also see the managed agents' tool calls as they happen.
+    """
+    return CodeAgent(
+        tools=[],
+        model=llm,
+        managed_agents=[create_sql_query_agent(step_callbacks)],
+        step_callbacks=step_callbacks,
+        additional_authorized_imports=["time", "numpy", "pandas"]
+    )
+
+
+sql_query_agent = create_sql_query_agent()
+semantic_search_agent = create_semantic_search_agent()
+task_agent = create_task_agent()
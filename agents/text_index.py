@@ -0,0 +1,214 @@
+from typing import Any, Dict, List, Optional
+
+import duckdb
+
+# Terms are lowercased runs of letters and digits; the same expression tokenizes values and queries
+TOKEN_PATTERN = r"[\pL\pN]+"
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def text_leaf_query(conn: duckdb.DuckDBPyConnection, changed: Optional[str] = None) -> str:
+    """
+    SQL selecting (table_name, record_id, column_name, value) for every non-null VARCHAR value
+    of the indexed tables, or only of the records in the changed temp table of (table_name, record_id).
+    """
+    columns = conn.execute("""
+        SELECT c.table_name, c.column_name
+        FROM information_schema.columns c
+        JOIN schema_info s ON s.table_name = c.table_name
+        WHERE s.flattened_from IS NULL AND c.data_type = 'VARCHAR' AND c.column_name NOT IN ('record_id', 'parent_id')
+        ORDER BY c.table_name, c.ordinal_position
+    """).fetchall()
+
+    selects = []
+    for table, column in columns:
+        select = (
+            f"""SELECT '{table.replace("'", "''")}' AS table_name, record_id::VARCHAR AS record_id, """
+            f"""'{column.replace("'", "''")}' AS column_name, "{column.replace('"', '""')}" AS value """
+            f"""FROM "{table.replace('"', '""')}" WHERE "{column.replace('"', '""')}" IS NOT NULL"""
+        )
+        if changed is not None:
+            select += f""" AND record_id IN (SELECT record_id FROM {changed} WHERE table_name = '{table.replace("'", "''")}')"""
+        selects.append(select)
+    return " UNION ALL ".join(selects or [
+        "SELECT NULL::VARCHAR AS table_name, NULL::VARCHAR AS record_id, NULL::VARCHAR AS column_name, NULL::VARCHAR AS value WHERE false"
+    ])
+
+
+def create_text_index(conn: duckdb.DuckDBPyConnection):
+    """
+    Build a BM25 index over the string leaves of an indexed document, stored in the database:
+    text_leaves has one row per non-null VARCHAR value (table, record, column), text_postings
+    the term frequencies per leaf sorted by term, and text_index_stats the collection stats.
+    This is the layout of DuckDB's FTS extension, which is not available offline.
+    """
+    conn.execute(f"""
+        CREATE OR REPLACE TABLE text_leaves AS
+        SELECT row_number() OVER () AS leaf_id, *, len(regexp_extract_all(lower(value), '{TOKEN_PATTERN}')) AS length
+        FROM ({text_leaf_query(conn)})
+    """)
+    conn.execute(f"""
+        CREATE OR REPLACE TABLE text_postings AS
+        SELECT term, leaf_id, COUNT(*)::INTEGER AS tf
+        FROM (SELECT leaf_id, unnest(regexp_extract_all(lower(value), '{TOKEN_PATTERN}')) AS term FROM text_leaves)
+        GROUP BY term, leaf_id
+        ORDER BY term
+    """)
+    update_text_index_stats(conn)
+
+
+def remove_text_leaves(conn: duckdb.DuckDBPyConnection, removed: str):
+    """
+    Drop the leaves and postings of the records in the removed temp table of (table_name, record_id),
+    e.g. items replaced by a newer version of the document.
+    """
+    conn.execute(f"""
+        DELETE FROM text_postings WHERE leaf_id IN (
+            SELECT l.leaf_id FROM text_leaves l
+            JOIN {removed} r ON l.table_name = r.table_name AND l.record_id = r.record_id::VARCHAR
+        )
+    """)
+    conn.execute(f"DELETE FROM text_leaves l USING {removed} r WHERE l.table_name = r.table_name AND l.record_id = r.record_id::VARCHAR")
+    update_text_index_stats(conn)
+
+
+def add_text_leaves(conn: duckdb.DuckDBPyConnection, added: str):
+    """
+    Index the string leaves of the records in the added temp table of (table_name, record_id),
+    e.g. items appended to the document. New postings are appended after the sorted ones.
+    """
+    last_leaf_id = conn.execute("SELECT COALESCE(MAX(leaf_id), 0) FROM text_leaves").fetchone()[0]
+    conn.execute(f"""
+        INSERT INTO text_leaves
+        SELECT {last_leaf_id} + row_number() OVER () AS leaf_id, *, len(regexp_extract_all(lower(value), '{TOKEN_PATTERN}')) AS length
+        FROM ({text_leaf_query(conn, added)})
+    """)
+    conn.execute(f"""
+        INSERT INTO text_postings
+        SELECT term, leaf_id, COUNT(*)::INTEGER AS tf
+        FROM (SELECT leaf_id, unnest(regexp_extract_all(lower(value), '{TOKEN_PATTERN}')) AS term FROM text_leaves WHERE leaf_id > {last_leaf_id})
+        GROUP BY term, leaf_id
+        ORDER BY term
+    """)
+    update_text_index_stats(conn)
+
+
+def update_text_index_stats(conn: duckdb.DuckDBPyConnection):
+    """Recompute the collection stats BM25 scores against."""
+    conn.execute("""
+        CREATE OR REPLACE TABLE text_index_stats AS
+        SELECT COUNT(*) AS leaves, COALESCE(AVG(length), 0) AS avg_length FROM text_leaves
+    """)
+
+
+def search_leaves(conn: duckdb.DuckDBPyConnection, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Rank string leaves against a query with BM25.
+
+    Returns:
+        Leaves best first, each {"table_name", "record_id", "column_name", "value", "score"}
+    """
+    rows = conn.execute(f"""
+        WITH query_terms AS (
+            SELECT DISTINCT unnest(regexp_extract_all(lower(?), '{TOKEN_PATTERN}')) AS term
+        ),
+        term_stats AS (
+            SELECT p.term, COUNT(*) AS df
+            FROM text_postings p JOIN query_terms q ON p.term = q.term
+            GROUP BY p.term
+        ),
+        scores AS (
+            SELECT
+                p.leaf_id,
+                SUM(
+                    ln(1 + (s.leaves - t.df + 0.5) / (t.df + 0.5))
+                    * p.tf * ({BM25_K1} + 1)
+                    / (p.tf + {BM25_K1} * (1 - {BM25_B} + {BM25_B} * l.length / s.avg_length))
+                ) AS score
+            FROM text_postings p
+            JOIN term_stats t ON p.term = t.term
+            JOIN text_leaves l ON l.leaf_id = p.leaf_id
+            CROSS JOIN text_index_stats s
+            GROUP BY p.leaf_id
+        )
+        SELECT l.table_name, l.record_id, l.column_name, l.value, sc.score
+        FROM scores sc JOIN text_leaves l ON l.leaf_id = sc.leaf_id
+        ORDER BY sc.score DESC, sc.leaf_id
+        LIMIT ?
+    """, [query, limit]).fetchall()
+    return [
+        {"table_name": row[0], "record_id": row[1], "column_name": row[2], "value": row[3], "score": row[4]}
+        for row in rows
+    ]
+
+
+def resolve_records(conn: duckdb.DuckDBPyConnection, leaves: List[Dict[str, Any]]):
+    """
+    Add the JSON path of each leaf and the top-level record it belongs to ("json_path",
+    "root_table", "root_record_id", "root_path"), following record_relationships up to the root.
+    """
+    if not leaves:
+        return
+    chains = conn.execute("""
+        WITH RECURSIVE hits AS (
+            SELECT unnest(?) AS hit, unnest(?) AS table_name, unnest(?) AS record_id
+        ),
+        chain(hit, depth, table_name, record_id, relationship_type) AS (
+            SELECT hit, 0, table_name, record_id, NULL::VARCHAR FROM hits
+            UNION ALL
+            SELECT c.hit, c.depth + 1, r.parent_table::VARCHAR, r.parent_id::VARCHAR, r.relationship_type
+            FROM chain c
+            JOIN record_relationships r ON r.child_table::VARCHAR = c.table_name AND r.child_id::VARCHAR = c.record_id
+        )
+        SELECT hit, table_name, record_id, relationship_type FROM chain ORDER BY hit, depth
+    """, [
+        list(range(len(leaves))),
+        [leaf["table_name"] for leaf in leaves],
+        [str(leaf["record_id"]) for leaf in leaves],
+    ]).fetchall()
+    root_arrays = {row[0] for row in conn.execute("SELECT table_name FROM schema_info WHERE parent_table IS NULL AND is_array").fetchall()}
+
+    steps = {}
+    for hit, table_name, record_id, relationship_type in chains:
+        steps.setdefault(hit, []).append((table_name, record_id, relationship_type))
+
+    # Databases indexed with natural keys can be appended to, so they record item positions
+    item_keys = conn.execute("SELECT 1 FROM duckdb_tables() WHERE schema_name = 'main' AND table_name = 'item_keys'").fetchone() is not None
+    positions = {}
+    if item_keys:
+        roots = [steps[hit][-1] for hit in steps]
+        positions = {
+            (table_name, record_id): position
+            for table_name, record_id, position in conn.execute("""
+                SELECT k.table_name::VARCHAR, k.record_id::VARCHAR, k.position
+                FROM item_keys k
+                JOIN (SELECT unnest(?) AS table_name, unnest(?) AS record_id) r
+                  ON k.table_name::VARCHAR = r.table_name AND k.record_id::VARCHAR = r.record_id
+            """, [[root[0] for root in roots], [root[1] for root in roots]]).fetchall()
+        }
+
+    for hit, leaf in enumerate(leaves):
+        chain = steps[hit]
+        root_table, root_id, _ = chain[-1]
+        path = root_table
+        if root_table in root_arrays:
+            if item_keys:
+                position = positions.get((root_table, root_id))
+            else:
+                # Never appended to, so sequential ids follow document order
+                position = int(root_id) - 1 if root_id.isdigit() else None
+            # Items missing from an appended file have no position
+            path += f"[{position}]" if position is not None else f"[record_id={root_id}]"
+        leaf["root_path"] = path
+        # Walk back down: each child table is named <parent table>_<key>
+        for depth in range(len(chain) - 2, -1, -1):
+            child_table, parent_table, relationship_type = chain[depth][0], chain[depth + 1][0], chain[depth + 1][2]
+            path += "." + child_table[len(parent_table) + 1:]
+            if relationship_type.startswith("array_item"):
+                path += relationship_type[len("array_item"):]
+        leaf["json_path"] = f"{path}.{leaf['column_name']}"
+        leaf["root_table"] = root_table
+        leaf["root_record_id"] = root_id
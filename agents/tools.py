@@ -1,13 +1,98 @@
-from smolagents import tool, Tool
+from smolagents import tool
 from qdrant_client import QdrantClient
 from langchain_openai import OpenAIEmbeddings
 import duckdb
-import json
+import os
 
-# Initialize Qdrant client and embedder
-#qdrant_client = QdrantClient(url="http://localhost:6333")  # Using in-memory storage
+from agents.connections import borrow_cursor, get_version
+from agents import query_cache, text_index, vector_index
+
+# Initialize embedder; the Qdrant client is only created with VECTOR_BACKEND=qdrant
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+qdrant_client = QdrantClient(url=QDRANT_URL) if vector_index.VECTOR_BACKEND == "qdrant" else None
 embedder = OpenAIEmbeddings(model="text-embedding-3-small")
 
+# Limits on what query_duckdb returns to the agent
+QUERY_MAX_ROWS = int(os.getenv("QUERY_MAX_ROWS", "100"))
+QUERY_MAX_BYTES = int(os.getenv("QUERY_MAX_BYTES", "16384"))
+QUERY_MAX_CELL_WIDTH = int(os.getenv("QUERY_MAX_CELL_WIDTH", "200"))
+
+# Hybrid search: candidates taken from each ranking per requested result, the reciprocal
+# rank fusion constant and the matching values listed per record
+HYBRID_CANDIDATES_PER_RESULT = 4
+RRF_K = 60
+HYBRID_MATCHES_PER_RESULT = 3
+
+
+def format_cell(value, width: int = QUERY_MAX_CELL_WIDTH) -> str:
+    """Render a value as a single-line table cell of at most width characters."""
+    text = str(value).replace("\n", " ").replace("|", "\\|")
+    if len(text) > width:
+        text = text[:width - 3] + "..."
+    return text
+
+
+def format_table(columns: list, rows: list, max_bytes: int = QUERY_MAX_BYTES) -> tuple:
+    """
+    Format rows as a markdown table, stopping before the output exceeds max_bytes.
+    Returns the table and the number of rows it contains.
+    """
+    lines = [
+        "| " + " | ".join(columns) + " |",
+        "|" + "|".join(["-"*len(col) for col in columns]) + "|",
+    ]
+    size = sum(len(line) + 1 for line in lines)
+    
+    shown = 0
+    for row in rows:
+        line = "| " + " | ".join(format_cell(val) for val in row) + " |"
+        size += len(line) + 1
+        # Always show at least one row, however wide
+        if size > max_bytes and shown:
+            break
+        lines.append(line)
+        shown += 1
+    
+    return "\n".join(lines) + "\n", shown
+
+
+def count_rows(cursor, query: str) -> int:
+    """
+    Total number of rows a query returns, used when its output was truncated.
+    Counting over the query as a subquery lets DuckDB skip producing the columns;
+    statements that can't be wrapped are counted by draining the open result.
+    """
+    try:
+        return cursor.execute(f"SELECT COUNT(*) FROM ({query.strip().rstrip(';')})").fetchone()[0]
+    except duckdb.Error:
+        cursor.execute(query)
+        total = 0
+        while batch := cursor.fetchmany(10000):
+            total += len(batch)
+        return total
+
+
+def run_query(db_name: str, query: str) -> str:
+    """Execute a query and format its (bounded) result for query_duckdb."""
+    # Reuse this thread's read-only cursor instead of opening the database per call
+    with borrow_cursor(db_name) as cursor:
+        cursor.execute(query)
+        # Fetch one row past the limit to find out whether the result was cut off
+        result = cursor.fetchmany(QUERY_MAX_ROWS + 1)
+        
+        if not result:
+            return "No results found"
+        
+        columns = [desc[0] for desc in cursor.description]
+        table, shown = format_table(columns, result[:QUERY_MAX_ROWS], QUERY_MAX_BYTES)
+        
+        if len(result) > shown:
+            # Only count when rows were left unfetched; otherwise everything is in hand
+            total = len(result) if len(result) <= QUERY_MAX_ROWS else count_rows(cursor, query)
+            table += f"\n(truncated, {total - shown} more rows; {total} rows in total. Add filters, aggregates or a LIMIT to see specific rows.)\n"
+        
+    return table
+
 
 @tool
 def query_duckdb(db_name: str, query: str) -> str:
@@ -20,30 +105,12 @@ def query_duckdb(db_name: str, query: str) -> str:
         
     Returns:
         str: A formatted string containing the query results in a tabular format,
-             or "No results found" if the query returns no data
+             or "No results found" if the query returns no data. Large results are
+             truncated and end with a note on how many rows were left out.
     """
-    conn = duckdb.connect(f"{db_name}.duckdb")
-    cursor = conn.execute(query)
-    result = cursor.fetchall()
-    
-    if not result:
-        conn.close()
-        return "No results found"
-    
-    # Get column names from the cursor before closing the connection
-    columns = [desc[0] for desc in cursor.description]
-    
-    # Now we can safely close the connection
-    conn.close()
-    
-    # Format as table
-    table = "| " + " | ".join(columns) + " |\n"
-    table += "|" + "|".join(["-"*len(col) for col in columns]) + "|\n"
-    
-    for row in result:
-        table += "| " + " | ".join(str(val) for val in row) + " |\n"
-        
-    return table
+    # Repeated exploratory queries are answered from the cache until the database is rebuilt
+    return query_cache.cached(db_name, get_version(db_name), query, lambda: run_query(db_name, query))
+
 
 @tool
 def get_hierarchical_data_info(db_name: str = None) -> str:
@@ -59,110 +126,119 @@ def get_hierarchical_data_info(db_name: str = None) -> str:
         str: A formatted string containing detailed information about the hierarchical data structure
     """
     try:
-        conn = duckdb.connect(f"{db_name}.duckdb")
-        
-        # Check if this is a hierarchical database with schema_info
-        try:
-            conn.execute("SELECT * FROM schema_info LIMIT 1")
-        except:
-            conn.close()
-            return f"Error: {db_name} does not appear to be a hierarchical database with schema_info table."
-        
-        output = []
-        
-        # Query 1: Get an overview of the data structure
-        output.append("=== Data Overview ===")
-        try:
-            result = conn.execute("SELECT * FROM data_overview").fetchall()
+        with borrow_cursor(db_name) as conn:
+            
+            # Check if this is a hierarchical database with schema_info
+            try:
+                conn.execute("SELECT * FROM schema_info LIMIT 1")
+            except:
+                return f"Error: {db_name} does not appear to be a hierarchical database with schema_info table."
+            
+            output = []
+            
+            # Query 1: Get an overview of the data structure
+            output.append("=== Data Overview ===")
+            try:
+                result = conn.execute("SELECT * FROM data_overview").fetchall()
+                for row in result:
+                    for col in row:
+                        output.append(str(col))
+            except:
+                output.append("No data overview available.")
+            
+            # Query 2: Show the table hierarchy
+            output.append("\n=== Table Hierarchy ===")
+            result = conn.execute("SELECT level, path, table_name, is_array, count FROM table_hierarchy ORDER BY path").fetchall()
+            output.append("Level | Path | Table Name | Is Array | Count")
+            output.append("-" * 70)
             for row in result:
-                for col in row:
-                    output.append(str(col))
-        except:
-            output.append("No data overview available.")
-        
-        # Query 2: Show the table hierarchy
-        output.append("\n=== Table Hierarchy ===")
-        result = conn.execute("SELECT level, path, table_name, is_array, count FROM table_hierarchy ORDER BY path").fetchall()
-        output.append("Level | Path | Table Name | Is Array | Count")
-        output.append("-" * 70)
-        for row in result:
-            output.append(f"{row[0]} | {row[1]} | {row[2]} | {row[3]} | {row[4]}")
-        
-        # Query 3: Show table statistics
-        output.append("\n=== Table Statistics ===")
-        result = conn.execute("SELECT table_name, is_array, count AS expected_count, description FROM schema_info ORDER BY table_name").fetchall()
-        output.append("Table Name | Is Array | Expected Count | Description")
-        output.append("-" * 80)
-        for row in result:
-            output.append(f"{row[0]} | {row[1]} | {row[2]} | {row[3]}")
-        
-        # Query 4: Find the root tables (tables with no parent)
-        output.append("\n=== Root Tables ===")
-        root_tables = conn.execute("""
-            SELECT table_name, count, description 
-            FROM schema_info 
-            WHERE parent_table IS NULL
-            ORDER BY table_name
-        """).fetchall()
-        
-        if not root_tables:
-            output.append("No root tables found.")
-        else:
-            output.append("Table Name | Count | Description")
-            output.append("-" * 60)
-            for row in root_tables:
-                output.append(f"{row[0]} | {row[1]} | {row[2]}")
-                
-                # For each root table, show record count comparison
-                try:
-                    table_name = row[0]
-                    raw_count = conn.execute(f"SELECT COUNT(*) FROM \"{table_name}\"").fetchall()
-                    schema_count = row[1]  # Count from schema_info
-                    
-                    output.append(f"\nRecord counts for {table_name}:")
-                    output.append(f"Raw count of records in the {table_name} table: {raw_count[0][0]}")
-                    output.append(f"Expected number according to schema_info: {schema_count}")
-                    if raw_count[0][0] != schema_count:
-                        output.append("The difference is due to the hierarchical structure of the data.")
-                except:
-                    output.append(f"Could not get record count for {table_name}.")
-        
-        # Query 5: Show key relationships between tables
-        output.append("\n=== Table Relationships ===")
-        result = conn.execute("""
-            SELECT 
-                r.parent_table, 
-                r.child_table, 
-                COUNT(*) as relationship_count,
-                s.description
-            FROM record_relationships r
-            JOIN schema_info s ON r.child_table = s.table_name
-            GROUP BY r.parent_table, r.child_table, s.description
-            ORDER BY relationship_count DESC
-            LIMIT 20
-        """).fetchall()
-        
-        if not result:
-            output.append("No relationships found.")
-        else:
-            output.append("Parent Table | Child Table | Relationship Count | Description")
+                output.append(f"{row[0]} | {row[1]} | {row[2]} | {row[3]} | {row[4]}")
+            
+            # Query 3: Show table statistics
+            output.append("\n=== Table Statistics ===")
+            result = conn.execute("SELECT table_name, is_array, count AS expected_count, description FROM schema_info ORDER BY table_name").fetchall()
+            output.append("Table Name | Is Array | Expected Count | Description")
             output.append("-" * 80)
             for row in result:
                 output.append(f"{row[0]} | {row[1]} | {row[2]} | {row[3]}")
-        
-        conn.close()
-        return "\n".join(output)
+            
+            # Query 4: Find the root tables (tables with no parent)
+            output.append("\n=== Root Tables ===")
+            root_tables = conn.execute("""
+                SELECT table_name, count, description 
+                FROM schema_info 
+                WHERE parent_table IS NULL
+                ORDER BY table_name
+            """).fetchall()
+            
+            if not root_tables:
+                output.append("No root tables found.")
+            else:
+                output.append("Table Name | Count | Description")
+                output.append("-" * 60)
+                for row in root_tables:
+                    output.append(f"{row[0]} | {row[1]} | {row[2]}")
+                    
+                    # For each root table, show record count comparison
+                    try:
+                        table_name = row[0]
+                        raw_count = conn.execute(f"SELECT COUNT(*) FROM \"{table_name}\"").fetchall()
+                        schema_count = row[1]  # Count from schema_info
+                        
+                        output.append(f"\nRecord counts for {table_name}:")
+                        output.append(f"Raw count of records in the {table_name} table: {raw_count[0][0]}")
+                        output.append(f"Expected number according to schema_info: {schema_count}")
+                        if raw_count[0][0] != schema_count:
+                            output.append("The difference is due to the hierarchical structure of the data.")
+                    except:
+                        output.append(f"Could not get record count for {table_name}.")
+            
+            # Query 5: Show key relationships between tables
+            output.append("\n=== Table Relationships ===")
+            result = conn.execute("""
+                SELECT 
+                    r.parent_table, 
+                    r.child_table, 
+                    COUNT(*) as relationship_count,
+                    s.description
+                FROM record_relationships r
+                JOIN schema_info s ON r.child_table = s.table_name
+                GROUP BY r.parent_table, r.child_table, s.description
+                ORDER BY relationship_count DESC
+                LIMIT 20
+            """).fetchall()
+            
+            if not result:
+                output.append("No relationships found.")
+            else:
+                output.append("Parent Table | Child Table | Relationship Count | Description")
+                output.append("-" * 80)
+                for row in result:
+                    output.append(f"{row[0]} | {row[1]} | {row[2]} | {row[3]}")
+            
+            return "\n".join(output)
     
     except Exception as e:
         return f"Error analyzing hierarchical data: {str(e)}"
 
+def search_vectors(db_name: str, query_text: str, limit: int) -> list:
+    """Payloads of the embedded records most similar to a query, best first."""
+    embedding = embedder.embed_query(query_text)
+    if qdrant_client is not None:
+        return [res.payload for res in qdrant_client.search(
+            collection_name=db_name,
+            query_vector=embedding,
+            limit=limit
+        )]
+    return [res["payload"] for res in vector_index.search(db_name, embedding, limit)]
+
 @tool
 def semantic_search(db_name: str, query_text: str, top_k: int = 3) -> str:
     """
-    Perform semantic search using Qdrant.
+    Perform semantic search over the embedded records of a database.
     
     Args:
-        db_name: Name of the Qdrant collection to search
+        db_name: Name of the database (and Qdrant collection) to search
         query_text: Text to search for semantically similar matches
         top_k: Number of results to return (default: 3)
         
@@ -170,20 +246,82 @@ def semantic_search(db_name: str, query_text: str, top_k: int = 3) -> str:
         str: A formatted string containing the search results with JSON paths and values,
              or "No results found" if no matches are found
     """
-    embedding = embedder.embed_query(query_text)
-    search_results = qdrant_client.search(
-        collection_name=db_name,
-        query_vector=embedding,
-        limit=top_k
-    )
+    try:
+        payloads = search_vectors(db_name, query_text, top_k)
+    except FileNotFoundError as e:
+        return f"Error: {str(e)}"
     
-    if not search_results:
+    if not payloads:
         return "No results found"
         
     output = "Search Results:\n\n"
-    for i, res in enumerate(search_results, 1):
+    for i, payload in enumerate(payloads, 1):
         output += f"Result {i}:\n"
-        output += f"JSON Path: {res.payload['json_path']}\n"
-        output += f"Value: {res.payload['json_value']}\n\n"
+        output += f"JSON Path: {payload['json_path']}\n"
+        output += f"Value: {payload['json_value']}\n\n"
         
     return output
+
+def reciprocal_rank_fusion(rankings: list, k: int = RRF_K) -> dict:
+    """Fuse rankings (lists of keys, best first) into key -> sum of 1 / (k + rank)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return scores
+
+@tool
+def hybrid_search(db_name: str, query_text: str, top_k: int = 5) -> str:
+    """
+    Find the records matching a question by keywords (BM25 over every string value) and by
+    meaning (vector search over embedded records), fused by reciprocal rank. Use it to find
+    which records and columns mention a name, status, error or phrase instead of guessing
+    LIKE patterns.
+    
+    Args:
+        db_name: Name of the database to search
+        query_text: Keywords or a natural language description of what to find
+        top_k: Number of records to return (default: 5)
+        
+    Returns:
+        str: Matching top-level records with their table, record_id and JSON path, plus the
+             matching string values with their JSON paths and the table/record_id holding them
+    """
+    candidates = max(top_k * HYBRID_CANDIDATES_PER_RESULT, top_k)
+    try:
+        with borrow_cursor(db_name) as conn:
+            leaves = text_index.search_leaves(conn, query_text, candidates)
+            text_index.resolve_records(conn, leaves)
+    except duckdb.Error as e:
+        return f"Error: {db_name} has no text index ({str(e)}); re-index it or use query_duckdb"
+    
+    # Vector search is skipped when the database has no embeddings
+    payloads = []
+    if qdrant_client is not None or os.path.exists(vector_index.index_dir(db_name)):
+        payloads = [p for p in search_vectors(db_name, query_text, candidates) if "record_id" in p]
+    
+    # Fuse at the level of top-level records; a record ranks by its best matching value
+    text_ranking = list(dict.fromkeys((leaf["root_table"], leaf["root_record_id"]) for leaf in leaves))
+    vector_ranking = list(dict.fromkeys((p["table"], str(p["record_id"])) for p in payloads))
+    scores = reciprocal_rank_fusion([text_ranking, vector_ranking])
+    if not scores:
+        return "No results found"
+    
+    paths = {(p["table"], str(p["record_id"])): p["json_path"] for p in payloads}
+    output = "Hybrid Search Results:\n\n"
+    for i, key in enumerate(sorted(scores, key=scores.get, reverse=True)[:top_k], 1):
+        table, record_id = key
+        matches = [leaf for leaf in leaves if (leaf["root_table"], leaf["root_record_id"]) == key]
+        path = paths.get(key) or matches[0]["root_path"]
+        ranks = []
+        if key in text_ranking:
+            ranks.append(f"keyword rank {text_ranking.index(key) + 1}")
+        if key in vector_ranking:
+            ranks.append(f"vector rank {vector_ranking.index(key) + 1}")
+        output += f"Result {i} ({', '.join(ranks)}):\n"
+        output += f"Record: {table} record_id={record_id} (JSON path: {path})\n"
+        for leaf in matches[:HYBRID_MATCHES_PER_RESULT]:
+            output += f"- {leaf['json_path']} = {format_cell(leaf['value'])} ({leaf['table_name']} record_id={leaf['record_id']})\n"
+        output += "\n"
+    
+    return output
@@ -0,0 +1,263 @@
+import json
+import os
+import shutil
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Where embeddings are stored and searched:
+# "local"  - a NumPy index stored next to each .duckdb file (<db_name>.vectors/)
+# "qdrant" - a Qdrant server at QDRANT_URL
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "local")
+
+# Collections with at least this many vectors get an IVF index; smaller ones are searched brute force
+IVF_MIN_VECTORS = int(os.getenv("IVF_MIN_VECTORS", "100000"))
+# Inverted lists probed per query; more lists is slower and closer to the exact result
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+IVF_TRAIN_SAMPLE = 50000
+IVF_ITERATIONS = 10
+
+# Rows scored per matrix product when scanning vectors
+SEARCH_CHUNK_ROWS = 65536
+
+# Loaded indexes: index directory -> {"mtime", "vectors", "ids", "centroids", "offsets", ...}
+loaded_indexes: Dict[str, Dict[str, Any]] = {}
+indexes_lock = threading.Lock()
+
+
+def index_dir(db_name: str) -> str:
+    """Directory holding the vector index of a database."""
+    return f"{db_name}.vectors"
+
+
+def remove_index(db_name: str):
+    """Delete the vector index of a database, e.g. before it is rebuilt."""
+    path = index_dir(db_name)
+    if os.path.islink(path):
+        # An index linked from a Parquet export; the export itself is kept
+        os.remove(path)
+    else:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length so dot products are cosine similarities."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def create_writer(db_name: str) -> Dict[str, Any]:
+    """
+    Start writing a vector index. Vectors and payloads are appended to files in a
+    temporary directory, so memory use does not grow with the collection.
+    """
+    path = index_dir(db_name) + ".tmp"
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    return {
+        "db_name": db_name,
+        "path": path,
+        "vectors": open(os.path.join(path, "vectors.f32"), "wb"),
+        "payloads": open(os.path.join(path, "payloads.jsonl"), "wb"),
+        "payload_offsets": [],
+        "dimensions": None,
+        "count": 0,
+    }
+
+
+def add_points(writer: Dict[str, Any], points: list):
+    """Append Qdrant-style points (objects with .vector and .payload) to an index being written."""
+    if not points:
+        return
+    vectors = normalize(np.asarray([point.vector for point in points], dtype=np.float32))
+    if writer["dimensions"] is None:
+        writer["dimensions"] = vectors.shape[1]
+    elif vectors.shape[1] != writer["dimensions"]:
+        raise ValueError(f"Expected {writer['dimensions']}-dimensional vectors, got {vectors.shape[1]}")
+    writer["vectors"].write(vectors.tobytes())
+    for point in points:
+        writer["payload_offsets"].append(writer["payloads"].tell())
+        writer["payloads"].write(json.dumps(point.payload).encode() + b"\n")
+    writer["count"] += len(points)
+
+
+def train_ivf(vectors: np.ndarray, lists: int, seed: int = 0) -> np.ndarray:
+    """
+    Spherical k-means on a sample of the vectors; returns unit-length centroids, at most
+    one per sampled vector.
+    """
+    rng = np.random.default_rng(seed)
+    sample = vectors[np.sort(rng.choice(len(vectors), min(len(vectors), IVF_TRAIN_SAMPLE), replace=False))]
+    lists = min(lists, len(sample))
+    centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+    for _ in range(IVF_ITERATIONS):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        empty = ~sums.any(axis=1)
+        # Lists that lost all their vectors keep their previous centroid
+        sums[empty] = centroids[empty]
+        centroids = normalize(sums)
+    return centroids
+
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid of every vector, computed chunk by chunk."""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), SEARCH_CHUNK_ROWS):
+        chunk = vectors[start:start + SEARCH_CHUNK_ROWS]
+        assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def finish_writer(writer: Dict[str, Any], ivf_min_vectors: int = IVF_MIN_VECTORS):
+    """
+    Complete an index: store the vectors as vectors.npy (grouped by inverted list when the
+    collection is large enough for IVF) and replace the database's previous index.
+    """
+    writer["vectors"].close()
+    writer["payloads"].close()
+    path, count, dimensions = writer["path"], writer["count"], writer["dimensions"] or 0
+    raw_path = os.path.join(path, "vectors.f32")
+    raw = np.memmap(raw_path, dtype=np.float32, mode="r", shape=(count, dimensions)) if count else np.zeros((0, dimensions), dtype=np.float32)
+
+    meta = {"count": count, "dimensions": dimensions, "lists": 0}
+    if count and count >= ivf_min_vectors:
+        centroids = train_ivf(raw, max(1, int(4 * np.sqrt(count))))
+        lists = len(centroids)
+        assignments = assign_lists(raw, centroids)
+        # Vectors of a list are stored contiguously; ids maps a stored row back to its payload
+        ids = np.argsort(assignments, kind="stable").astype(np.int64)
+        offsets = np.zeros(lists + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignments, minlength=lists))
+        np.save(os.path.join(path, "centroids.npy"), centroids)
+        np.save(os.path.join(path, "list_offsets.npy"), offsets)
+        np.save(os.path.join(path, "ids.npy"), ids)
+        meta["lists"] = lists
+    else:
+        ids = None
+
+    stored = np.lib.format.open_memmap(os.path.join(path, "vectors.npy"), mode="w+", dtype=np.float32, shape=(count, dimensions))
+    for start in range(0, count, SEARCH_CHUNK_ROWS):
+        rows = slice(start, start + SEARCH_CHUNK_ROWS)
+        stored[rows] = raw[ids[rows]] if ids is not None else raw[rows]
+    stored.flush()
+    del stored, raw
+    os.remove(raw_path)
+
+    np.save(os.path.join(path, "payload_offsets.npy"), np.asarray(writer["payload_offsets"], dtype=np.int64))
+    with open(os.path.join(path, "index.json"), "w") as f:
+        json.dump(meta, f)
+
+    target = index_dir(writer["db_name"])
+    shutil.rmtree(target, ignore_errors=True)
+    os.rename(path, target)
+    print(f"Stored {count} vectors in {target}" + (f" with {meta['lists']} IVF lists" if meta["lists"] else ""))
+
+
+def load_index(db_name: str) -> Dict[str, Any]:
+    """Memory-map the vector index of a database, reloading it when it was rebuilt."""
+    path = index_dir(db_name)
+    meta_path = os.path.join(path, "index.json")
+    if not os.path.exists(meta_path):
+        raise FileNotFoundError(f"No vector index for database '{db_name}'")
+    mtime = os.stat(meta_path).st_mtime_ns
+
+    with indexes_lock:
+        index = loaded_indexes.get(path)
+        if index is not None and index["mtime"] == mtime:
+            return index
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+        index = {
+            "mtime": mtime,
+            "meta": meta,
+            "vectors": np.load(os.path.join(path, "vectors.npy"), mmap_mode="r"),
+            "payload_offsets": np.load(os.path.join(path, "payload_offsets.npy")),
+            "payloads_path": os.path.join(path, "payloads.jsonl"),
+            "ids": None,
+            "centroids": None,
+            "list_offsets": None,
+        }
+        if meta["lists"]:
+            index["ids"] = np.load(os.path.join(path, "ids.npy"))
+            index["centroids"] = np.load(os.path.join(path, "centroids.npy"))
+            index["list_offsets"] = np.load(os.path.join(path, "list_offsets.npy"))
+        loaded_indexes[path] = index
+        return index
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k highest scores, best first."""
+    if len(scores) > k:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def search_brute_force(vectors: np.ndarray, query: np.ndarray, k: int):
+    """Exact search: score every vector, one chunk at a time, and keep the best k."""
+    best_rows = np.empty(0, dtype=np.int64)
+    best_scores = np.empty(0, dtype=np.float32)
+    for start in range(0, len(vectors), SEARCH_CHUNK_ROWS):
+        scores = vectors[start:start + SEARCH_CHUNK_ROWS] @ query
+        rows = top_k(scores, k)
+        best_rows = np.concatenate([best_rows, rows + start])
+        best_scores = np.concatenate([best_scores, scores[rows]])
+        keep = top_k(best_scores, k)
+        best_rows, best_scores = best_rows[keep], best_scores[keep]
+    return best_rows, best_scores
+
+
+def search_ivf(index: Dict[str, Any], query: np.ndarray, k: int, nprobe: int):
+    """Approximate search: score only the vectors in the nprobe lists closest to the query."""
+    probed = top_k(index["centroids"] @ query, nprobe)
+    offsets = index["list_offsets"]
+    rows = np.concatenate([np.arange(offsets[i], offsets[i + 1]) for i in probed])
+    # Lists are contiguous, so reading them in row order keeps memory-mapped reads sequential
+    rows.sort()
+    scores = index["vectors"][rows] @ query
+    best = top_k(scores, k)
+    return rows[best], scores[best]
+
+
+def read_payloads(index: Dict[str, Any], payload_ids: List[int]) -> List[dict]:
+    """Read the payloads of the given points from payloads.jsonl."""
+    offsets = index["payload_offsets"]
+    payloads = []
+    with open(index["payloads_path"], "rb") as f:
+        for payload_id in payload_ids:
+            f.seek(offsets[payload_id])
+            payloads.append(json.loads(f.readline()))
+    return payloads
+
+
+def search(db_name: str, query_vector, limit: int = 3, nprobe: Optional[int] = None, exact: bool = False) -> List[Dict[str, Any]]:
+    """
+    Find the stored points most similar (cosine) to a query vector.
+
+    Args:
+        db_name: Database whose index to search
+        query_vector: Embedding of the query
+        limit: Number of results
+        nprobe: IVF lists to probe; IVF_NPROBE by default
+        exact: Scan every vector even when the index has IVF lists
+
+    Returns:
+        Results best first, each {"score", "payload"}
+    """
+    index = load_index(db_name)
+    if not index["meta"]["count"] or limit <= 0:
+        return []
+    query = normalize(np.asarray(query_vector, dtype=np.float32))
+    if index["centroids"] is not None and not exact:
+        rows, scores = search_ivf(index, query, limit, min(nprobe or IVF_NPROBE, index["meta"]["lists"]))
+    else:
+        rows, scores = search_brute_force(index["vectors"], query, limit)
+
+    payload_ids = index["ids"][rows] if index["ids"] is not None else rows
+    payloads = read_payloads(index, payload_ids.tolist())
+    return [{"score": float(score), "payload": payload} for score, payload in zip(scores, payloads, strict=True)]
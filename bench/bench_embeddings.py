@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from bench.bench_streaming_ingest import SOURCE_FILE
+
+
+def write_unique_jobs(path, count):
+    """
+    Writes count jobs copied from data/llamacloud.json, each with its own id so that
+    every record has a different content hash.
+    """
+    with open(SOURCE_FILE, "r") as f:
+        jobs = json.load(f)["jobs"]
+    with open(path, "w") as f:
+        json.dump({"jobs": [{**jobs[i % len(jobs)], "id": f"bench-{i}"} for i in range(count)], "total_count": count}, f)
+
+
+class FakeEmbedder:
+    """ Deterministic local embedder that sleeps like a remote API: a fixed cost per call plus a cost per text. """
+
+    def __init__(self, size, call_ms, text_ms):
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        self.model = "fake"
+        self.embeddings = DeterministicFakeEmbedding(size=size)
+        self.call_ms = call_ms
+        self.text_ms = text_ms
+        self.calls = 0
+        self.texts = 0
+        self.lock = threading.Lock()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def embed_documents(self, texts):
+        with self.lock:
+            self.calls += 1
+            self.texts += len(texts)
+        time.sleep((self.call_ms + self.text_ms * len(texts)) / 1000)
+        return self.embeddings.embed_documents(texts)
+
+
+class RecordingVectorStore:
+    """ Stands in for QdrantClient and counts upsert calls and points. """
+
+    def __init__(self):
+        self.upserts = 0
+        self.points = 0
+
+    def upsert(self, collection_name, points):
+        self.upserts += 1
+        self.points += len(points)
+
+
+def run(label, json_path, db_name, embedder_args, batch_size, concurrency):
+    """ Indexes the file with embeddings and prints embedder/vector store call counts. """
+    from data_prep import index_json_file
+
+    embedder = FakeEmbedder(*embedder_args)
+    store = RecordingVectorStore()
+    start = time.perf_counter()
+    index_json_file(db_name, json_path, "bench", embedder, store, embed_batch_size=batch_size, embed_concurrency=concurrency)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {elapsed:>8.2f} {embedder.calls:>8} {embedder.texts:>8} {store.upserts:>8} {store.points:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-record, batched and cached embedding during indexing.")
+    parser.add_argument("--jobs", type=int, default=2000, help="Number of jobs (embedded records) in the synthetic file")
+    parser.add_argument("--dimensions", type=int, default=256, help="Size of the fake embeddings")
+    parser.add_argument("--call-ms", type=float, default=20, help="Simulated latency per embedder call")
+    parser.add_argument("--text-ms", type=float, default=0.2, help="Simulated latency per embedded text")
+    parser.add_argument("--batch-size", type=int, default=100, help="Texts per embed_documents call")
+    parser.add_argument("--concurrency", type=int, default=4, help="embed_documents calls in flight")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # The cache directory is read when data_prep is imported
+        cache_dir = os.path.join(tmp_dir, "embedding_cache")
+        os.environ["EMBEDDING_CACHE_DIR"] = cache_dir
+        json_path = os.path.join(tmp_dir, "synthetic.json")
+        write_unique_jobs(json_path, args.jobs)
+
+        embedder_args = (args.dimensions, args.call_ms, args.text_ms)
+        print(f"\n{'run':<22} {'seconds':>8} {'calls':>8} {'texts':>8} {'upserts':>8} {'points':>8}")
+        run("one per call", json_path, os.path.join(tmp_dir, "single"), embedder_args, 1, 1)
+        shutil.rmtree(cache_dir)
+        run("batched, cold cache", json_path, os.path.join(tmp_dir, "batched"), embedder_args, args.batch_size, args.concurrency)
+        run("batched, warm cache", json_path, os.path.join(tmp_dir, "cached"), embedder_args, args.batch_size, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from bench.bench_streaming_ingest import write_synthetic_file
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Timed in a fresh interpreter: importing the module, then the first query, which loads one database
+CHILD = """
+import json, time
+start = time.perf_counter()
+from agents import duckdb_json_agent
+imported = time.perf_counter()
+duckdb_json_agent.query_json("SELECT COUNT(*) FROM jobs", "bench_0")
+queried = time.perf_counter()
+print(json.dumps({"import_s": imported - start, "first_query_s": queried - imported}))
+"""
+
+
+def run_child(data_root):
+    """ Runs CHILD with data_root as working directory and returns its timings. """
+    env = {
+        **os.environ,
+        "PYTHONPATH": REPO_DIR,
+        # Load from the JSON files every time instead of reusing persisted tables
+        "PERSIST_SECTIONS": "false",
+        # The model client is constructed at import but never called
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "unused"),
+    }
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=data_root, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that importing duckdb_json_agent is independent of data volume.")
+    parser.add_argument("--files", type=int, default=4, help="Number of JSON files in the data directory")
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[1, 20, 100], help="Size of each JSON file")
+    args = parser.parse_args()
+
+    print(f"{'data MB':>8} {'import s':>10} {'first query s':>14}")
+    for size_mb in args.sizes_mb:
+        with tempfile.TemporaryDirectory() as data_root:
+            data_dir = os.path.join(data_root, "data")
+            os.makedirs(data_dir)
+            # write_synthetic_file reads data/llamacloud.json relative to the working directory
+            cwd = os.getcwd()
+            os.chdir(REPO_DIR)
+            try:
+                first = os.path.join(data_dir, "bench_0.json")
+                write_synthetic_file(first, size_mb)
+                for i in range(1, args.files):
+                    os.link(first, os.path.join(data_dir, f"bench_{i}.json"))
+            finally:
+                os.chdir(cwd)
+
+            timings = run_child(data_root)
+        print(f"{size_mb * args.files:>8} {timings['import_s']:>10.2f} {timings['first_query_s']:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import duckdb
+
+SOURCE_FILE = "data/llamacloud.json"
+NATURAL_KEYS = {"jobs": "job_record.id"}
+
+# Tables compared between the appended and the rebuilt database
+COMPARED_TABLES = ["jobs", "jobs_job_record", "jobs_usage_metrics_feature_usage", "record_relationships", "json_leaves", "text_leaves", "item_keys"]
+
+
+def write_jobs_file(path, size_mb, extra_percent=0.0, changed=0):
+    """
+    Writes a jobs export of roughly size_mb megabytes from the jobs in data/llamacloud.json,
+    each with its own job_record.id, followed by extra_percent more jobs. The first changed
+    jobs get a different status. Returns the number of jobs.
+    """
+    with open(SOURCE_FILE, "r") as f:
+        jobs = [json.dumps(job) for job in json.load(f)["jobs"]]
+    count = int(size_mb * 1024 * 1024 / (sum(map(len, jobs)) / len(jobs)))
+    count += int(count * extra_percent / 100)
+
+    with open(path, "w") as f:
+        f.write('{"jobs": [')
+        for i in range(count):
+            job = json.loads(jobs[i % len(jobs)])
+            job["job_record"]["id"] = f"job-{i}"
+            if i < changed:
+                job["job_record"]["status"] = "RETRIED"
+            f.write(("," if i else "") + json.dumps(job) + "\n")
+        f.write(f'], "total_count": {count}}}')
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare appending a grown jobs export with rebuilding its database.")
+    parser.add_argument("--size-mb", type=int, default=200, help="Size of the initial JSON file")
+    parser.add_argument("--delta-percent", type=float, default=1.0, help="Jobs added to the grown file, in percent")
+    parser.add_argument("--changed", type=int, default=100, help="Existing jobs changed in the grown file")
+    args = parser.parse_args()
+
+    from data_prep import index_json_file, append_json_file
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path = os.path.join(tmp_dir, "jobs.json")
+        appended = os.path.join(tmp_dir, "appended")
+        rebuilt = os.path.join(tmp_dir, "rebuilt")
+
+        count = write_jobs_file(json_path, args.size_mb)
+        start = time.perf_counter()
+        index_json_file(appended, json_path, appended, natural_keys=NATURAL_KEYS)
+        print(f"Indexed {count} jobs in {time.perf_counter() - start:.1f}s")
+
+        grown = write_jobs_file(json_path, args.size_mb, args.delta_percent, args.changed)
+        start = time.perf_counter()
+        append_json_file(appended, json_path, NATURAL_KEYS)
+        append_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index_json_file(rebuilt, json_path, rebuilt, natural_keys=NATURAL_KEYS)
+        rebuild_seconds = time.perf_counter() - start
+
+        a = duckdb.connect(f"{appended}.duckdb", read_only=True)
+        b = duckdb.connect(f"{rebuilt}.duckdb", read_only=True)
+        for table_name in COMPARED_TABLES:
+            rows = [conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0] for conn in (a, b)]
+            if rows[0] != rows[1]:
+                raise AssertionError(f"{table_name}: {rows[0]} rows after appending, {rows[1]} after rebuilding")
+        statuses = [conn.execute("SELECT status, COUNT(*) FROM jobs_job_record GROUP BY ALL ORDER BY ALL").fetchall() for conn in (a, b)]
+        if statuses[0] != statuses[1]:
+            raise AssertionError("The appended and rebuilt databases have different statuses")
+        a.close()
+        b.close()
+
+        print(f"\n{grown - count} new and {args.changed} changed jobs ({grown} in total)")
+        print(f"{'ingestion':<12} {'seconds':>8}")
+        print(f"{'append':<12} {append_seconds:>8.2f}")
+        print(f"{'rebuild':<12} {rebuild_seconds:>8.2f}")
+        print(f"Append cost: {100 * append_seconds / rebuild_seconds:.1f}% of a rebuild")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.bench_streaming_ingest import write_synthetic_file
+
+BACKENDS = ["pandas", "native"]
+
+
+def run_child(backend, json_path, db_path):
+    """ Loads every section with one backend and reports load time and peak RSS as JSON. """
+    import duckdb
+    from agents.json_loader import load_sections
+
+    conn = duckdb.connect(db_path)
+    start = time.perf_counter()
+    tables = load_sections(conn, json_path, backend=backend)
+    rows = sum(conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables)
+    elapsed = time.perf_counter() - start
+    conn.close()
+
+    print(json.dumps({
+        "seconds": elapsed,
+        "rows": rows,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare pandas json_normalize and native DuckDB JSON loading.")
+    parser.add_argument("--size-mb", type=int, default=200, help="Size of the synthetic JSON file")
+    parser.add_argument("--child", nargs=3, metavar=("BACKEND", "JSON_PATH", "DB_PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path = os.path.join(tmp_dir, "synthetic.json")
+        print(f"Writing ~{args.size_mb} MB synthetic file...")
+        count = write_synthetic_file(json_path, args.size_mb)
+        file_mb = os.path.getsize(json_path) / (1024 * 1024)
+        print(f"Wrote {count} jobs ({file_mb:.0f} MB)")
+
+        # Each backend runs in its own process so peak RSS is measured separately
+        results = {}
+        for backend in BACKENDS:
+            output = subprocess.run(
+                [sys.executable, "-m", "bench.bench_json_loading", "--child", backend, json_path, os.path.join(tmp_dir, f"{backend}.db")],
+                check=True, capture_output=True, text=True
+            ).stdout
+            results[backend] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"\n{'backend':<10} {'rows':>10} {'load s':>10} {'MB/s':>8} {'peak RSS MB':>12}")
+    for backend, result in results.items():
+        print(f"{backend:<10} {result['rows']:>10} {result['seconds']:>10.2f} {file_mb / result['seconds']:>8.1f} {result['peak_rss_mb']:>12.0f}")
+
+    pandas, native = results["pandas"], results["native"]
+    print(f"\nnative vs pandas: {pandas['seconds'] / native['seconds']:.1f}x faster, "
+          f"{pandas['peak_rss_mb'] / native['peak_rss_mb']:.1f}x less peak RSS")
+
+
+if __name__ == "__main__":
+    main()
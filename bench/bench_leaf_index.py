@@ -0,0 +1,109 @@
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import duckdb
+
+from bench.bench_streaming_ingest import write_synthetic_file
+
+PDF_PAGES = "jobs[].usage_metrics.feature_usage.pdf-pages"
+
+# (label, json_leaves query, equivalent join query through record_relationships); both return top-level record ids
+QUERIES = [
+    (
+        "pdf-pages > 30",
+        f"SELECT root_id FROM json_leaves WHERE path = '{PDF_PAGES}' AND num_value > 30",
+        """
+        SELECT j.record_id FROM jobs j
+        JOIN record_relationships r1 ON r1.parent_id = j.record_id AND r1.child_table = 'jobs_usage_metrics'
+        JOIN jobs_usage_metrics m ON m.record_id = r1.child_id
+        JOIN record_relationships r2 ON r2.parent_id = m.record_id AND r2.child_table = 'jobs_usage_metrics_feature_usage'
+        JOIN jobs_usage_metrics_feature_usage f ON f.record_id = r2.child_id
+        WHERE f."pdf-pages" > 30
+        """,
+    ),
+    (
+        "pdf-pages = 2",
+        f"SELECT root_id FROM json_leaves WHERE path = '{PDF_PAGES}' AND num_value = 2",
+        """
+        SELECT j.record_id FROM jobs j
+        JOIN record_relationships r1 ON r1.parent_id = j.record_id AND r1.child_table = 'jobs_usage_metrics'
+        JOIN jobs_usage_metrics m ON m.record_id = r1.child_id
+        JOIN record_relationships r2 ON r2.parent_id = m.record_id AND r2.child_table = 'jobs_usage_metrics_feature_usage'
+        JOIN jobs_usage_metrics_feature_usage f ON f.record_id = r2.child_id
+        WHERE f."pdf-pages" = 2
+        """,
+    ),
+    (
+        "status = 'PENDING'",
+        "SELECT root_id FROM json_leaves WHERE path = 'jobs[].job_record.status' AND str_value = 'PENDING'",
+        """
+        SELECT j.record_id FROM jobs j
+        JOIN record_relationships r ON r.parent_id = j.record_id AND r.child_table = 'jobs_job_record'
+        JOIN jobs_job_record jr ON jr.record_id = r.child_id
+        WHERE jr.status = 'PENDING'
+        """,
+    ),
+    (
+        "created_at range",
+        """
+        SELECT root_id FROM json_leaves WHERE path = 'jobs[].job_record.created_at'
+        AND ts_value BETWEEN TIMESTAMP '2025-02-01' AND TIMESTAMP '2025-02-05'
+        """,
+        """
+        SELECT j.record_id FROM jobs j
+        JOIN record_relationships r ON r.parent_id = j.record_id AND r.child_table = 'jobs_job_record'
+        JOIN jobs_job_record jr ON jr.record_id = r.child_id
+        WHERE jr.created_at BETWEEN TIMESTAMP '2025-02-01' AND TIMESTAMP '2025-02-05'
+        """,
+    ),
+]
+
+
+def time_query(conn, query, repeat):
+    """ Returns the median latency in ms and the sorted result ids. """
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = conn.execute(query).fetchall()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.median(latencies), sorted(row[0] for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare json_leaves lookups with join-based queries on a scaled-up llamacloud.json.")
+    parser.add_argument("--size-mb", type=int, default=200, help="Size of the synthetic JSON file")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query (median reported)")
+    parser.add_argument("--threads", type=int, default=None, help="DuckDB threads (default: all cores)")
+    args = parser.parse_args()
+
+    from data_prep import index_json_file
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path = os.path.join(tmp_dir, "synthetic.json")
+        db_name = os.path.join(tmp_dir, "synthetic")
+        count = write_synthetic_file(json_path, args.size_mb)
+        start = time.perf_counter()
+        index_json_file(db_name, json_path, db_name)
+        print(f"Indexed {count} jobs in {time.perf_counter() - start:.1f}s")
+
+        conn = duckdb.connect(f"{db_name}.duckdb", read_only=True)
+        if args.threads:
+            conn.execute(f"SET threads = {args.threads}")
+        leaves = conn.execute("SELECT COUNT(*) FROM json_leaves").fetchone()[0]
+        print(f"json_leaves: {leaves} rows")
+
+        print(f"\n{'query':<20} {'rows':>8} {'leaf ms':>9} {'join ms':>9} {'speedup':>8}")
+        for label, leaf_query, join_query in QUERIES:
+            leaf_ms, leaf_ids = time_query(conn, leaf_query, args.repeat)
+            join_ms, join_ids = time_query(conn, join_query, args.repeat)
+            if leaf_ids != join_ids:
+                raise AssertionError(f"{label}: json_leaves returned {len(leaf_ids)} records, the join {len(join_ids)}")
+            print(f"{label:<20} {len(leaf_ids):>8} {leaf_ms:>9.1f} {join_ms:>9.1f} {join_ms / leaf_ms:>7.1f}x")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import duckdb
+
+from bench.bench_streaming_ingest import write_synthetic_file
+
+# Agent queries run against the indexed database and against the databases loaded from its export
+QUERIES = [
+    ("jobs per status", "SELECT status, COUNT(*) FROM jobs_job_record GROUP BY status"),
+    ("pdf-pages > 30", "SELECT COUNT(*) FROM json_leaves WHERE path = 'jobs[].usage_metrics.feature_usage.pdf-pages' AND num_value > 30"),
+    ("children per table", "SELECT child_table, COUNT(*) FROM record_relationships GROUP BY child_table"),
+    ("table statistics", "SELECT * FROM table_statistics"),
+]
+
+
+def directory_size_mb(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names) / (1024 * 1024)
+
+
+def time_query(conn, query, repeat):
+    """ Returns the median latency in ms and the sorted rows. """
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = conn.execute(query).fetchall()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.median(latencies), sorted(rows, key=repr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare cold start from a Parquet export with indexing the JSON file.")
+    parser.add_argument("--size-mb", type=int, default=200, help="Size of the synthetic JSON file")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query (median reported)")
+    args = parser.parse_args()
+
+    from data_prep import index_json_file, export_database, load_exported_database
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path = os.path.join(tmp_dir, "synthetic.json")
+        count = write_synthetic_file(json_path, args.size_mb)
+        db_name = os.path.join(tmp_dir, "indexed")
+
+        start = time.perf_counter()
+        index_json_file(db_name, json_path, db_name)
+        index_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        export_database(db_name, os.path.join(tmp_dir, "export"))
+        export_seconds = time.perf_counter() - start
+
+        loaded = {}
+        for materialize in (False, True):
+            name = os.path.join(tmp_dir, f"loaded_{materialize}")
+            start = time.perf_counter()
+            load_exported_database(name, os.path.join(tmp_dir, "export"), json_path, materialize)
+            loaded[materialize] = (name, time.perf_counter() - start)
+
+        print(f"\n{count} jobs, {os.path.getsize(json_path) / (1024 * 1024):.0f} MB of JSON")
+        print(f"{'step':<28} {'seconds':>8} {'MB':>8}")
+        print(f"{'index JSON':<28} {index_seconds:>8.1f} {os.path.getsize(f'{db_name}.duckdb') / (1024 * 1024):>8.0f}")
+        print(f"{'export Parquet':<28} {export_seconds:>8.1f} {directory_size_mb(os.path.join(tmp_dir, 'export')):>8.0f}")
+        for materialize, (name, seconds) in loaded.items():
+            label = "load export (tables)" if materialize else "load export (views)"
+            print(f"{label:<28} {seconds:>8.2f} {os.path.getsize(f'{name}.duckdb') / (1024 * 1024):>8.0f}")
+
+        connections = {"indexed": duckdb.connect(f"{db_name}.duckdb", read_only=True)}
+        connections.update({
+            ("tables" if materialize else "views"): duckdb.connect(f"{name}.duckdb", read_only=True)
+            for materialize, (name, _) in loaded.items()
+        })
+        print(f"\n{'query':<20} " + " ".join(f"{label + ' ms':>11}" for label in connections))
+        for label, query in QUERIES:
+            results = [time_query(conn, query, args.repeat) for conn in connections.values()]
+            if any(rows != results[0][1] for _, rows in results):
+                raise AssertionError(f"{label}: the loaded databases returned different results")
+            print(f"{label:<20} " + " ".join(f"{ms:>11.1f}" for ms, _ in results))
+        for conn in connections.values():
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
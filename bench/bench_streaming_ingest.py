@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SOURCE_FILE = "data/llamacloud.json"
+
+
+def write_synthetic_file(path, size_mb):
+    """
+    Writes a synthetic export of roughly size_mb megabytes by repeating the jobs
+    from data/llamacloud.json. The file is written incrementally, so generating it
+    does not need the whole document in memory either.
+    """
+    with open(SOURCE_FILE, "r") as f:
+        source = json.load(f)
+    jobs = [json.dumps(job) for job in source["jobs"]]
+
+    target = size_mb * 1024 * 1024
+    written = 0
+    count = 0
+    with open(path, "w") as f:
+        f.write('{"jobs": [')
+        while written < target:
+            job = jobs[count % len(jobs)]
+            if count:
+                f.write(",\n")
+            f.write(job)
+            written += len(job) + 2
+            count += 1
+        f.write(f'], "total_count": {count}, "limit": {count}, "offset": 0}}')
+    return count
+
+
+def run_child(db_name, json_path, batch_size, memory_limit):
+    """ Indexes the file in this process; used as the benchmark child. """
+    from data_prep import index_json_file
+    index_json_file(db_name, json_path, db_name, batch_size=batch_size, memory_limit=memory_limit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index a synthetic multi-GB JSON file and check peak RSS.")
+    parser.add_argument("--size-mb", type=int, default=2048, help="Size of the synthetic JSON file")
+    parser.add_argument("--rss-ceiling-mb", type=int, default=1024, help="Maximum allowed peak RSS of the indexer")
+    parser.add_argument("--batch-size", type=int, default=50000, help="Rows buffered per table before a bulk insert")
+    parser.add_argument("--memory-limit", default="256MB", help="DuckDB memory_limit used while indexing")
+    parser.add_argument("--child", nargs=2, metavar=("DB_NAME", "JSON_PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], args.child[1], args.batch_size, args.memory_limit)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path = os.path.join(tmp_dir, "synthetic.json")
+        db_name = os.path.join(tmp_dir, "synthetic")
+
+        print(f"Writing ~{args.size_mb} MB synthetic file...")
+        count = write_synthetic_file(json_path, args.size_mb)
+        file_mb = os.path.getsize(json_path) / (1024 * 1024)
+        print(f"Wrote {count} jobs ({file_mb:.0f} MB)")
+
+        # Run the indexer in a child process so its peak RSS can be measured on its own
+        start = time.time()
+        subprocess.run(
+            [sys.executable, "-m", "bench.bench_streaming_ingest", "--child", db_name, json_path,
+             "--batch-size", str(args.batch_size), "--memory-limit", args.memory_limit],
+            check=True
+        )
+        elapsed = time.time() - start
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+    print(f"Indexed {file_mb:.0f} MB in {elapsed:.1f}s ({file_mb / elapsed:.1f} MB/s)")
+    print(f"Peak RSS: {peak_rss_mb:.0f} MB (ceiling {args.rss_ceiling_mb} MB)")
+    if peak_rss_mb > args.rss_ceiling_mb:
+        print("FAILED: peak RSS exceeded the ceiling")
+        sys.exit(1)
+    print("PASSED")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import duckdb
+
+from data_prep import index_json_file
+
+SOURCE_FILE = "data/llamacloud.json"
+
+# Representative aggregations, written once against the all-TEXT layout (with the
+# CASTs the agent has to add) and once against the typed layout.
+QUERIES = {
+    "sum_pages_tokens": (
+        'SELECT SUM(CAST("pdf-pages" AS BIGINT)), SUM(CAST("pdf-inputTokens" AS BIGINT)), SUM(CAST("pdf-outputTokens" AS BIGINT)) FROM jobs_usage_metrics_feature_usage',
+        'SELECT SUM("pdf-pages"), SUM("pdf-inputTokens"), SUM("pdf-outputTokens") FROM jobs_usage_metrics_feature_usage',
+    ),
+    "avg_llm_time_filtered": (
+        'SELECT AVG(CAST("pdf-llmTime" AS DOUBLE)) FROM jobs_usage_metrics_feature_usage WHERE CAST("pdf-pages" AS BIGINT) > 10',
+        'SELECT AVG("pdf-llmTime") FROM jobs_usage_metrics_feature_usage WHERE "pdf-pages" > 10',
+    ),
+    "duration_by_status": (
+        'SELECT status, COUNT(*), AVG(epoch(CAST(ended_at AS TIMESTAMP)) - epoch(CAST(started_at AS TIMESTAMP))) FROM jobs_job_record GROUP BY status',
+        'SELECT status, COUNT(*), AVG(epoch(ended_at) - epoch(started_at)) FROM jobs_job_record GROUP BY status',
+    ),
+    "max_attempts": (
+        'SELECT MAX(CAST(attempts AS BIGINT)) FROM jobs_job_record',
+        'SELECT MAX(attempts) FROM jobs_job_record',
+    ),
+}
+
+
+def write_scaled_file(path, copies):
+    """ Writes data/llamacloud.json with its jobs array repeated the given number of times. """
+    with open(SOURCE_FILE, "r") as f:
+        source = json.load(f)
+    source["jobs"] = source["jobs"] * copies
+    source["total_count"] = len(source["jobs"])
+    with open(path, "w") as f:
+        json.dump(source, f)
+    return len(source["jobs"])
+
+
+def build_copy(source_path, copy_path, as_text):
+    """
+    Copies every table of the indexed database into a fresh database file, so both
+    layouts are compared without indexes or fragmentation from incremental loading.
+    With as_text, all data columns are stored as TEXT, which is the layout index_json
+    produced before.
+    """
+    conn = duckdb.connect(copy_path)
+    conn.execute(f"ATTACH '{source_path}' AS source (READ_ONLY)")
+    tables = conn.execute(
+        "SELECT DISTINCT table_name FROM information_schema.columns WHERE table_catalog = 'source'"
+    ).fetchall()
+    for (table_name,) in tables:
+        columns = conn.execute(
+            "SELECT column_name, data_type FROM information_schema.columns WHERE table_catalog = 'source' AND table_name = ? ORDER BY ordinal_position",
+            [table_name]
+        ).fetchall()
+        select_list = ", ".join(
+            [f'"{col}"' if data_type == "UUID" or not as_text else f'CAST("{col}" AS TEXT) AS "{col}"' for col, data_type in columns]
+        )
+        conn.execute(f'CREATE TABLE "{table_name}" AS SELECT {select_list} FROM source."{table_name}"')
+    conn.execute("DETACH source")
+    conn.execute("CHECKPOINT")
+    conn.close()
+
+
+def time_query(conn, query, repeat):
+    """ Returns the median latency of a query in milliseconds. """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(query).fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare all-TEXT and typed table layouts.")
+    parser.add_argument("--copies", type=int, default=2000, help="Times the jobs array is repeated")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path = os.path.join(tmp_dir, "scaled.json")
+        indexed_db = os.path.join(tmp_dir, "indexed")
+        typed_path = os.path.join(tmp_dir, "typed.duckdb")
+        text_path = os.path.join(tmp_dir, "text.duckdb")
+
+        jobs = write_scaled_file(json_path, args.copies)
+        print(f"Indexing {jobs} jobs...")
+        index_json_file(indexed_db, json_path, "indexed")
+        build_copy(f"{indexed_db}.duckdb", typed_path, as_text=False)
+        build_copy(f"{indexed_db}.duckdb", text_path, as_text=True)
+
+        typed_mb = os.path.getsize(typed_path) / (1024 * 1024)
+        text_mb = os.path.getsize(text_path) / (1024 * 1024)
+        print(f"\nFile size: TEXT {text_mb:.1f} MB | typed {typed_mb:.1f} MB ({text_mb / typed_mb:.2f}x smaller)")
+
+        text_conn = duckdb.connect(text_path, read_only=True)
+        typed_conn = duckdb.connect(typed_path, read_only=True)
+
+        print(f"\n{'query':<24} {'TEXT ms':>10} {'typed ms':>10} {'speedup':>8}")
+        for name, (text_query, typed_query) in QUERIES.items():
+            text_ms = time_query(text_conn, text_query, args.repeat)
+            typed_ms = time_query(typed_conn, typed_query, args.repeat)
+            print(f"{name:<24} {text_ms:>10.2f} {typed_ms:>10.2f} {text_ms / typed_ms:>7.1f}x")
+
+        text_conn.close()
+        typed_conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from agents import vector_index
+
+WRITE_CHUNK = 10000
+
+
+def write_clustered_index(db_name, count, dimensions, clusters, noise, ivf_min_vectors, seed=0):
+    """
+    Writes count random vectors drawn around clusters random centers, which is closer to
+    real embeddings than uniformly random vectors.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    writer = vector_index.create_writer(db_name)
+    for start in range(0, count, WRITE_CHUNK):
+        size = min(WRITE_CHUNK, count - start)
+        vectors = centers[rng.integers(clusters, size=size)] + noise * rng.standard_normal((size, dimensions)).astype(np.float32)
+        vector_index.add_points(writer, [
+            SimpleNamespace(vector=vector, payload={"json_path": f"items[{start + i}]"})
+            for i, vector in enumerate(vectors)
+        ])
+    vector_index.finish_writer(writer, ivf_min_vectors)
+    return centers
+
+
+def time_queries(db_name, queries, k, **search_args):
+    """ Runs every query and returns the latencies in ms and the result paths. """
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits = vector_index.search(db_name, query, k, **search_args)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append({hit["payload"]["json_path"] for hit in hits})
+    return np.array(latencies), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare brute-force and IVF search of the local vector index.")
+    parser.add_argument("--vectors", type=int, default=1_000_000, help="Number of indexed vectors")
+    parser.add_argument("--dimensions", type=int, default=128, help="Vector dimensions")
+    parser.add_argument("--clusters", type=int, default=2000, help="Clusters the synthetic vectors are drawn around")
+    parser.add_argument("--noise", type=float, default=1.5, help="Spread of the vectors around their cluster center")
+    parser.add_argument("--queries", type=int, default=50, help="Number of timed queries")
+    parser.add_argument("--top-k", type=int, default=10, help="Results per query")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64], help="IVF lists probed per query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_name = os.path.join(tmp_dir, "bench")
+        start = time.perf_counter()
+        centers = write_clustered_index(db_name, args.vectors, args.dimensions, args.clusters, args.noise, ivf_min_vectors=1)
+        print(f"Built index of {args.vectors} x {args.dimensions} vectors in {time.perf_counter() - start:.1f}s")
+
+        rng = np.random.default_rng(1)
+        queries = centers[rng.integers(args.clusters, size=args.queries)] + args.noise * rng.standard_normal((args.queries, args.dimensions)).astype(np.float32)
+        # Warm the page cache and the loaded index
+        vector_index.search(db_name, queries[0], args.top_k, exact=True)
+
+        exact_ms, exact = time_queries(db_name, queries, args.top_k, exact=True)
+        print(f"\n{'search':<16} {'p50 ms':>8} {'p95 ms':>8} {'recall@' + str(args.top_k):>10}")
+        print(f"{'brute force':<16} {np.percentile(exact_ms, 50):>8.1f} {np.percentile(exact_ms, 95):>8.1f} {1.0:>10.3f}")
+        for nprobe in args.nprobe:
+            ivf_ms, found = time_queries(db_name, queries, args.top_k, nprobe=nprobe)
+            recall = np.mean([len(a & b) / len(a) for a, b in zip(exact, found, strict=True)])
+            print(f"{'IVF nprobe=' + str(nprobe):<16} {np.percentile(ivf_ms, 50):>8.1f} {np.percentile(ivf_ms, 95):>8.1f} {recall:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
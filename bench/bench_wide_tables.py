@@ -0,0 +1,155 @@
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import duckdb
+
+from bench.bench_streaming_ingest import write_synthetic_file
+
+# Representative agent questions about jobs: (label, hierarchical query joining on parent_id, query on jobs_wide).
+# Jobs without a nested object have NULLs in jobs_wide, which the inner joins drop.
+QUERIES = [
+    (
+        "jobs per status",
+        """
+        SELECT jr.status, COUNT(*) FROM jobs j
+        JOIN jobs_job_record jr ON jr.parent_id = j.record_id
+        GROUP BY jr.status
+        """,
+        'SELECT "job_record.status", COUNT(*) FROM jobs_wide GROUP BY "job_record.status"',
+    ),
+    (
+        "avg pages per job type",
+        """
+        SELECT jr.job_name, AVG(f."pdf-pages") FROM jobs j
+        JOIN jobs_job_record jr ON jr.parent_id = j.record_id
+        JOIN jobs_usage_metrics m ON m.parent_id = j.record_id
+        JOIN jobs_usage_metrics_feature_usage f ON f.parent_id = m.record_id
+        GROUP BY jr.job_name
+        """,
+        """
+        SELECT "job_record.job_name", AVG("usage_metrics.feature_usage.pdf-pages") FROM jobs_wide
+        GROUP BY "job_record.job_name"
+        """,
+    ),
+    (
+        "large successful files",
+        """
+        SELECT p."originalFileName", f."pdf-pages" FROM jobs j
+        JOIN jobs_job_record jr ON jr.parent_id = j.record_id
+        JOIN jobs_job_record_parameters p ON p.parent_id = jr.record_id
+        JOIN jobs_usage_metrics m ON m.parent_id = j.record_id
+        JOIN jobs_usage_metrics_feature_usage f ON f.parent_id = m.record_id
+        WHERE jr.status = 'SUCCESS' AND f."pdf-pages" > 30
+        """,
+        """
+        SELECT "job_record.parameters.originalFileName", "usage_metrics.feature_usage.pdf-pages" FROM jobs_wide
+        WHERE "job_record.status" = 'SUCCESS' AND "usage_metrics.feature_usage.pdf-pages" > 30
+        """,
+    ),
+    (
+        "credits per day",
+        """
+        SELECT m.day, SUM(f."llama-parse-credit") FROM jobs j
+        JOIN jobs_usage_metrics m ON m.parent_id = j.record_id
+        JOIN jobs_usage_metrics_feature_usage f ON f.parent_id = m.record_id
+        GROUP BY m.day
+        """,
+        """
+        SELECT "usage_metrics.day", SUM("usage_metrics.feature_usage.llama-parse-credit") FROM jobs_wide
+        WHERE "usage_metrics.day" IS NOT NULL
+        GROUP BY "usage_metrics.day"
+        """,
+    ),
+    (
+        "top 10 slowest",
+        """
+        SELECT j.record_id, jr.job_name, f."pdf-time" FROM jobs j
+        JOIN jobs_job_record jr ON jr.parent_id = j.record_id
+        JOIN jobs_usage_metrics m ON m.parent_id = j.record_id
+        JOIN jobs_usage_metrics_feature_usage f ON f.parent_id = m.record_id
+        ORDER BY f."pdf-time" DESC, j.record_id LIMIT 10
+        """,
+        """
+        SELECT record_id, "job_record.job_name", "usage_metrics.feature_usage.pdf-time" FROM jobs_wide
+        WHERE "usage_metrics.feature_usage.pdf-time" IS NOT NULL
+        ORDER BY "usage_metrics.feature_usage.pdf-time" DESC, record_id LIMIT 10
+        """,
+    ),
+    (
+        "duration by user",
+        """
+        SELECT u.name, AVG(epoch(jr.ended_at) - epoch(jr.started_at)) FROM jobs j
+        JOIN jobs_job_record jr ON jr.parent_id = j.record_id
+        JOIN jobs_user u ON u.parent_id = j.record_id
+        GROUP BY u.name
+        """,
+        """
+        SELECT "user.name", AVG(epoch("job_record.ended_at") - epoch("job_record.started_at")) FROM jobs_wide
+        WHERE "user.name" IS NOT NULL
+        GROUP BY "user.name"
+        """,
+    ),
+]
+
+
+def time_query(conn, query, repeat):
+    """ Returns the median latency in ms and the sorted rows. """
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = conn.execute(query).fetchall()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.median(latencies), sorted(rows, key=repr)
+
+
+def same_rows(a, b):
+    """ Compares results, allowing for float rounding in aggregates. """
+    if len(a) != len(b):
+        return False
+    for row_a, row_b in zip(a, b, strict=True):
+        for x, y in zip(row_a, row_b, strict=True):
+            if isinstance(x, float) and isinstance(y, float):
+                if abs(x - y) > 1e-6 * max(1.0, abs(x)):
+                    return False
+            elif x != y:
+                return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare agent queries on the hierarchical tables and on jobs_wide.")
+    parser.add_argument("--size-mb", type=int, default=200, help="Size of the synthetic JSON file")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query (median reported)")
+    args = parser.parse_args()
+
+    from data_prep import index_json_file
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path = os.path.join(tmp_dir, "synthetic.json")
+        count = write_synthetic_file(json_path, args.size_mb)
+
+        timings = {}
+        for wide_tables in (False, True):
+            db_name = os.path.join(tmp_dir, f"wide_{wide_tables}")
+            start = time.perf_counter()
+            index_json_file(db_name, json_path, db_name, wide_tables=wide_tables)
+            timings[wide_tables] = (time.perf_counter() - start, os.path.getsize(f"{db_name}.duckdb") / (1024 * 1024))
+        print(f"Indexed {count} jobs: {timings[False][0]:.1f}s / {timings[False][1]:.0f} MB without wide tables, "
+              f"{timings[True][0]:.1f}s / {timings[True][1]:.0f} MB with")
+
+        conn = duckdb.connect(os.path.join(tmp_dir, "wide_True.duckdb"), read_only=True)
+        print(f"\n{'query':<24} {'rows':>6} {'joins ms':>9} {'wide ms':>9} {'speedup':>8}")
+        for label, hierarchical_query, wide_query in QUERIES:
+            joins_ms, joins_rows = time_query(conn, hierarchical_query, args.repeat)
+            wide_ms, wide_rows = time_query(conn, wide_query, args.repeat)
+            if not same_rows(joins_rows, wide_rows):
+                raise AssertionError(f"{label}: the layouts returned different results")
+            print(f"{label:<24} {len(wide_rows):>6} {joins_ms:>9.1f} {wide_ms:>9.1f} {joins_ms / wide_ms:>7.1f}x")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
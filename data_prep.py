@@ -1,20 +1,114 @@
+import hashlib
 import json
+import os
+import re
+import shutil
+import tempfile
 import duckdb
 import uuid
-from qdrant_client import QdrantClient
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import quote
+from types import GeneratorType
+from pandas import DataFrame
 from qdrant_client.models import PointStruct
 from langchain_openai import OpenAIEmbeddings
 
+from agents import text_index, vector_index
+
+# Number of buffered rows (across all tables) before the buffer is bulk loaded
+DEFAULT_BATCH_SIZE = 50000
+
+RELATIONSHIP_COLUMNS = ("child_id", "parent_id", "child_table", "parent_table", "relationship_type")
+ITEM_KEY_COLUMNS = ("table_name", "key_path", "natural_key", "record_id", "content_hash", "position")
+
+# Tables written through the buffer that are not part of the document, with their columns
+SYSTEM_TABLES = {"record_relationships": RELATIONSHIP_COLUMNS, "item_keys": ITEM_KEY_COLUMNS}
+
+# Bump whenever the layout of indexed databases changes so existing files get rebuilt
+SCHEMA_VERSION = 8
+
+# How record IDs are assigned: "sequential" gives dense BIGINT ids per table that are
+# stable across re-indexing of the same file, "uuid" gives random UUIDs
+ID_TYPES = {"sequential": "BIGINT", "uuid": "UUID"}
+DEFAULT_ID_MODE = "sequential"
+
+# Characters read per chunk by the streaming JSON parser
+STREAM_CHUNK_SIZE = 1 << 20
+
+# Characters of array source text per hashed block; appends skip the blocks whose text
+# is unchanged instead of decoding their items again (see iter_json_sections)
+ITEM_BLOCK_CHARS = 1 << 18
+# Yielded by iter_json_sections in place of the items of an unchanged block
+SKIPPED_ITEMS = object()
+
+DECODER = json.JSONDecoder()
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+NUMBER_TAIL = re.compile(r"[0-9.eE+-]*")
+
+# Which json_leaves column holds values of each column type; other types are stored as text
+LEAF_VALUE_COLUMNS = {
+    "BIGINT": "num_value",
+    "DOUBLE": "num_value",
+    "BOOLEAN": "bool_value",
+    "TIMESTAMP": "ts_value",
+}
+LEAF_COLUMNS = {"num_value": "DOUBLE", "str_value": "TEXT", "ts_value": "TIMESTAMP", "bool_value": "BOOLEAN"}
+
+# Also materialize a flattened <array>_wide table per top-level array
+DEFAULT_WIDE_TABLES = os.getenv("INDEX_WIDE_TABLES", "false").lower() == "true"
+
+# Incremental ingestion: a changed file only inserts its new and changed top-level items.
+# NATURAL_KEYS maps top-level arrays to the path of the value identifying an item
+# ("jobs=job_record.id,..."); items of other arrays are identified by their position.
+INCREMENTAL_INGEST = os.getenv("INCREMENTAL_INGEST", "false").lower() == "true"
+NATURAL_KEYS = dict(
+    tuple(part.strip() for part in pair.split("=", 1))
+    for pair in os.getenv("NATURAL_KEYS", "").split(",") if "=" in pair
+)
+DEFAULT_NATURAL_KEYS = NATURAL_KEYS if INCREMENTAL_INGEST else None
+
+# Parquet exports: version of the export layout, target size of each file and tables split
+# into one directory per value of a column instead of by size
+EXPORT_FORMAT_VERSION = 1
+EXPORT_FILE_SIZE = "256MB"
+EXPORT_PARTITIONS = {"record_relationships": "child_table"}
+
+# Small tables copied into the database when loading an export; the rest are read_parquet views
+EXPORT_LOCAL_TABLES = ("schema_info", "ingestion_manifest", "prompt_context", "text_index_stats")
+
+# Rows per batch sampled when inferring column types
+TYPE_SAMPLE_SIZE = 1000
+
+# Records per embed_documents call, calls in flight at once, and points per vector store upsert
+DEFAULT_EMBED_BATCH_SIZE = 100
+DEFAULT_EMBED_CONCURRENCY = 4
+UPSERT_BATCH_SIZE = 500
+
+# Directory of the persistent content hash -> vector caches, one DuckDB file per collection
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".embedding_cache")
+
+# String values that get a native type; timestamps with a non-UTC offset, or that are
+# not valid dates and times (e.g. 2024-02-30), stay VARCHAR
+STRING_TYPES = [
+    ("UUID", re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")),
+    ("TIMESTAMP", re.compile(r"\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]00:?00)?)?")),
+]
+
 def create_db(db_name):
     """ Creates a new DuckDB database for each JSON document. """
     conn = duckdb.connect(f"{db_name}.duckdb")
     return conn
 
-def create_schema_tables(conn):
+def create_schema_tables(conn, id_mode=DEFAULT_ID_MODE, item_keys=False):
     """
     Creates tables for storing schema information and hierarchical relationships.
     This helps the LLM understand the structure of the data.
+    With item_keys, also creates the tables of top-level item keys and of the hashed
+    blocks of array source text used to append to the database later.
     """
+    id_type = ID_TYPES[id_mode]
+    
     # Create a table for storing schema information
     conn.execute("""
         CREATE TABLE IF NOT EXISTS schema_info (
@@ -22,25 +116,333 @@ def create_schema_tables(conn):
             parent_table TEXT,
             description TEXT,
             is_array BOOLEAN,
-            count INTEGER
+            count INTEGER,
+            flattened_from TEXT
         )
     """)
     
-    # Create a table for storing relationships between records
+    # Create a table recording which source file the database was built from
     conn.execute("""
+        CREATE TABLE IF NOT EXISTS ingestion_manifest (
+            source_path TEXT PRIMARY KEY,
+            size BIGINT,
+            mtime DOUBLE,
+            content_hash TEXT,
+            schema_version INTEGER,
+            indexed_at TIMESTAMP
+        )
+    """)
+    
+    # Create a table for storing relationships between records
+    conn.execute(f"""
         CREATE TABLE IF NOT EXISTS record_relationships (
-            child_id UUID,
-            parent_id UUID,
+            child_id {id_type},
+            parent_id {id_type},
             child_table TEXT,
             parent_table TEXT,
             relationship_type TEXT
         )
     """)
+    
+    if item_keys:
+        # Natural key and content hash of every top-level item, for incremental ingestion
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS item_keys (
+                table_name TEXT,
+                key_path TEXT,
+                natural_key TEXT,
+                record_id {id_type},
+                content_hash TEXT,
+                position BIGINT
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS item_blocks (
+                table_name TEXT,
+                first_position BIGINT,
+                item_count BIGINT,
+                text_length BIGINT,
+                content_hash TEXT
+            )
+        """)
+
+def create_buffer(batch_size=DEFAULT_BATCH_SIZE, id_mode=DEFAULT_ID_MODE, natural_keys=None, sample_size=TYPE_SAMPLE_SIZE):
+    """
+    Creates an ingestion buffer that collects rows per target table so each table
+    can be loaded with a single bulk INSERT instead of one statement per record.
+    With natural_keys (see key_item), the key of every top-level item is recorded.
+    Column types are inferred from sample_size rows per batch, or from every row with
+    None (needed inside a transaction, where a failed INSERT cannot be retried).
+    """
+    return {
+        "batch_size": batch_size,
+        "sample_size": sample_size,
+        "id_mode": id_mode,
+        "natural_keys": natural_keys,
+        "seen_keys": {},
+        "next_id": {},
+        "child_tables": set(),
+        "columns": {},
+        "rows": {},
+        "pending": 0,
+        "schema_info": {},
+        "created": {},
+    }
+
+def new_record_id(buffer, table_name):
+    """
+    Returns the next record ID for a table. Sequential ids follow document order, so
+    child tables are stored sorted by parent_id and re-indexing yields the same ids.
+    """
+    if buffer["id_mode"] == "uuid":
+        return str(uuid.uuid4())
+    record_id = buffer["next_id"].get(table_name, 0) + 1
+    buffer["next_id"][table_name] = record_id
+    return record_id
+
+def register_columns(buffer, table_name, schema):
+    """
+    Records the columns of a table in the buffer, keeping the union of all keys seen.
+    """
+    columns = buffer["columns"].setdefault(table_name, [])
+    known = set(columns)
+    for col in schema:
+        if col not in known:
+            columns.append(col)
+            known.add(col)
+
+def buffer_rows(conn, buffer, table_name, rows):
+    """
+    Adds rows (dicts keyed by column name) to the buffer for a table. Once the buffer
+    holds batch_size rows in total, every table is bulk loaded, which bounds memory
+    regardless of how many tables the document produces.
+    """
+    buffer["rows"].setdefault(table_name, []).extend(rows)
+    buffer["pending"] += len(rows)
+    if buffer["pending"] >= buffer["batch_size"]:
+        flush_rows(conn, buffer)
 
-def create_table(conn, table_name, schema, parent_table=None, is_array=False, count=None, description=None):
+def infer_type(value):
+    """ Returns the DuckDB type for a single JSON value, or None for null. """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "BOOLEAN"
+    if isinstance(value, int):
+        return "BIGINT" if -2**63 <= value < 2**63 else "VARCHAR"
+    if isinstance(value, float):
+        return "DOUBLE"
+    if isinstance(value, (dict, list)):
+        return "JSON"
+    for type_name, pattern in STRING_TYPES:
+        if pattern.fullmatch(value) and (type_name != "TIMESTAMP" or is_timestamp(value)):
+            return type_name
+    return "VARCHAR"
+
+def is_timestamp(value):
+    """ Checks that a string shaped like a timestamp is a real date and time. """
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+def widen_type(current, new):
+    """ Returns a type that can hold values of both types. """
+    if current is None:
+        return new
+    if new is None or new == current:
+        return current
+    if {current, new} == {"BIGINT", "DOUBLE"}:
+        return "DOUBLE"
+    return "VARCHAR"
+
+def infer_column_types(columns, rows):
+    """ Infers a type per column from the given rows, widening on conflicts. """
+    types = dict.fromkeys(columns)
+    for row in rows:
+        for col, value in row.items():
+            if col in types:
+                types[col] = widen_type(types[col], infer_type(value))
+    return types
+
+def to_text(value, column_type):
+    """
+    Encodes a JSON value as text for bulk loading; DuckDB casts it to the column type
+    on insert. Objects and arrays are stored as JSON instead of Python reprs.
+    """
+    if value is None:
+        return None
+    if column_type == "JSON" or isinstance(value, (bool, dict, list)):
+        return json.dumps(value)
+    if isinstance(value, str):
+        return value
+    return str(value)
+
+def ensure_table(conn, buffer, table_name, rows=(), sample_size=TYPE_SAMPLE_SIZE):
+    """
+    Creates the data table on first flush with column types inferred from a sample of
+    the buffered rows, adds columns discovered later and widens column types when new
+    values do not fit.
+    """
+    columns = buffer["columns"][table_name]
+    created = buffer["created"].get(table_name)
+    
+    # Sample evenly across the batch rather than only its head (all rows without a sample size)
+    step = max(1, len(rows) // sample_size) if sample_size else 1
+    sampled = infer_column_types(columns, rows[::step])
+    for col in columns:
+        if sampled[col] is None and step > 1:
+            # Sparse columns may be missed by the sample; use their first non-null value
+            sampled[col] = infer_type(next((row[col] for row in rows if row.get(col) is not None), None))
+    
+    # created maps each column to its inferred type; None means only nulls were seen so far
+    # and the column is stored as VARCHAR until a typed value arrives
+    if created is None:
+        existing = conn.execute(
+            "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = ?", [table_name]
+        ).fetchall()
+        id_type = ID_TYPES[buffer["id_mode"]]
+        if existing:
+            created = {row[0]: row[1] for row in existing}
+        else:
+            # Child tables reference their parent row directly through parent_id
+            system_defs = f"record_id {id_type} PRIMARY KEY"
+            if table_name in buffer["child_tables"]:
+                system_defs += f", parent_id {id_type}"
+            column_defs = "".join([f', "{col}" {sampled[col] or "VARCHAR"}' for col in columns])
+            conn.execute(f'CREATE TABLE "{table_name}" ({system_defs}{column_defs})')
+            created = dict(sampled)
+            created["record_id"] = id_type
+            if table_name in buffer["child_tables"]:
+                created["parent_id"] = id_type
+        if table_name in buffer["child_tables"] and "parent_id" not in created:
+            conn.execute(f'ALTER TABLE "{table_name}" ADD COLUMN parent_id {id_type}')
+            created["parent_id"] = id_type
+        buffer["created"][table_name] = created
+    
+    for col in columns:
+        if col not in created:
+            created[col] = sampled[col]
+            conn.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "{col}" {sampled[col] or "VARCHAR"}')
+        else:
+            widened = widen_type(created[col], sampled[col])
+            if widened != created[col]:
+                if widened != (created[col] or "VARCHAR"):
+                    conn.execute(f'ALTER TABLE "{table_name}" ALTER COLUMN "{col}" TYPE {widened}')
+                created[col] = widened
+
+def widen_unconvertible_columns(conn, buffer, table_name, columns):
+    """
+    Widens typed columns to VARCHAR where a value in the registered ingest_batch does not
+    convert to the column type, so the INSERT cannot fail on it.
+    """
+    created = buffer["created"][table_name]
+    typed = [col for col in columns if col not in ("record_id", "parent_id") and created.get(col) not in (None, "VARCHAR", "JSON")]
+    if not typed:
+        return
+    # Check every column in one scan of the batch
+    unconvertible = conn.execute("SELECT " + ", ".join(
+        f'bool_or("{col}" IS NOT NULL AND TRY_CAST("{col}" AS {created[col]}) IS NULL)' for col in typed
+    ) + " FROM ingest_batch").fetchone()
+    for col, failed in zip(typed, unconvertible, strict=True):
+        if failed:
+            conn.execute(f'ALTER TABLE "{table_name}" ALTER COLUMN "{col}" TYPE VARCHAR')
+            created[col] = "VARCHAR"
+
+def flush_table(conn, buffer, table_name):
+    """
+    Loads all buffered rows for a table with one columnar bulk INSERT.
+    """
+    rows = buffer["rows"].get(table_name) or []
+    
+    if table_name in SYSTEM_TABLES:
+        columns = list(SYSTEM_TABLES[table_name])
+        types = {}
+    else:
+        ensure_table(conn, buffer, table_name, rows, buffer["sample_size"])
+        columns = ["record_id"] + buffer["columns"][table_name]
+        if table_name in buffer["child_tables"]:
+            columns.insert(1, "parent_id")
+        types = buffer["created"][table_name]
+    if not rows:
+        return
+    
+    if table_name == "record_relationships":
+        # Tables added to an indexed database are not in the json_table ENUM yet
+        encoded = encoded_table_names(conn)
+        if encoded is not None and not {row[col] for row in rows for col in ("child_table", "parent_table")} <= encoded:
+            decode_table_names(conn)
+    
+    column_list = ", ".join([f'"{col}"' for col in columns])
+    query = f'INSERT INTO "{table_name}" ({column_list}) SELECT {column_list} FROM ingest_batch'
+    
+    # Pivot the buffered rows into a columnar batch and insert it in one statement
+    batch = DataFrame({col: [to_text(row.get(col), types.get(col)) for row in rows] for col in columns})
+    conn.register("ingest_batch", batch)
+    try:
+        if buffer["sample_size"] is None and table_name not in SYSTEM_TABLES:
+            # A failed INSERT cannot be retried inside a transaction, so check the conversions first
+            widen_unconvertible_columns(conn, buffer, table_name, columns)
+        conn.execute(query)
+    except duckdb.ConversionException:
+        if buffer["sample_size"] is None:
+            raise
+        # A value outside the sample did not fit its column: infer from every row, widen
+        # columns whose values still do not convert, and retry
+        conn.unregister("ingest_batch")
+        ensure_table(conn, buffer, table_name, rows, sample_size=None)
+        batch = DataFrame({col: [to_text(row.get(col), types.get(col)) for row in rows] for col in columns})
+        conn.register("ingest_batch", batch)
+        widen_unconvertible_columns(conn, buffer, table_name, columns)
+        conn.execute(query)
+    finally:
+        conn.unregister("ingest_batch")
+    
+    buffer["rows"][table_name] = []
+
+def flush_rows(conn, buffer):
+    """
+    Bulk loads the buffered rows of every table.
+    """
+    for table_name in buffer["columns"]:
+        flush_table(conn, buffer, table_name)
+    for table_name in SYSTEM_TABLES:
+        flush_table(conn, buffer, table_name)
+    buffer["pending"] = 0
+
+def flush_buffer(conn, buffer):
+    """
+    Flushes every buffered table and writes the collected schema information.
+    """
+    flush_rows(conn, buffer)
+    
+    for table_name, info in buffer["schema_info"].items():
+        conn.execute("""
+            INSERT OR REPLACE INTO schema_info 
+            (table_name, parent_table, description, is_array, count) 
+            VALUES (?, ?, ?, ?, ?)
+        """, (table_name, info["parent_table"], info["description"], info["is_array"], info["count"]))
+    buffer["schema_info"] = {}
+
+def create_table(conn, table_name, schema, parent_table=None, is_array=False, count=None, description=None, buffer=None):
     """ 
     Creates a table for a top-level key in the JSON document and records schema information.
+    When a buffer is given, the table definition is collected and created on flush.
     """
+    if buffer is not None:
+        # Collect the union of columns seen for this table; DDL is issued on flush
+        register_columns(buffer, table_name, schema)
+        if parent_table:
+            buffer["child_tables"].add(table_name)
+        buffer["schema_info"][table_name] = {
+            "parent_table": parent_table,
+            "description": description,
+            "is_array": is_array,
+            "count": count,
+        }
+        return
+    
     # Create the data table
     columns = ", ".join([f'"{col}" TEXT' for col in schema])
     query = f'CREATE TABLE IF NOT EXISTS "{table_name}" (record_id UUID PRIMARY KEY, {columns})'
@@ -53,72 +455,93 @@ def create_table(conn, table_name, schema, parent_table=None, is_array=False, co
         VALUES (?, ?, ?, ?, ?)
     """, (table_name, parent_table, description, is_array, count))
 
-def insert_data(conn, table_name, data, parent_id=None, parent_table=None):
+def insert_data(conn, table_name, data, parent_id=None, parent_table=None, buffer=None, record_id=None):
     """ 
     Inserts data into the corresponding table while maintaining hierarchical relationships.
+    Rows are collected in the buffer and bulk loaded; without a buffer the data is flushed
+    before returning. Returns the record ID of an object, or the record IDs of the objects
+    in an array. An object is stored under record_id if given (a replaced item keeps its ID).
     """
+    if buffer is None:
+        # Tables created without a buffer use UUID record ids
+        buffer = create_buffer(id_mode="uuid")
+        items = data if isinstance(data, list) else [data]
+        register_columns(buffer, table_name, [k for item in items if isinstance(item, dict) for k in item])
+        record_ids = insert_data(conn, table_name, data, parent_id, parent_table, buffer, record_id)
+        flush_buffer(conn, buffer)
+        return record_ids
+    
     if isinstance(data, list):
         # For arrays, insert each item and maintain the relationship to the parent
+        record_ids = []
         for i, item in enumerate(data):
             if isinstance(item, dict):
                 # Generate a record ID for this item
-                record_id = uuid.uuid4()
+                record_id = new_record_id(buffer, table_name)
+                record_ids.append(record_id)
                 
-                # Insert the item
-                columns = ", ".join([f'"{k}"' for k in item.keys()])
-                placeholders = ", ".join(["?" for _ in item])
-                query = f'INSERT INTO "{table_name}" (record_id, {columns}) VALUES (?, {placeholders})'
-                values = [record_id] + list(map(str, item.values()))
-                conn.execute(query, values)
+                # Buffer the item
+                row = dict(item)
+                row["record_id"] = record_id
+                if parent_id is not None:
+                    row["parent_id"] = parent_id
+                buffer_rows(conn, buffer, table_name, [row])
                 
                 # Record the relationship to the parent if applicable
-                if parent_id:
-                    conn.execute("""
-                        INSERT INTO record_relationships 
-                        (child_id, parent_id, child_table, parent_table, relationship_type) 
-                        VALUES (?, ?, ?, ?, ?)
-                    """, (record_id, parent_id, table_name, parent_table, f"array_item[{i}]"))
+                if parent_id is not None:
+                    buffer_rows(conn, buffer, "record_relationships", [{
+                        "child_id": record_id,
+                        "parent_id": parent_id,
+                        "child_table": table_name,
+                        "parent_table": parent_table,
+                        "relationship_type": f"array_item[{i}]",
+                    }])
                 
                 # Process nested objects
                 for key, value in item.items():
                     if isinstance(value, (dict, list)) and value:
                         nested_table_name = f"{table_name}_{key}"
-                        process_nested_data(conn, nested_table_name, value, record_id, table_name)
+                        process_nested_data(conn, nested_table_name, value, record_id, table_name, buffer)
+        return record_ids
     
     elif isinstance(data, dict):
         # For objects, insert the record and process nested fields
-        record_id = uuid.uuid4()
+        if record_id is None:
+            record_id = new_record_id(buffer, table_name)
         
-        # Insert the record
-        columns = ", ".join([f'"{k}"' for k in data.keys()])
-        placeholders = ", ".join(["?" for _ in data])
-        query = f'INSERT INTO "{table_name}" (record_id, {columns}) VALUES (?, {placeholders})'
-        values = [record_id] + list(map(str, data.values()))
-        conn.execute(query, values)
+        # Buffer the record
+        row = dict(data)
+        row["record_id"] = record_id
+        if parent_id is not None:
+            row["parent_id"] = parent_id
+        buffer_rows(conn, buffer, table_name, [row])
         
         # Record the relationship to the parent if applicable
-        if parent_id:
-            conn.execute("""
-                INSERT INTO record_relationships 
-                (child_id, parent_id, child_table, parent_table, relationship_type) 
-                VALUES (?, ?, ?, ?, ?)
-            """, (record_id, parent_id, table_name, parent_table, "object_field"))
+        if parent_id is not None:
+            buffer_rows(conn, buffer, "record_relationships", [{
+                "child_id": record_id,
+                "parent_id": parent_id,
+                "child_table": table_name,
+                "parent_table": parent_table,
+                "relationship_type": "object_field",
+            }])
         
         # Process nested objects
         for key, value in data.items():
             if isinstance(value, (dict, list)) and value:
                 nested_table_name = f"{table_name}_{key}"
-                process_nested_data(conn, nested_table_name, value, record_id, table_name)
+                process_nested_data(conn, nested_table_name, value, record_id, table_name, buffer)
+        return record_id
 
-def process_nested_data(conn, table_name, data, parent_id, parent_table):
+def process_nested_data(conn, table_name, data, parent_id, parent_table, buffer=None):
     """
     Process nested data structures (objects or arrays) and maintain relationships.
     """
     if isinstance(data, list) and data and all(isinstance(i, dict) for i in data):
         # For arrays of objects, create a table with all possible fields
-        schema = set()
+        schema = {}
         for item in data:
-            schema.update(item.keys())
+            schema.update(dict.fromkeys(item.keys()))
         
         create_table(
             conn, 
@@ -127,11 +550,12 @@ def process_nested_data(conn, table_name, data, parent_id, parent_table):
             parent_table=parent_table, 
             is_array=True, 
             count=len(data),
-            description=f"Array of {len(data)} items from {parent_table}"
+            description=f"Array of {len(data)} items from {parent_table}",
+            buffer=buffer
         )
         
         # Insert the array items
-        insert_data(conn, table_name, data, parent_id, parent_table)
+        insert_data(conn, table_name, data, parent_id, parent_table, buffer)
     
     elif isinstance(data, dict):
         # For objects, create a table with its fields
@@ -141,11 +565,12 @@ def process_nested_data(conn, table_name, data, parent_id, parent_table):
             data.keys(), 
             parent_table=parent_table,
             is_array=False,
-            description=f"Object field from {parent_table}"
+            description=f"Object field from {parent_table}",
+            buffer=buffer
         )
         
         # Insert the object
-        insert_data(conn, table_name, data, parent_id, parent_table)
+        insert_data(conn, table_name, data, parent_id, parent_table, buffer)
 
 def create_metadata_views(conn):
     """
@@ -203,97 +628,714 @@ def create_metadata_views(conn):
         ORDER BY table_name
     """)
 
-def index_json(db_name, json_data, collection_name, embedder=None, qdrant_client=None):
-    """ 
-    Parses a JSON document and indexes it into DuckDB and Qdrant while maintaining
-    hierarchical relationships and schema information.
+def table_paths(conn):
     """
-    conn = create_db(db_name)
-    points = []  # Initialize points list for embeddings
-    
-    # Create schema tables
-    create_schema_tables(conn)
+    Returns the JSON path of every table's records ("jobs[]", "jobs[].usage_metrics", ...)
+    and its chain of ancestor tables up to the root table, from schema_info.
+    Child tables are named <parent table>_<key>, so the key is what follows the parent's name.
+    """
+    tables = {row[0]: (row[1], row[2]) for row in conn.execute("SELECT table_name, parent_table, is_array FROM schema_info WHERE flattened_from IS NULL").fetchall()}
+    paths, ancestors = {}, {}
+    def resolve(table_name):
+        if table_name not in paths:
+            parent_table, is_array = tables[table_name]
+            suffix = "[]" if is_array else ""
+            if parent_table is None or parent_table not in tables:
+                paths[table_name] = table_name + suffix
+                ancestors[table_name] = []
+            else:
+                paths[table_name] = f"{resolve(parent_table)}.{table_name[len(parent_table) + 1:]}{suffix}"
+                ancestors[table_name] = [parent_table] + ancestors[parent_table]
+        return paths[table_name]
+    for table_name in tables:
+        resolve(table_name)
+    return paths, ancestors
+
+def leaf_columns(conn, tables):
+    """
+    Returns the scalar columns (name, type) of each table. Nested objects and arrays are
+    also kept as JSON in their parent, but their child table holds the leaves.
+    """
+    columns = {}
+    for table_name, column_name, data_type in conn.execute("""
+        SELECT table_name, column_name, data_type FROM information_schema.columns
+        WHERE table_name IN (SELECT table_name FROM schema_info WHERE flattened_from IS NULL)
+        AND column_name NOT IN ('record_id', 'parent_id')
+        ORDER BY table_name, ordinal_position
+    """).fetchall():
+        if f"{table_name}_{column_name}" not in tables:
+            columns.setdefault(table_name, []).append((column_name, data_type))
+    return columns
+
+def changed_rows(table_name, changed=None):
+    """
+    Returns the SQL source of a table's rows: the table itself, or only its records listed
+    in the changed temp table of (table_name, record_id).
+    """
+    if changed is None:
+        return f'"{table_name}"'
+    return f"""(SELECT * FROM "{table_name}" WHERE record_id IN (SELECT record_id FROM {changed} WHERE table_name = '{table_name.replace("'", "''")}'))"""
+
+def create_wide_tables(conn, changed=None):
+    """
+    Materializes <array>_wide for every top-level array: one row per item with a column per
+    scalar reached through nested objects (named by path, e.g. "job_record.status") and a
+    LIST of STRUCTs per nested array (its scalar fields; objects and arrays nested in its
+    items are left out).
+    Nested objects hold one row per parent, so each is a LEFT JOIN on parent_id and the
+    table keeps one row per item. The tables are listed in schema_info with flattened_from.
+    With changed (a temp table of (table_name, record_id) of appended records), only the
+    rows of those top-level items are added to the existing wide tables.
+    """
+    paths, _ = table_paths(conn)
+    columns = leaf_columns(conn, paths)
+    children = {}
+    for table_name, parent_table, is_array in conn.execute(
+        "SELECT table_name, parent_table, is_array FROM schema_info WHERE flattened_from IS NULL AND parent_table IS NOT NULL ORDER BY table_name"
+    ).fetchall():
+        children.setdefault(parent_table, []).append((table_name, is_array))
     
-    # Process top-level keys
-    for key, value in json_data.items():
-        if isinstance(value, list) and all(isinstance(i, dict) for i in value):
-            # For arrays of objects (like the "jobs" array)
-            schema = set()
-            for item in value:
-                schema.update(item.keys())
-            
-            # Create a table for this array
-            create_table(
-                conn, 
-                key, 
-                schema, 
-                is_array=True, 
-                count=len(value),
-                description=f"Top-level array containing {len(value)} items"
-            )
-            
-            # Insert the array items
-            insert_data(conn, key, value)
-            
-            # Generate embeddings for the array (optional)
-            if qdrant_client and embedder:
-                for i, item in enumerate(value):
-                    item_str = json.dumps(item)
-                    embedding = embedder.embed_query(item_str)
-                    points.append(
-                        PointStruct(
-                            id=str(uuid.uuid4()), 
-                            vector=embedding, 
-                            payload={
-                                "json_path": f"{key}[{i}]", 
-                                "json_value": item_str,
-                                "table": key
-                            }
-                        )
-                    )
+    roots = conn.execute(
+        "SELECT table_name, count FROM schema_info WHERE flattened_from IS NULL AND parent_table IS NULL AND is_array ORDER BY table_name"
+    ).fetchall()
+    existing = {row[0] for row in conn.execute("SELECT table_name FROM schema_info WHERE flattened_from IS NOT NULL").fetchall()}
+    for root_table, count in roots:
+        wide_table = f"{root_table}_wide"
+        if wide_table in paths:
+            print(f"Skipping {wide_table}: a table of that name already exists")
+            continue
+        if changed is not None and wide_table not in existing:
+            continue
         
-        elif isinstance(value, dict):
-            # For objects
-            create_table(
-                conn, 
-                key, 
-                value.keys(),
-                description=f"Top-level object"
-            )
-            insert_data(conn, key, value)
-            
-            # Generate embeddings for the object (optional)
-            if qdrant_client and embedder:
-                value_str = json.dumps(value)
-                embedding = embedder.embed_query(value_str)
-                points.append(
-                    PointStruct(
-                        id=str(uuid.uuid4()), 
-                        vector=embedding, 
-                        payload={
-                            "json_path": key, 
-                            "json_value": value_str,
-                            "table": key
-                        }
+        selects = ["t0.record_id"] + [f't0."{col}"' for col, _ in columns.get(root_table, [])]
+        joins = []
+        def flatten(table_name, alias, prefix, joins, selects):
+            for child_table, is_array in children.get(table_name, []):
+                key = prefix + child_table[len(table_name) + 1:]
+                child_alias = f"t{len(joins) + 1}"
+                if is_array:
+                    fields = ", ".join([f'"{col}" := "{col}"' for col, _ in columns.get(child_table, [])])
+                    if not fields:
+                        continue
+                    joins.append(
+                        f'LEFT JOIN (SELECT parent_id, list(struct_pack({fields}) ORDER BY record_id) AS items '
+                        f'FROM {changed_rows(child_table, changed)} GROUP BY parent_id) {child_alias} ON {child_alias}.parent_id = {alias}.record_id'
                     )
-                )
+                    selects.append(f'{child_alias}.items AS "{key}"')
+                else:
+                    joins.append(f'LEFT JOIN {changed_rows(child_table, changed)} {child_alias} ON {child_alias}.parent_id = {alias}.record_id')
+                    selects.extend([f'{child_alias}."{col}" AS "{key}.{col}"' for col, _ in columns.get(child_table, [])])
+                    flatten(child_table, child_alias, key + ".", joins, selects)
+        flatten(root_table, "t0", "", joins, selects)
         
-        else:
-            # For primitive values
-            create_table(
-                conn, 
-                key, 
-                ["value"],
-                description=f"Top-level scalar value"
+        if changed is not None:
+            conn.execute(f"""
+                INSERT INTO "{wide_table}"
+                SELECT {", ".join(selects)}
+                FROM {changed_rows(root_table, changed)} t0 {" ".join(joins)}
+                ORDER BY t0.record_id
+            """)
+            conn.execute("UPDATE schema_info SET count = ? WHERE table_name = ?", (count, wide_table))
+            continue
+        
+        conn.execute(f"""
+            CREATE OR REPLACE TABLE "{wide_table}" AS
+            SELECT {", ".join(selects)}
+            FROM "{root_table}" t0 {" ".join(joins)}
+            ORDER BY t0.record_id
+        """)
+        conn.execute("""
+            INSERT OR REPLACE INTO schema_info 
+            (table_name, parent_table, description, is_array, count, flattened_from) 
+            VALUES (?, NULL, ?, TRUE, ?, ?)
+        """, (
+            wide_table,
+            f"Flattened {root_table}: one row per item (record_id = {root_table}.record_id), a column per nested value "
+            f"named by its path, LIST columns for nested arrays. Query it instead of joining the {root_table}_* tables.",
+            count,
+            root_table,
+        ))
+
+def create_leaf_index(conn, id_mode=DEFAULT_ID_MODE, changed=None):
+    """
+    Creates json_leaves: one row per scalar value in the document with the record_id of its
+    top-level record (root_id), its full JSON path (e.g. "jobs[].usage_metrics.feature_usage.pdf-pages")
+    and the value in a typed column (num_value, str_value, ts_value or bool_value).
+    Rows are sorted by path and value, so the min/max zone maps DuckDB keeps per row group
+    turn a filter like path = X AND num_value > N into a scan of a few row groups.
+    With changed (a temp table of (table_name, record_id) of appended records), only the
+    leaves of those records are added, after the sorted rows.
+    """
+    paths, ancestors = table_paths(conn)
+    columns = leaf_columns(conn, paths)
+    
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE leaf_staging (
+            root_id {ID_TYPES[id_mode]}, path TEXT, num_value DOUBLE, str_value TEXT, ts_value TIMESTAMP, bool_value BOOLEAN
+        )
+    """)
+    for table_name, table_columns in columns.items():
+        # Join up the parent chain once per table to find each record's top-level record
+        joins = ""
+        child = "t0"
+        for i, ancestor in enumerate(ancestors[table_name], 1):
+            joins += f' JOIN "{ancestor}" t{i} ON {child}.parent_id = t{i}.record_id'
+            child = f"t{i}"
+        selects = []
+        for column_name, data_type in table_columns:
+            target = LEAF_VALUE_COLUMNS.get(data_type, "str_value")
+            values = ", ".join([
+                f'CAST("{column_name}" AS {cast})' if col == target else "NULL"
+                for col, cast in LEAF_COLUMNS.items()
+            ])
+            path = f"{paths[table_name]}.{column_name}".replace("'", "''")
+            selects.append(f"""SELECT root_id, '{path}', {values} FROM records WHERE "{column_name}" IS NOT NULL""")
+        conn.execute(f"""
+            INSERT INTO leaf_staging
+            WITH records AS MATERIALIZED (SELECT {child}.record_id AS root_id, t0.* FROM {changed_rows(table_name, changed)} t0{joins})
+            {" UNION ALL ".join(selects)}
+        """)
+    
+    conn.execute(f"""
+        {"INSERT INTO json_leaves" if changed is not None else "CREATE OR REPLACE TABLE json_leaves AS"}
+        SELECT * FROM leaf_staging
+        ORDER BY path, num_value, ts_value, str_value, bool_value, root_id
+    """)
+    conn.execute("DROP TABLE leaf_staging")
+
+def open_embedding_cache(collection_name, cache_dir=EMBEDDING_CACHE_DIR):
+    """ Opens the persistent embedding cache of a collection, keyed by model and content hash. """
+    os.makedirs(cache_dir, exist_ok=True)
+    conn = duckdb.connect(os.path.join(cache_dir, f"{collection_name}.duckdb"))
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS embeddings (
+            model TEXT,
+            content_hash TEXT,
+            vector FLOAT[],
+            PRIMARY KEY (model, content_hash)
+        )
+    """)
+    return conn
+
+def create_embedding_queue(embedder, upsert, collection_name, batch_size=DEFAULT_EMBED_BATCH_SIZE, concurrency=DEFAULT_EMBED_CONCURRENCY, cache_dir=EMBEDDING_CACHE_DIR, close=None):
+    """
+    Creates the state used to embed records in batches: records wait in "pending" until
+    batch_size * concurrency of them are queued, embedded points wait in "points" until
+    a full chunk is ready for upsert(points). close() is called once everything is stored.
+    """
+    return {
+        "embedder": embedder,
+        "model": getattr(embedder, "model", type(embedder).__name__),
+        "upsert": upsert,
+        "close": close,
+        "batch_size": batch_size,
+        "concurrency": concurrency,
+        "cache": open_embedding_cache(collection_name, cache_dir) if cache_dir else None,
+        "pending": [],
+        "points": [],
+        "stats": {"records": 0, "embedded": 0, "cached": 0, "duplicates": 0, "upserted": 0},
+    }
+
+def open_vector_store(db_name, embedder, qdrant_client, collection_name, batch_size=DEFAULT_EMBED_BATCH_SIZE, concurrency=DEFAULT_EMBED_CONCURRENCY):
+    """
+    Creates the embedding queue of an index run, or None without an embedder. The embedder
+    may be given as an OpenAI model name (e.g. from another process). Points go to the given
+    Qdrant client, otherwise (with VECTOR_BACKEND=local) to the vector index stored next to
+    the database.
+    """
+    if not embedder:
+        return None
+    if isinstance(embedder, str):
+        embedder = OpenAIEmbeddings(model=embedder)
+    if qdrant_client:
+        def upsert(points):
+            qdrant_client.upsert(collection_name=collection_name, points=points)
+        return create_embedding_queue(embedder, upsert, collection_name, batch_size, concurrency)
+    if vector_index.VECTOR_BACKEND == "local":
+        writer = vector_index.create_writer(db_name)
+        return create_embedding_queue(
+            embedder, lambda points: vector_index.add_points(writer, points), collection_name, batch_size, concurrency,
+            close=lambda: vector_index.finish_writer(writer)
+        )
+    return None
+
+def embed_record(queue, json_path, table, record_id, value):
+    """ Queues a JSON value to be embedded and stored as a point linked to its record. """
+    value_str = json.dumps(value)
+    content_hash = hashlib.sha256(value_str.encode()).hexdigest()
+    queue["pending"].append((json_path, table, record_id, value_str, content_hash))
+    if len(queue["pending"]) >= queue["batch_size"] * queue["concurrency"]:
+        embed_pending(queue)
+
+def lookup_embeddings(queue, hashes):
+    """ Returns cached vectors for the given content hashes. """
+    if queue["cache"] is None or not hashes:
+        return {}
+    rows = queue["cache"].execute(
+        "SELECT content_hash, vector FROM embeddings WHERE model = ? AND content_hash IN (SELECT unnest(?))",
+        [queue["model"], hashes]
+    ).fetchall()
+    return dict(rows)
+
+def store_embeddings(queue, vectors):
+    """ Adds newly computed vectors (content hash -> vector) to the persistent cache. """
+    if queue["cache"] is None or not vectors:
+        return
+    queue["cache"].register("new_embeddings", DataFrame({"content_hash": list(vectors), "vector": list(vectors.values())}))
+    queue["cache"].execute(
+        "INSERT OR REPLACE INTO embeddings SELECT ?, content_hash, CAST(vector AS FLOAT[]) FROM new_embeddings",
+        [queue["model"]]
+    )
+    queue["cache"].unregister("new_embeddings")
+
+def embed_pending(queue):
+    """
+    Embeds the queued records. Vectors come from the cache where possible; the rest are
+    deduplicated and embedded with embed_documents in batches, several batches at a time.
+    """
+    pending, queue["pending"] = queue["pending"], []
+    if not pending:
+        return
+    
+    vectors = lookup_embeddings(queue, list({record[4] for record in pending}))
+    cached = sum(1 for record in pending if record[4] in vectors)
+    missing = {}
+    for _, _, _, value_str, content_hash in pending:
+        if content_hash not in vectors:
+            missing.setdefault(content_hash, value_str)
+    
+    if missing:
+        hashes = list(missing)
+        batches = [hashes[i:i + queue["batch_size"]] for i in range(0, len(hashes), queue["batch_size"])]
+        with ThreadPoolExecutor(max_workers=queue["concurrency"]) as executor:
+            results = executor.map(lambda batch: queue["embedder"].embed_documents([missing[h] for h in batch]), batches)
+            computed = {h: vector for batch, batch_vectors in zip(batches, results, strict=True) for h, vector in zip(batch, batch_vectors, strict=True)}
+        store_embeddings(queue, computed)
+        vectors.update(computed)
+    
+    for json_path, table, record_id, value_str, content_hash in pending:
+        queue["points"].append(
+            PointStruct(
+                id=str(uuid.uuid4()), 
+                vector=list(vectors[content_hash]), 
+                payload={
+                    "json_path": json_path, 
+                    "json_value": value_str,
+                    "table": table,
+                    "record_id": record_id
+                }
             )
-            insert_data(conn, key, {"value": value})
+        )
+    
+    stats = queue["stats"]
+    stats["records"] += len(pending)
+    stats["embedded"] += len(missing)
+    stats["cached"] += cached
+    stats["duplicates"] += len(pending) - cached - len(missing)
+    
+    if len(queue["points"]) >= UPSERT_BATCH_SIZE:
+        upsert_points(queue, full_chunks_only=True)
+
+def upsert_points(queue, full_chunks_only=False):
+    """ Upserts embedded points to the vector store in chunks of UPSERT_BATCH_SIZE. """
+    points = queue["points"]
+    end = len(points) - len(points) % UPSERT_BATCH_SIZE if full_chunks_only else len(points)
+    for start in range(0, end, UPSERT_BATCH_SIZE):
+        chunk = points[start:min(start + UPSERT_BATCH_SIZE, end)]
+        queue["upsert"](chunk)
+        queue["stats"]["upserted"] += len(chunk)
+    queue["points"] = points[end:]
+
+def flush_embeddings(queue):
+    """ Embeds and upserts everything still queued and closes the cache. """
+    embed_pending(queue)
+    upsert_points(queue)
+    if queue["close"] is not None:
+        queue["close"]()
+    if queue["cache"] is not None:
+        queue["cache"].close()
+    stats = queue["stats"]
+    print(f"Embedded {stats['records']} records ({stats['embedded']} new, {stats['cached']} cached, {stats['duplicates']} duplicates), upserted {stats['upserted']} points")
+
+def key_item(buffer, table_name, item, position, text=None):
+    """
+    Returns the natural key and content hash of a top-level item. The key is the value at
+    the table's path in the buffer's natural_keys (e.g. "job_record.id"), or the item's
+    position if the table has none. Items without the key, or repeating a key seen earlier
+    in the file, fall back to <key>#<position>. The hash is of the item's source text if
+    given, which saves serializing it again.
+    """
+    content_hash = hashlib.sha256((text if text is not None else json.dumps(item)).encode()).hexdigest()
+    key_path = buffer["natural_keys"].get(table_name)
+    if key_path:
+        key = item
+        for part in key_path.split("."):
+            key = key.get(part) if isinstance(key, dict) else None
+        key = None if key is None else json.dumps(key) if isinstance(key, (dict, list)) else str(key)
+    else:
+        key = str(position)
+    seen = buffer["seen_keys"].setdefault(table_name, set())
+    if key is None or key in seen:
+        key = f"{key or ''}#{position}"
+    seen.add(key)
+    return key, content_hash
+
+def record_item_key(conn, buffer, table_name, key, content_hash, record_id, position):
+    """
+    Buffers the item_keys row linking a top-level item's natural key to its record and
+    its position in the file.
+    """
+    buffer_rows(conn, buffer, "item_keys", [{
+        "table_name": table_name,
+        "key_path": buffer["natural_keys"].get(table_name),
+        "natural_key": key,
+        "record_id": record_id,
+        "content_hash": content_hash,
+        "position": position,
+    }])
+
+def index_section(conn, buffer, key, value, embeddings=None):
+    """
+    Indexes one fully materialized top-level key of the JSON document.
+    """
+    if isinstance(value, list):
+        # For arrays (like the "jobs" array); non-object items are stored in a "value"
+        # column, one row per item, as in index_array_stream
+        items = [item if isinstance(item, dict) else {"value": item} for item in value]
+        schema = {}
+        for item in items:
+            schema.update(dict.fromkeys(item.keys()))
+        
+        # Create a table for this array
+        create_table(
+            conn, 
+            key, 
+            schema, 
+            is_array=True, 
+            count=len(items),
+            description=f"Top-level array containing {len(items)} items",
+            buffer=buffer
+        )
+        
+        # Insert the array items
+        record_ids = insert_data(conn, key, items, buffer=buffer)
+        if buffer["natural_keys"] is not None:
+            for i, item in enumerate(items):
+                record_item_key(conn, buffer, key, *key_item(buffer, key, item, i), record_ids[i], i)
+        
+        # Generate embeddings for the array (optional)
+        if embeddings:
+            for i, item in enumerate(items):
+                embed_record(embeddings, f"{key}[{i}]", key, record_ids[i], item)
+    
+    elif isinstance(value, dict):
+        # For objects
+        create_table(
+            conn, 
+            key, 
+            value.keys(),
+            description=f"Top-level object",
+            buffer=buffer
+        )
+        record_id = insert_data(conn, key, value, buffer=buffer)
+        if buffer["natural_keys"] is not None:
+            record_item_key(conn, buffer, key, *key_item(buffer, key, value, 0), record_id, 0)
+        
+        # Generate embeddings for the object (optional)
+        if embeddings:
+            embed_record(embeddings, key, key, record_id, value)
+    
+    else:
+        # For primitive values
+        create_table(
+            conn, 
+            key, 
+            ["value"],
+            description=f"Top-level scalar value",
+            buffer=buffer
+        )
+        record_id = insert_data(conn, key, {"value": value}, buffer=buffer)
+        if buffer["natural_keys"] is not None:
+            record_item_key(conn, buffer, key, *key_item(buffer, key, value, 0), record_id, 0)
+
+def index_array_stream(conn, buffer, key, items, embeddings=None):
+    """
+    Indexes a top-level array one item at a time, so only the current item and the
+    buffered rows are held in memory. Non-object items are stored in a "value" column.
+    With natural keys in the buffer, items are (item, source text) pairs.
+    """
+    # Register the table before its children so schema_info keeps document order
+    create_table(conn, key, [], is_array=True, buffer=buffer)
+    
+    count = 0
+    for i, item in enumerate(items):
+        if buffer["natural_keys"] is not None:
+            item, text = item
+        if not isinstance(item, dict):
+            item = {"value": item}
+        
+        register_columns(buffer, key, item.keys())
+        record_id = insert_data(conn, key, item, buffer=buffer)
+        if buffer["natural_keys"] is not None:
+            record_item_key(conn, buffer, key, *key_item(buffer, key, item, i, text), record_id, i)
+        
+        # Generate embeddings for the item (optional)
+        if embeddings:
+            embed_record(embeddings, f"{key}[{i}]", key, record_id, item)
+        count += 1
+    
+    # The item count is only known once the array has been consumed
+    create_table(
+        conn, 
+        key, 
+        [], 
+        is_array=True, 
+        count=count,
+        description=f"Top-level array containing {count} items",
+        buffer=buffer
+    )
+
+def iter_json_sections(file_path, chunk_size=STREAM_CHUNK_SIZE, with_text=False, blocks=None, known_blocks=None):
+    """
+    Incrementally parses a JSON document whose root is an object and yields
+    (key, value) pairs for its top-level keys without loading the whole file.
+    
+    Array values are yielded as generators that decode one item at a time and must
+    be consumed before advancing to the next key (unconsumed items are skipped).
+    With with_text, they yield (item, source text) pairs instead.
+    All other values are decoded and yielded as Python objects.
+    
+    With blocks (a dict), the source text of every array is also cut into blocks of
+    about ITEM_BLOCK_CHARS characters, each running from the end of the item before it
+    to the end of its last item: blocks[key] lists their (first_position, item_count,
+    text_length, content_hash). Given the blocks of an earlier version of the file as
+    known_blocks, a block whose text is unchanged is not decoded; the array yields
+    (SKIPPED_ITEMS, item_count) in place of its items.
+    """
+    with open(file_path, "r", encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        # Start of the block text still needed while reading an array with blocks
+        mark = None
+        eof = False
+        
+        def fill():
+            # Read more input, keeping the unconsumed tail; grow reads for large values
+            nonlocal buf, pos, mark, eof
+            keep = pos if mark is None else min(pos, mark)
+            chunk = f.read(max(chunk_size, len(buf) - keep))
+            if not chunk:
+                eof = True
+                return False
+            buf = buf[keep:] + chunk
+            pos -= keep
+            if mark is not None:
+                mark -= keep
+            return True
+        
+        def peek():
+            # Skip whitespace and return the next character ("" at end of file)
+            nonlocal pos
+            while True:
+                pos = WHITESPACE.match(buf, pos).end()
+                if pos < len(buf) or not fill():
+                    return buf[pos:pos + 1]
+        
+        def expect(char):
+            nonlocal pos
+            if peek() != char:
+                raise ValueError(f"Malformed JSON in {file_path}: expected '{char}'")
+            pos += 1
+        
+        def decode_value(text=False):
+            nonlocal pos
+            while True:
+                peek()
+                try:
+                    value, end = DECODER.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    # The value may be cut off at the end of the buffer
+                    if fill():
+                        continue
+                    raise
+                # A number running up to the buffer end may continue in the next chunk
+                if isinstance(value, (int, float)) and NUMBER_TAIL.match(buf, end).end() == len(buf) and not eof and fill():
+                    continue
+                start, pos = pos, end
+                return (value, buf[start:end]) if text else value
+        
+        def skip_block(length, content_hash):
+            # Step over a known block if the text at mark is the same; it must end with an item
+            nonlocal pos
+            while len(buf) - mark < length and fill():
+                pass
+            if hashlib.sha256(buf[mark:mark + length].encode()).hexdigest() != content_hash:
+                return False
+            pos = mark + length
+            matched = peek() in (",", "]")
+            # Leave the whitespace after the block to the text of the next one
+            pos = mark + length if matched else mark
+            return matched
+        
+        def iter_array(key):
+            nonlocal pos, mark
+            expect("[")
+            if peek() == "]":
+                pos += 1
+                return
+            tracked = blocks is not None or known_blocks is not None
+            recorded = blocks.setdefault(key, []) if blocks is not None else []
+            known = (known_blocks or {}).get(key, [])
+            next_known = 0
+            block = None
+            position = 0
+            if tracked:
+                mark = pos
+            try:
+                while True:
+                    while next_known < len(known) and known[next_known][0] < position:
+                        next_known += 1
+                    if next_known < len(known) and known[next_known][0] == position and skip_block(*known[next_known][2:]):
+                        if block is not None:
+                            recorded.append((block[0], block[1], block[2], block[3].hexdigest()))
+                            block = None
+                        recorded.append(known[next_known])
+                        count = known[next_known][1]
+                        mark = pos
+                        position += count
+                        yield SKIPPED_ITEMS, count
+                    else:
+                        value = decode_value(with_text)
+                        if tracked:
+                            text = buf[mark:pos]
+                            if block is None:
+                                block = [position, 0, 0, hashlib.sha256()]
+                            block[1] += 1
+                            block[2] += len(text)
+                            block[3].update(text.encode())
+                            if block[2] >= ITEM_BLOCK_CHARS:
+                                recorded.append((block[0], block[1], block[2], block[3].hexdigest()))
+                                block = None
+                            mark = pos
+                        position += 1
+                        yield value
+                    char = peek()
+                    pos += 1
+                    if char == "]":
+                        break
+                    if char != ",":
+                        raise ValueError(f"Malformed JSON in {file_path}: expected ',' or ']'")
+                if block is not None:
+                    recorded.append((block[0], block[1], block[2], block[3].hexdigest()))
+            finally:
+                mark = None
+        
+        expect("{")
+        if peek() == "}":
+            return
+        while True:
+            key = decode_value()
+            expect(":")
+            if peek() == "[":
+                items = iter_array(key)
+                yield key, items
+                for _ in items:
+                    pass
+            else:
+                yield key, decode_value()
+            
+            char = peek()
+            pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError(f"Malformed JSON in {file_path}: expected ',' or '}}'")
+
+def encode_table_names(conn):
+    """
+    Stores the table names in record_relationships as an ENUM of all indexed tables,
+    so each edge costs a small integer instead of two strings.
+    """
+    # Rebuild the type so it covers tables added since it was last created
+    decode_table_names(conn)
+    conn.execute("CREATE TYPE json_table AS ENUM (SELECT table_name FROM schema_info ORDER BY table_name)")
+    conn.execute("ALTER TABLE record_relationships ALTER child_table TYPE json_table")
+    conn.execute("ALTER TABLE record_relationships ALTER parent_table TYPE json_table")
+
+def encoded_table_names(conn):
+    """ Returns the table names in the json_table ENUM, or None if they are stored as text. """
+    row = conn.execute("SELECT labels FROM duckdb_types() WHERE type_name = 'json_table'").fetchone()
+    return set(row[0]) if row else None
+
+def decode_table_names(conn):
+    """ Stores the table names in record_relationships as text again and drops the json_table ENUM. """
+    if conn.execute("SELECT 1 FROM duckdb_types() WHERE type_name = 'json_table'").fetchone():
+        conn.execute("ALTER TABLE record_relationships ALTER child_table TYPE TEXT")
+        conn.execute("ALTER TABLE record_relationships ALTER parent_table TYPE TEXT")
+        conn.execute("DROP TYPE json_table")
+
+def render_prompt_context(conn):
+    """
+    Renders the hierarchy, statistics and overview text that is put into agent prompts.
+    Only reads from the metadata views, so it also works on read-only connections.
+    """
+    hierarchy = conn.execute("SELECT level, path, table_name, is_array, count FROM table_hierarchy ORDER BY path").fetchall()
+    hierarchy_str = "\n".join([f"- Level {row[0]}: {row[1]} (Array: {row[3]}, Count: {row[4]})" for row in hierarchy])
+    
+    stats = conn.execute("SELECT table_name, expected_count FROM table_statistics ORDER BY expected_count DESC").fetchall()
+    stats_str = "\n".join([f"- {row[0]}: {row[1]} records" for row in stats])
+    
+    overview = "No overview available"
+    try:
+        overview_result = conn.execute("SELECT * FROM data_overview").fetchall()
+        if overview_result:
+            overview = "\n".join([str(col) for col in overview_result[0]])
+    except duckdb.Error:
+        pass
+    
+    return {"hierarchy": hierarchy_str, "statistics": stats_str, "overview": overview}
+
+def store_prompt_context(conn):
+    """
+    Stores the rendered prompt context with a fresh ingestion version, so servers can
+    cache it per version and only re-read it when the database is rebuilt.
+    """
+    context = render_prompt_context(conn)
+    conn.execute("""
+        CREATE OR REPLACE TABLE prompt_context (
+            ingestion_version TEXT,
+            hierarchy TEXT,
+            statistics TEXT,
+            overview TEXT,
+            built_at TIMESTAMP
+        )
+    """)
+    conn.execute(
+        "INSERT INTO prompt_context VALUES (?, ?, ?, ?, now())",
+        (uuid.uuid4().hex, context["hierarchy"], context["statistics"], context["overview"])
+    )
+
+def finalize_index(conn, buffer, db_name, embeddings=None, wide_tables=DEFAULT_WIDE_TABLES):
+    """
+    Flushes buffered rows, creates the metadata views, the leaf and text indexes and
+    (optionally) the wide tables, and stores embeddings.
+    """
+    # Bulk load whatever is still buffered
+    flush_buffer(conn, buffer)
+    if wide_tables:
+        create_wide_tables(conn)
+    encode_table_names(conn)
     
     # Create metadata views to help the LLM understand the data structure
     create_metadata_views(conn)
     
-    # Store embeddings in Qdrant if available
-    if qdrant_client and points:
-        qdrant_client.upsert(collection_name=collection_name, points=points)
+    # Index every scalar value by JSON path, and string values for keyword search
+    create_leaf_index(conn, buffer["id_mode"])
+    text_index.create_text_index(conn)
+    
+    # Store the remaining embeddings in the vector store if available
+    if embeddings:
+        flush_embeddings(embeddings)
     
     # Create a special view for the LLM to understand the data structure
     conn.execute("""
@@ -302,10 +1344,660 @@ def index_json(db_name, json_data, collection_name, embedder=None, qdrant_client
             'This database contains ' || COUNT(DISTINCT table_name) || ' tables representing a JSON document.' AS overview,
             (SELECT s.count FROM schema_info s WHERE s.table_name = 'jobs') || ' jobs are stored in the "jobs" table.' AS job_count,
             'Use the table_hierarchy and table_statistics views to understand the data structure.' AS hint,
-            'IMPORTANT: The jobs table contains the original array items. Nested objects are stored in separate tables with relationships.' AS data_structure_hint
+            'IMPORTANT: The jobs table contains the original array items. Nested objects are stored in separate tables; join a child table to its parent with child.parent_id = parent.record_id.' AS data_structure_hint,
+            'To filter top-level records by a nested value without joins, use json_leaves (root_id, path, num_value, str_value, ts_value, bool_value), e.g. path = ''jobs[].usage_metrics.feature_usage.pdf-pages'' AND num_value > 10.' AS leaf_index_hint
         FROM schema_info
     """)
     
+    # Precompute the prompt context so agent requests don't have to query for it
+    store_prompt_context(conn)
+    
     conn.commit()
     conn.close()
     print(f"Indexed JSON into {db_name}.duckdb with hierarchical structure preserved")
+
+def hash_file(file_path, chunk_size=STREAM_CHUNK_SIZE):
+    """ Computes the SHA-256 of a file without reading it into memory at once. """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def write_manifest(conn, file_path, content_hash=None):
+    """
+    Records the source file, its size, mtime and content hash in the database so
+    later runs can tell whether it needs to be re-indexed.
+    """
+    stat = os.stat(file_path)
+    conn.execute("""
+        INSERT OR REPLACE INTO ingestion_manifest 
+        (source_path, size, mtime, content_hash, schema_version, indexed_at) 
+        VALUES (?, ?, ?, ?, ?, now())
+    """, (os.path.abspath(file_path), stat.st_size, stat.st_mtime, content_hash or hash_file(file_path), SCHEMA_VERSION))
+
+def write_item_blocks(conn, blocks):
+    """
+    Replaces the recorded blocks of array text (see iter_json_sections) with those of
+    the file just indexed, so the next append can skip the unchanged ones.
+    """
+    rows = [(table_name, *block) for table_name, table_blocks in blocks.items() for block in table_blocks]
+    conn.register("item_block_batch", DataFrame(
+        rows, columns=["table_name", "first_position", "item_count", "text_length", "content_hash"]
+    ).astype({"table_name": object, "first_position": "int64", "item_count": "int64", "text_length": "int64", "content_hash": object}))
+    try:
+        conn.execute("DELETE FROM item_blocks")
+        conn.execute("INSERT INTO item_blocks SELECT * FROM item_block_batch")
+    finally:
+        conn.unregister("item_block_batch")
+
+def read_manifest(db_name):
+    """
+    Returns the manifest entries of an indexed database keyed by source path,
+    or None if the database does not exist or predates the manifest.
+    """
+    if not os.path.exists(f"{db_name}.duckdb"):
+        return None
+    try:
+        conn = duckdb.connect(f"{db_name}.duckdb", read_only=True)
+    except duckdb.Error:
+        return None
+    try:
+        rows = conn.execute("SELECT source_path, size, mtime, content_hash, schema_version FROM ingestion_manifest").fetchall()
+    except duckdb.Error:
+        return None
+    finally:
+        conn.close()
+    return {row[0]: {"size": row[1], "mtime": row[2], "content_hash": row[3], "schema_version": row[4]} for row in rows}
+
+def remove_db(db_name):
+    """ Deletes a database file, its write-ahead log and its vector index. """
+    for path in (f"{db_name}.duckdb", f"{db_name}.duckdb.wal"):
+        if os.path.exists(path):
+            os.remove(path)
+    vector_index.remove_index(db_name)
+
+def export_database(db_name, export_dir, file_size=EXPORT_FILE_SIZE):
+    """
+    Exports an indexed database to zstd-compressed Parquet: one directory per table under
+    export_dir/tables (split into files of about file_size, or per EXPORT_PARTITIONS value),
+    the vector index if there is one, and manifest.json describing tables, columns, row
+    counts, views and the source files. The export replaces export_dir once complete.
+    Returns the manifest.
+    """
+    conn = duckdb.connect(f"{db_name}.duckdb", read_only=True)
+    staging = f"{export_dir}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(os.path.join(staging, "tables"))
+    
+    tables = {}
+    try:
+        for table_name, table_sql in conn.execute("SELECT table_name, sql FROM duckdb_tables() WHERE schema_name = 'main' ORDER BY table_name").fetchall():
+            columns = conn.execute(
+                "SELECT column_name, data_type FROM duckdb_columns() WHERE schema_name = 'main' AND table_name = ? ORDER BY column_index",
+                [table_name]
+            ).fetchall()
+            # ENUM columns (e.g. the table names in record_relationships) are exported as text
+            columns = [(col, "VARCHAR" if data_type.startswith("ENUM") else data_type) for col, data_type in columns]
+            select = ", ".join([f'"{col}"::{data_type} AS "{col}"' if data_type == "VARCHAR" else f'"{col}"' for col, data_type in columns])
+            
+            directory = os.path.join("tables", quote(table_name, safe=""))
+            partition = EXPORT_PARTITIONS.get(table_name)
+            options = f'PARTITION_BY ("{partition}")' if partition else f"FILE_SIZE_BYTES '{file_size}'"
+            target = os.path.join(staging, directory).replace("'", "''")
+            conn.execute(f"""COPY (SELECT {select} FROM "{table_name}") TO '{target}' (FORMAT parquet, COMPRESSION zstd, {options})""")
+            
+            files = sorted(
+                os.path.relpath(os.path.join(root, name), os.path.join(staging, directory))
+                for root, _, names in os.walk(os.path.join(staging, directory)) for name in names
+            )
+            tables[table_name] = {
+                "directory": directory,
+                "files": files,
+                "partition_by": partition,
+                "columns": columns,
+                "rows": conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0],
+                "sql": table_sql,
+            }
+        
+        views = [row[0] for row in conn.execute("SELECT sql FROM duckdb_views() WHERE NOT internal AND schema_name = 'main' ORDER BY view_name").fetchall()]
+        sources = [
+            {"source_path": row[0], "size": row[1], "content_hash": row[2]}
+            for row in conn.execute("SELECT source_path, size, content_hash FROM ingestion_manifest").fetchall()
+        ]
+        version = conn.execute("SELECT ingestion_version FROM prompt_context").fetchone()
+    finally:
+        conn.close()
+    
+    if os.path.exists(os.path.join(vector_index.index_dir(db_name), "index.json")):
+        shutil.copytree(vector_index.index_dir(db_name), os.path.join(staging, "vectors"))
+    
+    manifest = {
+        "format_version": EXPORT_FORMAT_VERSION,
+        "schema_version": SCHEMA_VERSION,
+        "ingestion_version": version[0] if version else None,
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+        "sources": sources,
+        "tables": tables,
+        "views": views,
+    }
+    with open(os.path.join(staging, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    
+    shutil.rmtree(export_dir, ignore_errors=True)
+    os.rename(staging, export_dir)
+    print(f"Exported {len(tables)} tables of {db_name}.duckdb to {export_dir}")
+    return manifest
+
+def read_export_manifest(export_dir):
+    """ Returns the manifest of a Parquet export, or None if there is no usable export. """
+    try:
+        with open(os.path.join(export_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("format_version") != EXPORT_FORMAT_VERSION or manifest.get("schema_version") != SCHEMA_VERSION:
+        return None
+    return manifest
+
+def load_exported_database(db_name, export_dir, source_path=None, materialize=False):
+    """
+    Creates {db_name}.duckdb from a Parquet export without parsing any JSON. Tables are
+    views over read_parquet of the exported files (or copied in with materialize), the
+    small EXPORT_LOCAL_TABLES are always copied, and the metadata views are recreated.
+    The exported vector index is linked as the database's index. With source_path, the
+    ingestion manifest records that local file instead of the exporting machine's path.
+    """
+    manifest = read_export_manifest(export_dir)
+    if manifest is None:
+        raise ValueError(f"{export_dir} is not a Parquet export of schema version {SCHEMA_VERSION}")
+    export_dir = os.path.abspath(export_dir)
+    
+    staging = f"{db_name}.duckdb.tmp"
+    if os.path.exists(staging):
+        os.remove(staging)
+    conn = duckdb.connect(staging)
+    try:
+        for table_name, table in manifest["tables"].items():
+            column_list = ", ".join([f'"{col}"' for col, _ in table["columns"]])
+            if table["files"]:
+                pattern = os.path.join(export_dir, table["directory"], "**" if table["partition_by"] else "", "*.parquet").replace("'", "''")
+                source = f"""SELECT {column_list} FROM read_parquet('{pattern}', hive_partitioning = {bool(table["partition_by"])})"""
+            else:
+                # A partitioned table without rows has no files to read
+                source = "SELECT " + ", ".join([f'NULL::{data_type} AS "{col}"' for col, data_type in table["columns"]]) + " WHERE false"
+            if table_name in EXPORT_LOCAL_TABLES:
+                # Recreated with their constraints, since ingestion updates them in place
+                conn.execute(table["sql"])
+                conn.execute(f'INSERT INTO "{table_name}" {source}')
+            else:
+                conn.execute(f'CREATE {"TABLE" if materialize else "VIEW"} "{table_name}" AS {source}')
+        
+        for view_sql in manifest["views"]:
+            conn.execute(view_sql)
+        
+        if source_path and "ingestion_manifest" in manifest["tables"]:
+            content_hash = manifest["sources"][0]["content_hash"] if manifest["sources"] else None
+            conn.execute("DELETE FROM ingestion_manifest")
+            write_manifest(conn, source_path, content_hash)
+        conn.commit()
+    finally:
+        conn.close()
+    
+    remove_db(db_name)
+    os.rename(staging, f"{db_name}.duckdb")
+    if os.path.isdir(os.path.join(export_dir, "vectors")):
+        os.symlink(os.path.join(export_dir, "vectors"), vector_index.index_dir(db_name))
+    print(f"Loaded {db_name}.duckdb from {export_dir} ({'tables' if materialize else 'read_parquet views'})")
+    return manifest
+
+def read_natural_keys(db_name):
+    """
+    Returns the natural key path recorded for each top-level table of a database (None for
+    tables keyed by position), or None if it cannot be appended to: it does not exist, was
+    indexed without natural keys or was loaded from a Parquet export.
+    """
+    if not os.path.exists(f"{db_name}.duckdb"):
+        return None
+    try:
+        conn = duckdb.connect(f"{db_name}.duckdb", read_only=True)
+    except duckdb.Error:
+        return None
+    try:
+        # Exported databases read their data through views
+        if not conn.execute("SELECT 1 FROM duckdb_tables() WHERE schema_name = 'main' AND table_name = 'item_keys'").fetchone():
+            return None
+        return dict(conn.execute("SELECT DISTINCT table_name, key_path FROM item_keys").fetchall())
+    finally:
+        conn.close()
+
+def create_record_table(conn, name, records, id_mode):
+    """ Creates the temp table name of (table_name, record_id) from a list of pairs. """
+    conn.register("record_batch", DataFrame({
+        "table_name": [table_name for table_name, _ in records],
+        "record_id": [str(record_id) for _, record_id in records],
+    }, dtype=object))
+    try:
+        conn.execute(f"""
+            CREATE OR REPLACE TEMP TABLE {name} AS
+            SELECT table_name::TEXT AS table_name, record_id::{ID_TYPES[id_mode]} AS record_id FROM record_batch
+        """)
+    finally:
+        conn.unregister("record_batch")
+
+def collect_records(conn, roots, target):
+    """
+    Creates the temp table target holding the top-level records in the roots temp table and
+    every record nested in them, walking down the tables one level at a time.
+    """
+    _, ancestors = table_paths(conn)
+    conn.execute(f"CREATE OR REPLACE TEMP TABLE {target} AS SELECT table_name, record_id FROM {roots}")
+    for table_name in sorted(ancestors, key=lambda name: len(ancestors[name])):
+        if ancestors[table_name]:
+            conn.execute(f"""
+                INSERT INTO {target}
+                SELECT ?, record_id FROM "{table_name}"
+                WHERE parent_id IN (SELECT record_id FROM {target} WHERE table_name = ?)
+            """, [table_name, ancestors[table_name][0]])
+
+def delete_records(conn, roots, records):
+    """
+    Deletes top-level items with everything derived from them: the rows in the records temp
+    table (the items in roots and their nested records), their relationships, item keys,
+    leaves, text leaves and wide table rows.
+    """
+    paths, ancestors = table_paths(conn)
+    for (table_name,) in conn.execute(f"SELECT DISTINCT table_name FROM {records}").fetchall():
+        conn.execute(f'DELETE FROM "{table_name}" WHERE record_id IN (SELECT record_id FROM {records} WHERE table_name = ?)', [table_name])
+    conn.execute(f"DELETE FROM record_relationships r USING {records} d WHERE r.child_table::TEXT = d.table_name AND r.child_id = d.record_id")
+    conn.execute(f"DELETE FROM item_keys k USING {roots} d WHERE k.table_name = d.table_name AND k.record_id = d.record_id")
+    
+    wide_tables = dict(conn.execute("SELECT flattened_from, table_name FROM schema_info WHERE flattened_from IS NOT NULL").fetchall())
+    for table_name in paths:
+        if ancestors[table_name]:
+            continue
+        conn.execute(
+            f"DELETE FROM json_leaves WHERE root_id IN (SELECT record_id FROM {roots} WHERE table_name = ?) AND starts_with(path, ?)",
+            [table_name, paths[table_name] + "."]
+        )
+        if table_name in wide_tables:
+            conn.execute(f'DELETE FROM "{wide_tables[table_name]}" WHERE record_id IN (SELECT record_id FROM {roots} WHERE table_name = ?)', [table_name])
+    text_index.remove_text_leaves(conn, records)
+
+def table_columns(conn):
+    """ Returns the type of every column of the indexed tables, keyed by (table, column). """
+    return {
+        (row[0], row[1]): row[2]
+        for row in conn.execute("""
+            SELECT table_name, column_name, data_type FROM information_schema.columns
+            WHERE table_name IN (SELECT table_name FROM schema_info WHERE flattened_from IS NULL)
+        """).fetchall()
+    }
+
+def update_item_positions(conn, unchanged, kept):
+    """
+    Moves the item_keys of unchanged items that were read again, given as (table_name,
+    natural_key, position), to their position in the new file. Items in the kept blocks,
+    given as (table_name, first_position, item_count), were skipped as unchanged and stay
+    where they are; all other items are missing from the file and lose their position.
+    """
+    conn.register("item_position_batch", DataFrame({
+        "table_name": [table_name for table_name, _, _ in unchanged],
+        "natural_key": [natural_key for _, natural_key, _ in unchanged],
+        "position": [position for _, _, position in unchanged],
+    }).astype({"table_name": object, "natural_key": object, "position": "int64"}))
+    register_kept_blocks(conn, kept)
+    try:
+        # The ASOF join finds the only kept block an item can be in, the last one starting before it
+        conn.execute("""
+            UPDATE item_keys k SET position = NULL
+            FROM (
+                SELECT i.table_name, i.natural_key FROM item_keys i
+                ASOF LEFT JOIN kept_blocks b ON b.table_name = i.table_name::TEXT AND i.position >= b.first_position
+                WHERE i.position IS NOT NULL AND (b.first_position IS NULL OR i.position >= b.first_position + b.item_count)
+            ) m
+            WHERE m.table_name = k.table_name AND m.natural_key = k.natural_key AND NOT EXISTS (
+                SELECT 1 FROM item_position_batch p WHERE p.table_name = k.table_name::TEXT AND p.natural_key = k.natural_key
+            )
+        """)
+        conn.execute("""
+            UPDATE item_keys k SET position = p.position
+            FROM item_position_batch p
+            WHERE p.table_name = k.table_name::TEXT AND p.natural_key = k.natural_key AND k.position IS DISTINCT FROM p.position
+        """)
+    finally:
+        conn.unregister("item_position_batch")
+        conn.unregister("kept_blocks")
+
+def register_kept_blocks(conn, kept):
+    """ Registers the kept_blocks view of (table_name, first_position, item_count) rows. """
+    conn.register("kept_blocks", DataFrame({
+        "table_name": [table_name for table_name, _, _ in kept],
+        "first_position": [first_position for _, first_position, _ in kept],
+        "item_count": [item_count for _, _, item_count in kept],
+    }).astype({"table_name": object, "first_position": "int64", "item_count": "int64"}))
+
+def read_items(conn, buffer, file_path, spill, known_blocks):
+    """
+    Reads the top-level items of a new version of an indexed file for append_json_file.
+    Blocks of array items whose text is unchanged since it was indexed (known_blocks, see
+    iter_json_sections) are skipped; every other item is keyed (see key_item), written to
+    spill as a JSON line of [table_name, is_array, item] and looked up in item_keys.
+    
+    Returns the skipped blocks as (table_name, first_position, item_count), the blocks of
+    the new file and, per spilled item, (table_name, natural_key, content_hash, position,
+    record_id, indexed content_hash), the last two None for new items. Returns None if an
+    item that was read took the natural key of a skipped one, which key_item did not see
+    and so could not tell apart.
+    """
+    kept = []
+    blocks = {}
+    items = []
+    for key, value in iter_json_sections(file_path, with_text=True, blocks=blocks, known_blocks=known_blocks):
+        is_array = isinstance(value, GeneratorType)
+        position = 0
+        for item, text in (value if is_array else [(value, None)]):
+            if item is SKIPPED_ITEMS:
+                kept.append((key, position, text))
+                position += text
+                continue
+            if is_array and not isinstance(item, dict):
+                item = {"value": item}
+            natural_key, item_hash = key_item(buffer, key, item, position, text)
+            items.append((key, natural_key, item_hash, position))
+            spill.write(json.dumps([key, is_array, item]) + "\n")
+            position += 1
+    
+    conn.register("read_item_batch", DataFrame({
+        "seq": range(len(items)),
+        "table_name": [table_name for table_name, _, _, _ in items],
+        "natural_key": [natural_key for _, natural_key, _, _ in items],
+    }).astype({"seq": "int64", "table_name": object, "natural_key": object}))
+    register_kept_blocks(conn, kept)
+    try:
+        rows = conn.execute("""
+            SELECT r.seq, k.record_id::TEXT, k.content_hash, EXISTS (
+                SELECT 1 FROM kept_blocks b
+                WHERE b.table_name = k.table_name::TEXT AND k.position >= b.first_position AND k.position < b.first_position + b.item_count
+            )
+            FROM read_item_batch r JOIN item_keys k ON k.table_name::TEXT = r.table_name AND k.natural_key = r.natural_key
+        """).fetchall()
+    finally:
+        conn.unregister("read_item_batch")
+        conn.unregister("kept_blocks")
+    if any(row[3] for row in rows):
+        return None
+    
+    known = {seq: (record_id, content_hash) for seq, record_id, content_hash, _ in rows}
+    items = [item + known.get(seq, (None, None)) for seq, item in enumerate(items)]
+    return kept, blocks, items
+
+def append_json_file(db_name, file_path, natural_keys, batch_size=DEFAULT_BATCH_SIZE, content_hash=None):
+    """
+    Brings a database up to date with a grown or edited version of its JSON file without
+    rebuilding it. Top-level items are matched to the indexed ones by natural key (see
+    key_item), and only new items and items whose content changed are inserted, with their
+    nested children; a changed item keeps its record_id and its old rows are deleted.
+    Items missing from the file are kept. New keys add columns with ALTER TABLE ADD COLUMN
+    and new nested objects add tables. json_leaves, the text index and the wide tables are
+    updated for the affected items only, and the array counts in schema_info, the item
+    positions in item_keys, the item blocks, the prompt context and the manifest are
+    refreshed.
+    
+    Array items are read in blocks recorded when the file was indexed (see
+    iter_json_sections): a block whose text is unchanged is only hashed, not decoded, and
+    its items keep their rows and positions. The other items, typically the edited ones
+    and the appended tail, are decoded, keyed and looked up in item_keys. If one of them
+    takes the natural key of a skipped item, the file is read again without skipping.
+    
+    Deletions and insertions are committed separately (DuckDB cannot alter a table after
+    deleting from it in the same transaction). If the insertions fail, the changed items
+    are missing from the database and sync_json_file rebuilds it from the file.
+    Returns the number of new and changed items.
+    """
+    conn = duckdb.connect(f"{db_name}.duckdb")
+    try:
+        id_type = conn.execute("SELECT data_type FROM information_schema.columns WHERE table_name = 'item_keys' AND column_name = 'record_id'").fetchone()[0]
+        id_mode = next(mode for mode, type_name in ID_TYPES.items() if type_name == id_type)
+        # The insertions run in a transaction, so types are inferred from every row up front
+        buffer = create_buffer(batch_size, id_mode, natural_keys, sample_size=None)
+        tables = {row[0] for row in conn.execute("SELECT table_name FROM schema_info WHERE flattened_from IS NULL").fetchall()}
+        if id_mode == "sequential":
+            for table_name in tables:
+                buffer["next_id"][table_name] = conn.execute(f'SELECT COALESCE(MAX(record_id), 0) FROM "{table_name}"').fetchone()[0]
+        known_blocks = {}
+        for row in conn.execute("SELECT table_name, first_position, item_count, text_length, content_hash FROM item_blocks ORDER BY table_name, first_position").fetchall():
+            known_blocks.setdefault(row[0], []).append(row[1:])
+        
+        with tempfile.TemporaryFile("w+", encoding="utf-8") as spill:
+            read = read_items(conn, buffer, file_path, spill, known_blocks)
+            if read is None:
+                # Keys clashed with skipped items; read every item so key_item sees them all
+                buffer["seen_keys"] = {}
+                spill.seek(0)
+                spill.truncate()
+                read = read_items(conn, buffer, file_path, spill, {})
+            kept, blocks, items = read
+            
+            # Find the new and changed items among those read
+            replaced = []
+            unchanged = []
+            new_items = 0
+            for table_name, natural_key, item_hash, position, record_id, known_hash in items:
+                if item_hash == known_hash:
+                    unchanged.append((table_name, natural_key, position))
+                elif record_id is None:
+                    new_items += 1
+                else:
+                    replaced.append((table_name, record_id))
+            
+            # Remove the old versions of changed items
+            conn.begin()
+            create_record_table(conn, "replaced_items", replaced, id_mode)
+            collect_records(conn, "replaced_items", "removed_records")
+            delete_records(conn, "replaced_items", "removed_records")
+            conn.commit()
+            
+            conn.begin()
+            update_item_positions(conn, unchanged, kept)
+            unchanged = None
+            columns = table_columns(conn)
+            added = []
+            arrays = set()
+            spill.seek(0)
+            for line, (table_name, natural_key, item_hash, position, record_id, known_hash) in zip(spill, items, strict=True):
+                if item_hash == known_hash:
+                    continue
+                _, is_array, item = json.loads(line)
+                if is_array:
+                    if table_name not in tables:
+                        create_table(conn, table_name, [], is_array=True, buffer=buffer)
+                    register_columns(buffer, table_name, item.keys())
+                    arrays.add(table_name)
+                elif isinstance(item, dict):
+                    create_table(conn, table_name, item.keys(), description="Top-level object", buffer=buffer)
+                else:
+                    create_table(conn, table_name, ["value"], description="Top-level scalar value", buffer=buffer)
+                    item = {"value": item}
+                record_id = insert_data(conn, table_name, item, buffer=buffer, record_id=record_id)
+                record_item_key(conn, buffer, table_name, natural_key, item_hash, record_id, position)
+                added.append((table_name, record_id))
+            items = None
+        
+        # Keep the schema information of existing tables; only new tables are added
+        new_tables = [table_name for table_name in buffer["schema_info"] if table_name not in tables]
+        buffer["schema_info"] = {table_name: buffer["schema_info"][table_name] for table_name in new_tables}
+        flush_buffer(conn, buffer)
+        for table_name in arrays:
+            count = conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+            conn.execute(
+                "UPDATE schema_info SET count = ?, description = ? WHERE table_name = ?",
+                (count, f"Top-level array containing {count} items", table_name)
+            )
+        if new_tables:
+            encode_table_names(conn)
+        
+        # Index the inserted records. A widened column type changes how the values already
+        # indexed are stored, and new columns or tables change the layout of the wide tables
+        new_columns = table_columns(conn)
+        retyped = any(new_columns[column] != data_type for column, data_type in columns.items())
+        create_record_table(conn, "added_items", added, id_mode)
+        collect_records(conn, "added_items", "added_records")
+        if retyped:
+            create_leaf_index(conn, id_mode)
+            text_index.create_text_index(conn)
+        else:
+            create_leaf_index(conn, id_mode, changed="added_records")
+            text_index.add_text_leaves(conn, "added_records")
+        if conn.execute("SELECT 1 FROM schema_info WHERE flattened_from IS NOT NULL").fetchone():
+            create_wide_tables(conn, changed=None if new_columns != columns else "added_records")
+        
+        write_item_blocks(conn, blocks)
+        store_prompt_context(conn)
+        write_manifest(conn, file_path, content_hash)
+        conn.commit()
+    except BaseException:
+        try:
+            conn.rollback()
+        except duckdb.TransactionException:
+            # Failed outside of the two transactions
+            pass
+        raise
+    finally:
+        conn.close()
+    print(f"Appended {file_path} to {db_name}.duckdb: {new_items} new and {len(replaced)} changed items")
+    return new_items + len(replaced)
+
+def sync_json_file(db_name, file_path, collection_name, embedder=None, qdrant_client=None, batch_size=DEFAULT_BATCH_SIZE, id_mode=DEFAULT_ID_MODE, wide_tables=DEFAULT_WIDE_TABLES, export_dir=None, natural_keys=DEFAULT_NATURAL_KEYS):
+    """
+    Indexes a JSON file unless its database is already up to date.
+    
+    Unchanged size and mtime skip the file without reading it; otherwise the content
+    hash decides. Changed files are rebuilt from scratch so rows are never duplicated,
+    unless natural_keys is given: then their new and changed items are appended to a
+    database indexed with the same keys (without embeddings, which are not appended).
+    With an embedder and the local vector backend, a missing vector index also
+    triggers a rebuild. If export_dir holds a Parquet export of the same content, the
+    database is loaded from it instead of being indexed.
+    Returns True if the file was (re-)indexed.
+    """
+    manifest = read_manifest(db_name)
+    if embedder and not qdrant_client and vector_index.VECTOR_BACKEND == "local" and not os.path.exists(vector_index.index_dir(db_name)):
+        manifest = None
+    entry = (manifest or {}).get(os.path.abspath(file_path))
+    stat = os.stat(file_path)
+    
+    if entry and entry["schema_version"] == SCHEMA_VERSION:
+        if entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            print(f"Skipping {file_path}: {db_name}.duckdb is up to date")
+            return False
+        
+        content_hash = hash_file(file_path)
+        if entry["content_hash"] == content_hash:
+            # Only the mtime changed (e.g. the file was copied); refresh the manifest
+            conn = duckdb.connect(f"{db_name}.duckdb")
+            write_manifest(conn, file_path, content_hash)
+            conn.close()
+            print(f"Skipping {file_path}: content unchanged")
+            return False
+        
+        indexed_keys = read_natural_keys(db_name) if natural_keys is not None and not embedder else None
+        if indexed_keys is not None and all(natural_keys.get(table_name) == key_path for table_name, key_path in indexed_keys.items()):
+            try:
+                append_json_file(db_name, file_path, natural_keys, batch_size, content_hash)
+                return True
+            except Exception as e:
+                # Changed items may already have been deleted, so the database must be rebuilt
+                print(f"Appending {file_path} to {db_name}.duckdb failed, rebuilding it: {e}")
+    else:
+        content_hash = None
+    
+    export = read_export_manifest(export_dir) if export_dir else None
+    if export is not None:
+        content_hash = content_hash or hash_file(file_path)
+        if any(source["content_hash"] == content_hash for source in export["sources"]):
+            load_exported_database(db_name, export_dir, source_path=file_path)
+            return True
+        print(f"Ignoring {export_dir}: it was exported from a different version of {file_path}")
+    
+    remove_db(db_name)
+    index_json_file(db_name, file_path, collection_name, embedder, qdrant_client, batch_size, content_hash=content_hash, id_mode=id_mode, wide_tables=wide_tables, natural_keys=natural_keys)
+    return True
+
+def index_json(db_name, json_data, collection_name, embedder=None, qdrant_client=None, batch_size=DEFAULT_BATCH_SIZE, id_mode=DEFAULT_ID_MODE, embed_batch_size=DEFAULT_EMBED_BATCH_SIZE, embed_concurrency=DEFAULT_EMBED_CONCURRENCY, wide_tables=DEFAULT_WIDE_TABLES):
+    """ 
+    Parses a JSON document and indexes it into DuckDB and Qdrant while maintaining
+    hierarchical relationships and schema information.
+    Rows are buffered per table and bulk loaded every batch_size rows.
+    Records are embedded embed_batch_size at a time with up to embed_concurrency
+    requests in flight; vectors of unchanged records come from the embedding cache.
+    With wide_tables, each top-level array is also flattened into an <array>_wide table.
+    """
+    conn = create_db(db_name)
+    embeddings = open_vector_store(db_name, embedder, qdrant_client, collection_name, embed_batch_size, embed_concurrency)
+    buffer = create_buffer(batch_size, id_mode)
+    
+    # Create schema tables
+    create_schema_tables(conn, id_mode)
+    
+    # Process top-level keys
+    for key, value in json_data.items():
+        index_section(conn, buffer, key, value, embeddings)
+    
+    finalize_index(conn, buffer, db_name, embeddings, wide_tables)
+
+def index_json_file(db_name, file_path, collection_name, embedder=None, qdrant_client=None, batch_size=DEFAULT_BATCH_SIZE, memory_limit=None, content_hash=None, id_mode=DEFAULT_ID_MODE, embed_batch_size=DEFAULT_EMBED_BATCH_SIZE, embed_concurrency=DEFAULT_EMBED_CONCURRENCY, wide_tables=DEFAULT_WIDE_TABLES, natural_keys=None):
+    """
+    Streaming variant of index_json that reads the JSON file incrementally.
+    Top-level arrays are indexed item by item, so peak memory is bounded by the
+    batch size and the largest single item rather than the size of the file.
+    The source file is recorded in the ingestion_manifest table once indexing has
+    finished. With natural_keys, item keys are recorded so later versions of the
+    file can be appended.
+    """
+    conn = create_db(db_name)
+    if memory_limit:
+        conn.execute(f"SET memory_limit = '{memory_limit}'")
+    embeddings = open_vector_store(db_name, embedder, qdrant_client, collection_name, embed_batch_size, embed_concurrency)
+    buffer = create_buffer(batch_size, id_mode, natural_keys)
+    
+    # Create schema tables
+    create_schema_tables(conn, id_mode, item_keys=natural_keys is not None)
+    
+    # Process top-level keys as they are parsed
+    blocks = {} if natural_keys is not None else None
+    for key, value in iter_json_sections(file_path, with_text=natural_keys is not None, blocks=blocks):
+        if isinstance(value, GeneratorType):
+            index_array_stream(conn, buffer, key, value, embeddings)
+        else:
+            index_section(conn, buffer, key, value, embeddings)
+    
+    finalize_index(conn, buffer, db_name, embeddings, wide_tables)
+    
+    # Recorded last, so a database whose indexing failed is never taken as up to date
+    conn = duckdb.connect(f"{db_name}.duckdb")
+    if blocks is not None:
+        write_item_blocks(conn, blocks)
+    write_manifest(conn, file_path, content_hash)
+    conn.close()
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Export an indexed database to Parquet, or create a database from an export.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Export <db_name>.duckdb to a Parquet directory")
+    export_parser.add_argument("db_name")
+    export_parser.add_argument("export_dir")
+    export_parser.add_argument("--file-size", default=EXPORT_FILE_SIZE, help="Target size of each Parquet file")
+    load_parser = subparsers.add_parser("load", help="Create <db_name>.duckdb from a Parquet export")
+    load_parser.add_argument("db_name")
+    load_parser.add_argument("export_dir")
+    load_parser.add_argument("--source", help="Local copy of the exported JSON file, recorded for change detection")
+    load_parser.add_argument("--materialize", action="store_true", help="Copy the data into the database instead of creating read_parquet views")
+    args = parser.parse_args()
+    
+    if args.command == "export":
+        export_database(args.db_name, args.export_dir, args.file_size)
+    else:
+        load_exported_database(args.db_name, args.export_dir, args.source, args.materialize)
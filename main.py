@@ -1,38 +1,109 @@
 from pydantic import BaseModel
-from typing import Union, Any, Dict, List
+from typing import Any, Dict, Optional
+import asyncio
 import json
+import multiprocessing
 import os
+import threading
+import time
 import duckdb
 import glob
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from smolagents import ActionStep, PlanningStep, FinalAnswerStep
 
-from agents.smolagent import task_agent
+from agents.smolagent import create_task_agent
+from agents.connections import invalidate, file_signature
+from agents import query_cache
 from fastapi import HTTPException
-from data_prep import index_json
-from qdrant_client import QdrantClient
-from langchain_openai import OpenAIEmbeddings
+from data_prep import sync_json_file, render_prompt_context
 
-# Initialize Qdrant client and embedder
+# Initialize Qdrant client
 #qdrant_client = QdrantClient(url="http://localhost:6333")  # Using in-memory storage
-embedder = OpenAIEmbeddings(model="text-embedding-3-small")
+
+# Indexing configuration
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", os.cpu_count() or 1))
+INDEX_IN_BACKGROUND = os.getenv("INDEX_IN_BACKGROUND", "false").lower() == "true"
+# Embed every record into the local vector index while indexing (calls the embeddings API)
+INDEX_EMBEDDINGS = os.getenv("INDEX_EMBEDDINGS", "false").lower() == "true"
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Directory of Parquet exports (PREBUILT_DIR/<db name>) loaded instead of indexing a matching file
+PREBUILT_DIR = os.getenv("PREBUILT_DIR")
+
+# Per-database indexing status: queued -> indexing -> ready | failed
+index_status: Dict[str, Dict[str, Any]] = {}
+
+def find_json_files(data_dir: str = "data") -> Dict[str, str]:
+    """Map database names to the JSON files in the data directory."""
+    return {
+        os.path.splitext(filename)[0]: os.path.join(data_dir, filename)
+        for filename in sorted(os.listdir(data_dir))
+        if filename.endswith('.json')
+    }
+
+async def index_json_file_in_pool(executor: ProcessPoolExecutor, db_name: str, file_path: str, progress: Dict[str, int]):
+    """Index one JSON file in the process pool and record its status."""
+    loop = asyncio.get_running_loop()
+    index_status[db_name] = {"status": "indexing", "file": file_path}
+    start = time.time()
+    try:
+        # Create Qdrant collection for this file
+        #qdrant_client.recreate_collection(
+        #    collection_name=db_name,
+        #    vectors_config={"size": 1536, "distance": "Cosine"}  # OpenAI embeddings are 1536 dimensions
+        # )
+        # With INDEX_EMBEDDINGS, records are also embedded into the vector index stored next
+        # to the database (VECTOR_BACKEND=local); the worker creates the embedder from the model
+        # name. Files whose database is already up to date are skipped, files with a
+        # matching export in PREBUILT_DIR are loaded from it, and with INCREMENTAL_INGEST
+        # the new and changed items of a grown file are appended (see NATURAL_KEYS).
+        export_dir = os.path.join(PREBUILT_DIR, db_name) if PREBUILT_DIR else None
+        reindexed = await loop.run_in_executor(
+            executor, partial(sync_json_file, export_dir=export_dir),
+            db_name, file_path, db_name, EMBEDDING_MODEL if INDEX_EMBEDDINGS else None
+        )
+    except Exception as e:
+        index_status[db_name] = {"status": "failed", "file": file_path, "error": str(e)}
+        print(f"Error indexing {file_path}: {str(e)}")
+    else:
+        if reindexed:
+            # Cached read-only handles and database information describe the old file
+            invalidate(db_name)
+            invalidate_database_info(db_name)
+            query_cache.invalidate(db_name)
+        index_status[db_name] = {
+            "status": "ready",
+            "file": file_path,
+            "reindexed": reindexed,
+            "seconds": round(time.time() - start, 2)
+        }
+    finally:
+        progress["done"] += 1
+        print(f"[{progress['done']}/{progress['total']}] {db_name}: {index_status[db_name]['status']} ({time.time() - start:.1f}s)")
 
 # Load JSON files at startup
-def load_json_files():
-    data_dir = "data"
-    for filename in os.listdir(data_dir):
-        if filename.endswith('.json'):
-            db_name = os.path.splitext(filename)[0]
-            file_path = os.path.join(data_dir, filename)
-            # Create Qdrant collection for this file
-            #qdrant_client.recreate_collection(
-            #    collection_name=db_name,
-            #    vectors_config={"size": 1536, "distance": "Cosine"}  # OpenAI embeddings are 1536 dimensions
-            # )
-            with open(file_path, 'r') as f:
-                json_data = json.load(f)
-                index_json(db_name, json_data, db_name, embedder)
-                print(f"Loaded and indexed {filename} into collection {db_name} with hierarchical structure preserved")
+async def load_json_files(workers: int = INDEX_WORKERS):
+    """Index every JSON file in the data directory in parallel, one process per file."""
+    json_files = find_json_files()
+    for db_name, file_path in json_files.items():
+        index_status[db_name] = {"status": "queued", "file": file_path}
+    
+    progress = {"done": 0, "total": len(json_files)}
+    # Use spawn so workers don't inherit the server's threads and event loop
+    with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=multiprocessing.get_context("spawn")) as executor:
+        await asyncio.gather(*[
+            index_json_file_in_pool(executor, db_name, file_path, progress)
+            for db_name, file_path in json_files.items()
+        ])
+    refresh_database_catalog()
+
+def is_database_ready(db_name: str) -> bool:
+    """Databases not managed by the startup indexer are always considered ready."""
+    return index_status.get(db_name, {}).get("status", "ready") == "ready"
 
 # Initialize FastAPI app
 app = FastAPI()
@@ -40,7 +111,12 @@ app = FastAPI()
 # Load JSON files when the application starts
 @app.on_event("startup")
 async def startup_event():
-    load_json_files()
+    refresh_database_catalog()
+    if INDEX_IN_BACKGROUND:
+        # Start serving immediately; /databases reports readiness per database
+        app.state.indexing_task = asyncio.create_task(load_json_files())
+    else:
+        await load_json_files()
 
 
 
@@ -50,6 +126,7 @@ class TaskInput(BaseModel):
 
 class TaskOutput(BaseModel):
     output: Any
+    prompt_assembly_ms: Optional[float] = None
 
 
 @app.get("/")
@@ -57,100 +134,180 @@ def read_root():
     return {"Hello": "World"}
 
 
-def get_database_info() -> Dict[str, Dict[str, Any]]:
+# Per-request timing metrics: name -> {"count", "total_ms", "max_ms", "last_ms"}
+request_metrics: Dict[str, Dict[str, float]] = {}
+metrics_lock = threading.Lock()
+
+def record_metric(name: str, elapsed_ms: float):
+    """Accumulate a timing sample for a named request phase."""
+    with metrics_lock:
+        metric = request_metrics.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0})
+        metric["count"] += 1
+        metric["total_ms"] += elapsed_ms
+        metric["max_ms"] = max(metric["max_ms"], elapsed_ms)
+        metric["last_ms"] = elapsed_ms
+
+@app.get("/metrics")
+def get_metrics():
+    """Report accumulated request timing metrics and query cache counters."""
+    with metrics_lock:
+        metrics = {
+            name: {**metric, "avg_ms": metric["total_ms"] / metric["count"] if metric["count"] else 0.0}
+            for name, metric in request_metrics.items()
+        }
+    metrics["query_cache"] = query_cache.cache_stats()
+    return metrics
+
+
+# Cached database information: db file name -> {"path", "signature", "info", "context"}
+database_catalog: Dict[str, Dict[str, Any]] = {}
+catalog_lock = threading.Lock()
+
+def read_prompt_context(conn) -> Dict[str, Any]:
     """
-    Scan for DuckDB databases and return their table information and structure.
-    Returns a dictionary with database names as keys and detailed information about each database.
+    Read the prompt context precomputed at ingestion, rendering it on the fly for
+    databases indexed before it was stored.
     """
-    database_info = {}
-    
-    # Find all .duckdb files in the current directory and subdirectories
-    duckdb_files = glob.glob("**/*.duckdb", recursive=True)
-    
-    for db_path in duckdb_files:
+    try:
+        row = conn.execute("SELECT ingestion_version, hierarchy, statistics, overview FROM prompt_context").fetchone()
+        return {"version": row[0], "hierarchy": row[1], "statistics": row[2], "overview": row[3]}
+    except duckdb.Error:
+        return {"version": None, **render_prompt_context(conn)}
+
+def read_database_info(db_path: str) -> tuple:
+    """Read the table information, structure and prompt context of a single database."""
+    conn = duckdb.connect(db_path, read_only=True)
+    try:
+        # Check if this is a hierarchical database with schema_info
+        has_schema_info = False
         try:
-            # Connect to the database
-            conn = duckdb.connect(db_path, read_only=True)
-            db_name = os.path.basename(db_path)
+            conn.execute("SELECT * FROM schema_info LIMIT 1")
+            has_schema_info = True
+        except:
+            pass
+        
+        if has_schema_info:
+            # Get hierarchical structure information
+            tables = conn.execute("SELECT table_name, parent_table, description, is_array, count FROM schema_info").fetchall()
+            table_stats = conn.execute("SELECT table_name, COUNT(*) as record_count FROM schema_info JOIN (SELECT name FROM sqlite_master WHERE type='table' AND name NOT IN ('schema_info', 'record_relationships')) t ON schema_info.table_name = t.name GROUP BY table_name").fetchall()
             
-            # Check if this is a hierarchical database with schema_info
-            has_schema_info = False
+            # Get overview if available
+            overview = None
             try:
-                conn.execute("SELECT * FROM schema_info LIMIT 1")
-                has_schema_info = True
+                overview = conn.execute("SELECT * FROM data_overview").fetchall()
             except:
                 pass
             
-            if has_schema_info:
-                # Get hierarchical structure information
-                tables = conn.execute("SELECT table_name, parent_table, description, is_array, count FROM schema_info").fetchall()
-                table_stats = conn.execute("SELECT table_name, COUNT(*) as record_count FROM schema_info JOIN (SELECT name FROM sqlite_master WHERE type='table' AND name NOT IN ('schema_info', 'record_relationships')) t ON schema_info.table_name = t.name GROUP BY table_name").fetchall()
-                
-                # Get overview if available
-                overview = None
-                try:
-                    overview = conn.execute("SELECT * FROM data_overview").fetchall()
-                except:
-                    pass
-                
-                database_info[db_name] = {
-                    "hierarchical": True,
-                    "tables": [{"name": t[0], "parent": t[1], "description": t[2], "is_array": t[3], "count": t[4]} for t in tables],
-                    "stats": {t[0]: t[1] for t in table_stats},
-                    "overview": overview
-                }
-            else:
-                # Get basic table information for non-hierarchical databases
-                tables = conn.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = 'main'").fetchall()
-                database_info[db_name] = {
-                    "hierarchical": False,
-                    "tables": [{"name": t[0]} for t in tables]
-                }
-            
-            # Close the connection
-            conn.close()
+            return {
+                "hierarchical": True,
+                "tables": [{"name": t[0], "parent": t[1], "description": t[2], "is_array": t[3], "count": t[4]} for t in tables],
+                "stats": {t[0]: t[1] for t in table_stats},
+                "overview": overview
+            }, read_prompt_context(conn)
+        
+        # Get basic table information for non-hierarchical databases
+        tables = conn.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = 'main'").fetchall()
+        return {
+            "hierarchical": False,
+            "tables": [{"name": t[0]} for t in tables]
+        }, None
+    finally:
+        conn.close()
+
+def refresh_database_catalog():
+    """
+    Scan for DuckDB databases and sync the catalog with the files on disk.
+    Only called at startup and after indexing, never per request.
+    """
+    # Find all .duckdb files in the current directory and subdirectories
+    db_paths = {os.path.basename(path): path for path in glob.glob("**/*.duckdb", recursive=True)}
+    with catalog_lock:
+        for db_file in set(database_catalog) - set(db_paths):
+            del database_catalog[db_file]
+        for db_file, path in db_paths.items():
+            database_catalog.setdefault(db_file, {"path": path, "signature": None, "info": None, "context": None})
+
+def invalidate_database_info(db_name: str):
+    """Mark cached information for a database as stale, e.g. after it was re-indexed."""
+    with catalog_lock:
+        entry = database_catalog.get(f"{db_name}.duckdb")
+        if entry is not None:
+            entry["signature"] = None
+
+def get_catalog_entry(db_file: str) -> Dict[str, Any]:
+    """
+    Return the cached catalog entry for a database file, re-reading it only when the
+    file changed since it was cached. Returns None if the database is unknown.
+    """
+    with catalog_lock:
+        entry = database_catalog.get(db_file)
+        if entry is None:
+            # Databases created after the last scan are picked up on first use
+            if not os.path.exists(db_file):
+                return None
+            entry = database_catalog[db_file] = {"path": db_file, "signature": None, "info": None, "context": None}
+    
+    try:
+        signature = file_signature(entry["path"])
+    except FileNotFoundError:
+        with catalog_lock:
+            database_catalog.pop(db_file, None)
+        return None
+    
+    if entry["signature"] != signature:
+        entry["info"], entry["context"] = read_database_info(entry["path"])
+        entry["signature"] = signature
+    return entry
+
+def get_catalog_info(db_file: str) -> Dict[str, Any]:
+    """Return the cached table information for a database file, or None if it is unknown."""
+    entry = get_catalog_entry(db_file)
+    return entry["info"] if entry else None
+
+def get_database_info() -> Dict[str, Dict[str, Any]]:
+    """
+    Return the table information and structure of every cataloged database.
+    Returns a dictionary with database names as keys and detailed information about each database.
+    """
+    database_info = {}
+    
+    for db_file in list(database_catalog):
+        # Databases that are still being indexed are reported through index_status instead
+        if not is_database_ready(os.path.splitext(db_file)[0]):
+            continue
+        
+        try:
+            info = get_catalog_info(db_file)
         except Exception as e:
-            print(f"Error accessing database {db_path}: {str(e)}")
+            print(f"Error accessing database {db_file}: {str(e)}")
             continue
+        if info is not None:
+            database_info[db_file] = info
     
     return database_info
 
 @app.get("/databases")
 def list_databases():
-    """List all available database instances and their tables."""
-    return {"databases": get_database_info()}
+    """List all available database instances, their tables and indexing readiness."""
+    return {"databases": get_database_info(), "indexing": index_status}
 
 
-@app.post("/task_agent", response_model=TaskOutput)
-def run_task_agent(input: TaskInput) -> TaskOutput:
-    """Execute a task using the task agent that combines SQL and semantic search capabilities"""
-    #try:
-    # Get database structure information
-    db_info = get_database_info().get(f"{input.db_name}.duckdb", {})
+def build_task_prompt(input: TaskInput) -> tuple:
+    """Build the task prompt for a request; returns the prompt and the time it took in ms."""
+    if not is_database_ready(input.db_name):
+        status = index_status[input.db_name]["status"]
+        raise HTTPException(status_code=503, detail=f"Database {input.db_name} is not ready (status: {status})")
+    
+    prompt_start = time.perf_counter()
+    
+    # Get database structure information for just this database
+    entry = get_catalog_entry(f"{input.db_name}.duckdb")
+    db_info = entry["info"] if entry else {}
     
     # Create a context-rich prompt based on database structure
     if db_info.get("hierarchical", False):
-        # For hierarchical databases, provide rich context about the structure
-        conn = duckdb.connect(f"{input.db_name}.duckdb", read_only=True)
-        
-        # Get table hierarchy
-        hierarchy = conn.execute("SELECT level, path, table_name, is_array, count FROM table_hierarchy ORDER BY path").fetchall()
-        hierarchy_str = "\n".join([f"- Level {row[0]}: {row[1]} (Array: {row[3]}, Count: {row[4]})" for row in hierarchy])
-        
-        # Get table statistics
-        stats = conn.execute("SELECT table_name, expected_count FROM table_statistics ORDER BY expected_count DESC").fetchall()
-        stats_str = "\n".join([f"- {row[0]}: {row[1]} records" for row in stats])
-        
-        # Get overview
-        overview = "No overview available"
-        try:
-            overview_result = conn.execute("SELECT * FROM data_overview").fetchall()
-            if overview_result:
-                overview = "\n".join([str(col) for col in overview_result[0]])
-        except:
-            pass
-        
-        conn.close()
+        # For hierarchical databases, use the context precomputed at ingestion
+        context = entry["context"]
         
         task_template = f"""
         Your task is to answer the question as best you can.
@@ -159,16 +316,16 @@ def run_task_agent(input: TaskInput) -> TaskOutput:
         DB Name: {input.db_name}
         
         Database Overview:
-        {overview}
+        {context["overview"]}
         
         Table Hierarchy:
-        {hierarchy_str}
+        {context["hierarchy"]}
         
         Table Statistics:
-        {stats_str}
+        {context["statistics"]}
         
         IMPORTANT: This database contains hierarchical JSON data. 
-        The schema_info table shows that the 'jobs' table contains {db_info.get('tables', [{}])[0].get('count', '?')} original job records.
+        The schema_info table shows that the 'jobs' table contains {next((t['count'] for t in db_info['tables'] if t['name'] == 'jobs'), '?')} original job records.
         When counting records in the jobs table, you may see more records due to the hierarchical structure.
         To get accurate counts, refer to the schema_info table or use the table_hierarchy and table_statistics views.
         
@@ -189,8 +346,185 @@ def run_task_agent(input: TaskInput) -> TaskOutput:
         Question: {input.task}
         """
     
-    # Pass the db_name as additional_args to the agent
-    result = task_agent.run(task_template, additional_args={"db_name": input.db_name})
-    return TaskOutput(output=result)
-    #except Exception as e:
-    #    raise HTTPException(status_code=500, detail=str(e))
+    prompt_ms = (time.perf_counter() - prompt_start) * 1000
+    record_metric("prompt_assembly", prompt_ms)
+    return task_template, prompt_ms
+
+
+# Agent execution: a bounded pool of workers plus a bounded queue of waiting tasks
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "4"))
+AGENT_QUEUE_DEPTH = int(os.getenv("AGENT_QUEUE_DEPTH", "16"))
+# Seconds finished jobs are kept for polling
+AGENT_JOB_TTL = float(os.getenv("AGENT_JOB_TTL", "3600"))
+
+agent_executor = ThreadPoolExecutor(max_workers=AGENT_WORKERS, thread_name_prefix="task-agent")
+agent_slots = threading.BoundedSemaphore(AGENT_WORKERS + AGENT_QUEUE_DEPTH)
+
+# Submitted agent jobs: job_id -> {"status", "db_name", "submitted_at", "finished_at", "output", "error", ...}
+agent_jobs: Dict[str, Dict[str, Any]] = {}
+agent_jobs_lock = threading.Lock()
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str
+    output: Any = None
+    error: Optional[str] = None
+    prompt_assembly_ms: Optional[float] = None
+    queue_ms: Optional[float] = None
+    run_ms: Optional[float] = None
+
+def prune_agent_jobs():
+    """Forget finished jobs older than AGENT_JOB_TTL."""
+    cutoff = time.time() - AGENT_JOB_TTL
+    with agent_jobs_lock:
+        for job_id in [job_id for job_id, job in agent_jobs.items() if job.get("finished_at") and job["finished_at"] < cutoff]:
+            del agent_jobs[job_id]
+
+def run_agent_job(job_id: str, task_template: str, db_name: str, step_callbacks=None):
+    """Run a task on a fresh agent instance; executed on the agent worker pool."""
+    job = agent_jobs[job_id]
+    job["status"] = "running"
+    job["started_at"] = time.time()
+    try:
+        # Each job gets its own agent so concurrent runs don't share memory
+        agent = create_task_agent(step_callbacks)
+        # Pass the db_name as additional_args to the agent
+        job["output"] = agent.run(task_template, additional_args={"db_name": db_name})
+        job["status"] = "succeeded"
+        return job["output"]
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+        raise
+    finally:
+        job["finished_at"] = time.time()
+        agent_slots.release()
+
+def submit_agent_job(input: TaskInput, step_callbacks=None) -> str:
+    """
+    Queue a task on the agent worker pool and return its job id.
+    Raises 429 when all workers are busy and the queue is full.
+    """
+    task_template, prompt_ms = build_task_prompt(input)
+    
+    if not agent_slots.acquire(blocking=False):
+        raise HTTPException(status_code=429, detail="Too many agent tasks in progress, retry later")
+    
+    prune_agent_jobs()
+    job_id = uuid.uuid4().hex
+    with agent_jobs_lock:
+        agent_jobs[job_id] = {
+            "status": "queued",
+            "db_name": input.db_name,
+            "submitted_at": time.time(),
+            "prompt_assembly_ms": round(prompt_ms, 3),
+        }
+    try:
+        agent_jobs[job_id]["future"] = agent_executor.submit(run_agent_job, job_id, task_template, input.db_name, step_callbacks)
+    except Exception:
+        agent_slots.release()
+        raise
+    return job_id
+
+def job_status(job_id: str) -> JobStatus:
+    """Describe a submitted job."""
+    job = agent_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    
+    started_at, finished_at = job.get("started_at"), job.get("finished_at")
+    return JobStatus(
+        job_id=job_id,
+        status=job["status"],
+        output=job.get("output"),
+        error=job.get("error"),
+        prompt_assembly_ms=job["prompt_assembly_ms"],
+        queue_ms=round((started_at - job["submitted_at"]) * 1000, 3) if started_at else None,
+        run_ms=round((finished_at - started_at) * 1000, 3) if started_at and finished_at else None
+    )
+
+
+@app.post("/task_agent/jobs", response_model=JobStatus, status_code=202)
+def create_task_agent_job(input: TaskInput) -> JobStatus:
+    """Submit a task for the task agent and return a job id to poll for the result."""
+    return job_status(submit_agent_job(input))
+
+
+@app.get("/task_agent/jobs/{job_id}", response_model=JobStatus)
+def get_task_agent_job(job_id: str) -> JobStatus:
+    """Poll the status and result of a submitted task."""
+    return job_status(job_id)
+
+
+@app.post("/task_agent", response_model=TaskOutput)
+async def run_task_agent(input: TaskInput) -> TaskOutput:
+    """Execute a task using the task agent that combines SQL and semantic search capabilities"""
+    # Building the prompt may read the database, so submit from a worker thread
+    job_id = await asyncio.to_thread(submit_agent_job, input)
+    job = agent_jobs[job_id]
+    # Wait without blocking the event loop; the task itself runs on the agent pool
+    result = await asyncio.wrap_future(job["future"])
+    return TaskOutput(output=result, prompt_assembly_ms=job["prompt_assembly_ms"])
+
+
+def step_event(step, agent) -> Dict[str, Any]:
+    """Describe an agent memory step as a JSON-serializable event."""
+    event = {"agent": agent.name or "task_agent"}
+    if isinstance(step, PlanningStep):
+        event.update(type="planning", plan=step.plan)
+    elif isinstance(step, ActionStep):
+        event.update(
+            type="action",
+            step_number=step.step_number,
+            tool_calls=[{"name": call.name, "arguments": call.arguments} for call in step.tool_calls or []],
+            code_action=step.code_action,
+            observations=step.observations,
+            error=str(step.error) if step.error else None,
+            duration_ms=round(step.timing.duration * 1000, 3) if step.timing.duration is not None else None
+        )
+    elif isinstance(step, FinalAnswerStep):
+        event.update(type="final_answer", output=step.output)
+    return event
+
+
+def format_event(event: Dict[str, Any], format: str) -> str:
+    """Encode an event as a server-sent event or an NDJSON line."""
+    data = json.dumps(event, default=str)
+    if format == "ndjson":
+        return data + "\n"
+    return f"event: {event['type']}\ndata: {data}\n\n"
+
+
+@app.post("/task_agent/stream")
+async def stream_task_agent(input: TaskInput, format: str = "sse"):
+    """
+    Execute a task and stream the agent's planning steps, tool calls and partial results
+    as they happen, as server-sent events (default) or NDJSON (format=ndjson).
+    """
+    if format not in ("sse", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be 'sse' or 'ndjson'")
+    
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    
+    def on_step(step, agent):
+        # Called on the agent worker thread; hand the event over to the event loop
+        loop.call_soon_threadsafe(events.put_nowait, step_event(step, agent))
+    
+    callbacks = {PlanningStep: on_step, ActionStep: on_step, FinalAnswerStep: on_step}
+    job_id = await asyncio.to_thread(submit_agent_job, input, step_callbacks=callbacks)
+    job = agent_jobs[job_id]
+    job["future"].add_done_callback(lambda _: loop.call_soon_threadsafe(events.put_nowait, None))
+    
+    async def generate():
+        yield format_event({"type": "queued", "job_id": job_id, "prompt_assembly_ms": job["prompt_assembly_ms"]}, format)
+        while (event := await events.get()) is not None:
+            yield format_event(event, format)
+        status = job_status(job_id)
+        if status.status == "succeeded":
+            yield format_event({"type": "result", "output": status.output, "run_ms": status.run_ms}, format)
+        else:
+            yield format_event({"type": "error", "error": status.error}, format)
+    
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/event-stream"
+    return StreamingResponse(generate(), media_type=media_type, headers={"Cache-Control": "no-cache"})
@@ -0,0 +1,136 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import duckdb
+import pytest
+
+from agents import connections
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def db_name(tmp_path):
+    name = str(tmp_path / "jobs")
+    with duckdb.connect(connections.db_path(name)) as conn:
+        conn.execute("CREATE TABLE jobs AS SELECT range AS id FROM range(3)")
+    yield name
+    connections.invalidate(name)
+
+
+def in_thread(target):
+    """Run target in another thread and return the thread and a list receiving its result."""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(target()))
+    thread.start()
+    return thread, result
+
+
+def count_jobs(db_name):
+    with connections.borrow_cursor(db_name) as cursor:
+        return cursor.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+
+def is_closed(conn):
+    try:
+        conn.execute("SELECT 1")
+    except duckdb.ConnectionException:
+        return True
+    return False
+
+
+def test_threads_share_the_connection_but_not_cursors(db_name):
+    with connections.borrow_cursor(db_name) as first:
+        pass
+    with connections.borrow_cursor(db_name) as second:
+        assert second is first
+        assert second.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 3
+
+    def other_cursor():
+        with connections.borrow_cursor(db_name) as cursor:
+            return cursor, connections.get_handle(db_name)
+    thread, result = in_thread(other_cursor)
+    thread.join()
+    cursor, handle = result[0]
+    assert cursor is not first
+    assert handle is connections.get_handle(db_name)
+
+
+def test_invalidate_waits_for_running_queries(db_name):
+    borrowed, invalidated = threading.Event(), threading.Event()
+
+    def slow_query():
+        with connections.borrow_cursor(db_name) as cursor:
+            borrowed.set()
+            invalidated.wait()
+            return cursor.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    thread, result = in_thread(slow_query)
+    borrowed.wait()
+    old = connections.get_handle(db_name)
+    connections.invalidate(db_name)
+    assert old["retired"] and not is_closed(old["conn"])
+    invalidated.set()
+    thread.join()
+
+    assert result == [3]
+    assert is_closed(old["conn"])
+    new = connections.get_handle(db_name)
+    assert new["generation"] > old["generation"]
+    assert count_jobs(db_name) == 3
+
+
+def test_reopening_after_a_reingest_waits_for_borrowed_cursors(db_name):
+    json_path = os.path.join(os.path.dirname(db_name), "jobs.json")
+    with open(json_path, "w") as f:
+        json.dump({"jobs": [{"id": i} for i in range(5)]}, f)
+    old = connections.get_handle(db_name)
+
+    with connections.borrow_cursor(db_name) as cursor:
+        # Indexed in another process, like the workers started by main.py
+        subprocess.run([sys.executable, "-c", "import sys, data_prep; data_prep.sync_json_file(*sys.argv[1:])", db_name, json_path, db_name],
+                       cwd=REPO_DIR, check=True)
+        connections.invalidate(db_name)
+        thread, result = in_thread(lambda: count_jobs(db_name))
+        thread.join(0.5)
+        # The reader of the new file waits until the old connection can be closed
+        assert thread.is_alive()
+        assert cursor.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 3
+    thread.join()
+
+    assert result == [5]
+    assert is_closed(old["conn"])
+    new = connections.get_handle(db_name)
+    assert new["generation"] > old["generation"]
+    assert new["version"] != old["version"]
+    assert count_jobs(db_name) == 5
+
+
+def test_a_rebuilt_file_gets_a_new_generation_and_cursor(db_name):
+    with connections.borrow_cursor(db_name) as first:
+        pass
+    old = connections.get_handle(db_name)
+    stat = os.stat(connections.db_path(db_name))
+    os.utime(connections.db_path(db_name), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    with connections.borrow_cursor(db_name) as second:
+        assert second is not first
+    assert connections.get_handle(db_name)["generation"] > old["generation"]
+    assert is_closed(old["conn"])
+
+
+def test_idle_connections_are_evicted_unless_borrowed(db_name, monkeypatch):
+    monkeypatch.setattr(connections, "IDLE_TIMEOUT", 10)
+    handle = connections.get_handle(db_name)
+
+    with connections.borrow_cursor(db_name):
+        connections.evict_idle(handle["last_used"] + 11)
+        assert connections.db_handles[db_name] is handle
+
+    connections.evict_idle(handle["last_used"] + 11)
+    assert db_name not in connections.db_handles
+    assert is_closed(handle["conn"])
+    assert count_jobs(db_name) == 3
@@ -0,0 +1,107 @@
+import duckdb
+import pytest
+
+import data_prep
+from agents import vector_index
+
+
+class FakeEmbedder:
+    """Embeds a text as (length, number of digits, 1) and records the batches it was given."""
+
+    def __init__(self, model="fake-model"):
+        self.model = model
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(text)), float(sum(c.isdigit() for c in text)), 1.0] for text in texts]
+
+
+@pytest.fixture
+def queue_factory(tmp_path):
+    queues = []
+
+    def create(embedder, batch_size=2, concurrency=2):
+        points = []
+        queue = data_prep.create_embedding_queue(embedder, points.extend, "items", batch_size, concurrency, cache_dir=str(tmp_path / "cache"))
+        queues.append(queue)
+        return queue, points
+    yield create
+    for queue in queues:
+        queue["cache"].close()
+
+
+def embed(queue, values):
+    for i, value in enumerate(values):
+        data_prep.embed_record(queue, f"items[{i}]", "items", i + 1, value)
+    data_prep.embed_pending(queue)
+    data_prep.upsert_points(queue)
+
+
+def test_records_are_embedded_in_batches(queue_factory):
+    embedder = FakeEmbedder()
+    queue, points = queue_factory(embedder)
+    for i in range(5):
+        data_prep.embed_record(queue, f"items[{i}]", "items", i + 1, {"id": i})
+        # Nothing is embedded until batch_size * concurrency records are queued
+        assert len(embedder.batches) == (2 if i >= 3 else 0)
+    data_prep.embed_pending(queue)
+    data_prep.upsert_points(queue)
+
+    assert [len(batch) for batch in embedder.batches] == [2, 2, 1]
+    assert [point.payload["json_path"] for point in points] == [f"items[{i}]" for i in range(5)]
+    assert points[2].payload == {"json_path": "items[2]", "json_value": '{"id": 2}', "table": "items", "record_id": 3}
+    assert points[2].vector == [9.0, 1.0, 1.0]
+
+
+def test_identical_values_are_embedded_once(queue_factory):
+    embedder = FakeEmbedder()
+    queue, points = queue_factory(embedder, batch_size=10)
+    embed(queue, ["same", "same", "other", "same"])
+
+    assert embedder.batches == [['"same"', '"other"']]
+    assert len(points) == 4 and points[0].vector == points[3].vector
+    assert queue["stats"] == {"records": 4, "embedded": 2, "cached": 0, "duplicates": 2, "upserted": 4}
+
+
+def test_cached_vectors_are_reused_per_model(queue_factory):
+    queue, _ = queue_factory(FakeEmbedder())
+    embed(queue, ["a1", "b22"])
+
+    embedder = FakeEmbedder()
+    queue, points = queue_factory(embedder)
+    embed(queue, ["a1", "b22", "c333"])
+    assert embedder.batches == [['"c333"']]
+    assert queue["stats"]["cached"] == 2 and queue["stats"]["embedded"] == 1
+    assert [point.vector for point in points] == [[4.0, 1.0, 1.0], [5.0, 2.0, 1.0], [6.0, 3.0, 1.0]]
+
+    # Another model does not share vectors
+    embedder = FakeEmbedder("other-model")
+    queue, _ = queue_factory(embedder)
+    embed(queue, ["a1"])
+    assert embedder.batches == [['"a1"']]
+
+
+def test_points_are_upserted_in_chunks(queue_factory, monkeypatch):
+    monkeypatch.setattr(data_prep, "UPSERT_BATCH_SIZE", 3)
+    chunks = []
+    queue = data_prep.create_embedding_queue(FakeEmbedder(), chunks.append, "items", 2, 2, cache_dir=None)
+    for i in range(7):
+        data_prep.embed_record(queue, f"items[{i}]", "items", i + 1, i)
+    # Only full chunks go out while records are still being queued
+    assert [len(chunk) for chunk in chunks] == [3]
+    data_prep.flush_embeddings(queue)
+    assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+
+
+def test_indexing_with_an_embedder_stores_a_searchable_index(tmp_path, monkeypatch):
+    # The embedding cache is created in the working directory
+    monkeypatch.chdir(tmp_path)
+    db_name = str(tmp_path / "items")
+    data_prep.index_json(db_name, {"items": [{"name": "x" * i} for i in range(1, 6)]}, "items", embedder=FakeEmbedder())
+
+    results = vector_index.search(db_name, [22.0, 0.0, 1.0], limit=1, exact=True)
+    assert results[0]["payload"]["json_path"] == "items[4]"
+    conn = duckdb.connect(str(tmp_path / ".embedding_cache" / "items.duckdb"), read_only=True)
+    assert conn.execute("SELECT COUNT(*) FROM embeddings WHERE model = 'fake-model'").fetchone() == (5,)
+    conn.close()
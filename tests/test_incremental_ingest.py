@@ -0,0 +1,193 @@
+import json
+
+import duckdb
+import pytest
+
+import data_prep
+
+NATURAL_KEYS = {"items": "id"}
+
+
+def write_items(path, items):
+    with open(path, "w") as f:
+        json.dump({"items": items}, f)
+
+
+def index_items(tmp_path, items):
+    """ Indexes items into a database keyed by id and returns (db_name, json_path). """
+    db_name, json_path = str(tmp_path / "items"), str(tmp_path / "items.json")
+    write_items(json_path, items)
+    data_prep.index_json_file(db_name, json_path, db_name, natural_keys=NATURAL_KEYS)
+    return db_name, json_path
+
+
+def test_append_widens_a_column_the_type_sample_misses(tmp_path):
+    db_name, json_path = index_items(tmp_path, [{"id": i, "n": i} for i in range(100)])
+    items = [{"id": i, "n": i} for i in range(3100)]
+    items[1101]["n"] = "oops"
+    write_items(json_path, items)
+
+    assert data_prep.append_json_file(db_name, json_path, NATURAL_KEYS) == 3000
+
+    conn = duckdb.connect(f"{db_name}.duckdb", read_only=True)
+    assert conn.execute("SELECT data_type FROM information_schema.columns WHERE table_name = 'items' AND column_name = 'n'").fetchone() == ("VARCHAR",)
+    assert conn.execute("SELECT COUNT(*), COUNT(DISTINCT id) FROM items").fetchone() == (3100, 3100)
+    assert conn.execute("SELECT id FROM items WHERE n = 'oops'").fetchall() == [(1101,)]
+    assert conn.execute("SELECT count FROM schema_info WHERE table_name = 'items'").fetchone() == (3100,)
+    conn.close()
+
+
+def test_sync_rebuilds_when_the_append_fails(tmp_path, monkeypatch):
+    db_name, json_path = index_items(tmp_path, [{"id": i, "n": i} for i in range(10)])
+    write_items(json_path, [{"id": i, "n": i * 2} for i in range(20)])
+
+    def fail(*args, **kwargs):
+        raise duckdb.TransactionException("Current transaction is aborted")
+    monkeypatch.setattr(data_prep, "append_json_file", fail)
+
+    assert data_prep.sync_json_file(db_name, json_path, db_name, natural_keys=NATURAL_KEYS)
+    conn = duckdb.connect(f"{db_name}.duckdb", read_only=True)
+    assert conn.execute("SELECT COUNT(*), SUM(n) FROM items").fetchone() == (20, 380)
+    conn.close()
+
+
+def resolve(db_name, query):
+    from agents import text_index
+
+    conn = duckdb.connect(f"{db_name}.duckdb", read_only=True)
+    leaves = text_index.search_leaves(conn, query, limit=1)
+    text_index.resolve_records(conn, leaves)
+    conn.close()
+    return leaves[0]["json_path"]
+
+
+def test_resolved_paths_follow_item_positions_after_an_append(tmp_path):
+    items = [{"id": i, "job": {"name": f"job{i}"}} for i in range(5)]
+    db_name, json_path = index_items(tmp_path, items)
+    assert resolve(db_name, "job3") == "items[3].job.name"
+
+    # Item 0 is removed, item 2 changed and a new item prepended, so the others move
+    items = [{"id": 9, "job": {"name": "job9"}}] + items[1:]
+    items[2] = {"id": 2, "job": {"name": "renamed"}}
+    write_items(json_path, items)
+    data_prep.append_json_file(db_name, json_path, NATURAL_KEYS)
+
+    assert resolve(db_name, "job9") == "items[0].job.name"
+    assert resolve(db_name, "renamed") == "items[2].job.name"
+    assert resolve(db_name, "job3") == "items[3].job.name"
+    assert resolve(db_name, "job4") == "items[4].job.name"
+    # Kept in the database although it is no longer in the file
+    assert resolve(db_name, "job0").startswith("items[record_id=")
+
+
+def snapshot(db_name):
+    """ Columns and rows of every document table and the indexes, without record ids. """
+    conn = duckdb.connect(f"{db_name}.duckdb", read_only=True)
+    tables = {}
+    for (table_name,) in conn.execute("SELECT table_name FROM schema_info ORDER BY table_name").fetchall():
+        columns = conn.execute(
+            "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = ? AND column_name NOT IN ('record_id', 'parent_id') ORDER BY column_name",
+            [table_name]
+        ).fetchall()
+        select = ", ".join(f'"{name}"' for name, _ in columns)
+        tables[table_name] = (columns, sorted(conn.execute(f'SELECT {select} FROM "{table_name}"').fetchall(), key=repr))
+    for name, query in [
+        ("schema_info", "SELECT table_name, parent_table, is_array, count FROM schema_info"),
+        ("json_leaves", "SELECT path, num_value, str_value, ts_value, bool_value FROM json_leaves"),
+        ("text_leaves", "SELECT table_name, column_name, value FROM text_leaves"),
+        ("item_keys", "SELECT table_name::TEXT, natural_key, content_hash, position FROM item_keys"),
+    ]:
+        tables[name] = sorted(conn.execute(query).fetchall(), key=repr)
+    conn.close()
+    return tables
+
+
+@pytest.mark.parametrize("id_mode", ["sequential", "uuid"])
+def test_append_matches_a_rebuild(tmp_path, id_mode):
+    keys = {"jobs": "job_record.id"}
+    jobs = [{"job_record": {"id": f"job-{i}", "status": "SUCCESS", "pages": i}, "usage": {"files": [f"f{i}.pdf"]}} for i in range(40)]
+    db_name, json_path = str(tmp_path / "appended"), str(tmp_path / "jobs.json")
+    with open(json_path, "w") as f:
+        json.dump({"jobs": jobs, "total_count": len(jobs)}, f)
+    data_prep.index_json_file(db_name, json_path, db_name, id_mode=id_mode, natural_keys=keys)
+
+    jobs[3]["job_record"]["status"] = "RETRIED"
+    jobs[5]["usage"]["files"].append("extra.pdf")
+    jobs[7]["job_record"]["pages"] = "many"
+    jobs[9]["labels"] = {"team": "ops"}
+    jobs += [{"job_record": {"id": f"job-{i}", "status": "QUEUED", "pages": i}, "usage": {"files": []}, "note": "new"} for i in range(40, 45)]
+    with open(json_path, "w") as f:
+        json.dump({"jobs": jobs, "total_count": len(jobs)}, f)
+    # Five new jobs, four changed ones and the changed total_count
+    assert data_prep.append_json_file(db_name, json_path, keys) == 10
+
+    rebuilt = str(tmp_path / "rebuilt")
+    data_prep.index_json_file(rebuilt, json_path, rebuilt, id_mode=id_mode, natural_keys=keys)
+    appended, expected = snapshot(db_name), snapshot(rebuilt)
+    assert appended.keys() == expected.keys()
+    for name in expected:
+        assert appended[name] == expected[name], name
+
+
+def write_jobs(path, jobs):
+    with open(path, "w") as f:
+        json.dump({"jobs": jobs, "total_count": len(jobs)}, f)
+
+
+def count_calls(monkeypatch, name):
+    calls = []
+    function = getattr(data_prep, name)
+
+    def counted(*args, **kwargs):
+        calls.append(args)
+        return function(*args, **kwargs)
+    monkeypatch.setattr(data_prep, name, counted)
+    return calls
+
+
+def test_append_skips_unchanged_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_prep, "ITEM_BLOCK_CHARS", 500)
+    keys = {"jobs": "id"}
+    jobs = [{"id": f"job-{i}", "status": "SUCCESS", "pages": i} for i in range(200)]
+    db_name, json_path = str(tmp_path / "appended"), str(tmp_path / "jobs.json")
+    write_jobs(json_path, jobs)
+    data_prep.index_json_file(db_name, json_path, db_name, natural_keys=keys)
+
+    jobs[50]["status"] = "RETRIED"
+    jobs += [{"id": f"job-{i}", "status": "QUEUED", "pages": i} for i in range(200, 210)]
+    write_jobs(json_path, jobs)
+    keyed = count_calls(monkeypatch, "key_item")
+    assert data_prep.append_json_file(db_name, json_path, keys) == 12
+    # Only the block holding the changed job, the appended tail and total_count are read
+    assert len(keyed) < 40
+
+    # A later append starts from the blocks recorded by this one
+    jobs[120]["pages"] = "many"
+    write_jobs(json_path, jobs)
+    keyed.clear()
+    assert data_prep.append_json_file(db_name, json_path, keys) == 1
+    assert len(keyed) < 20
+
+    rebuilt = str(tmp_path / "rebuilt")
+    data_prep.index_json_file(rebuilt, json_path, rebuilt, natural_keys=keys)
+    assert snapshot(db_name) == snapshot(rebuilt)
+
+
+def test_append_reads_every_item_when_a_key_moves_into_a_changed_block(tmp_path, monkeypatch):
+    keys = {"jobs": "id"}
+    jobs = [{"id": f"job-{i}", "pages": i} for i in range(200)]
+    write_jobs(str(tmp_path / "jobs.json"), jobs)
+    # One database is indexed in small blocks, the other in a single block
+    monkeypatch.setattr(data_prep, "ITEM_BLOCK_CHARS", 500)
+    data_prep.index_json_file(str(tmp_path / "blocks"), str(tmp_path / "jobs.json"), "blocks", natural_keys=keys)
+    monkeypatch.undo()
+    data_prep.index_json_file(str(tmp_path / "whole"), str(tmp_path / "jobs.json"), "whole", natural_keys=keys)
+
+    # Job 50 takes the key of job 150, whose block is unchanged
+    jobs[50]["id"] = "job-150"
+    write_jobs(str(tmp_path / "jobs.json"), jobs)
+    reads = count_calls(monkeypatch, "read_items")
+    data_prep.append_json_file(str(tmp_path / "blocks"), str(tmp_path / "jobs.json"), keys)
+    assert len(reads) == 2
+    data_prep.append_json_file(str(tmp_path / "whole"), str(tmp_path / "jobs.json"), keys)
+    assert snapshot(str(tmp_path / "blocks")) == snapshot(str(tmp_path / "whole"))
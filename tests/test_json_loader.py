@@ -0,0 +1,52 @@
+import json
+
+import duckdb
+import pytest
+
+from agents.json_loader import NESTED_FIELDS_HINTS, load_sections
+
+DOCUMENT = {
+    "jobs": [
+        {"id": "job-1", "job_record": {"status": "SUCCESS", "pages": 3}, "tags": ["a", "b"]},
+        {"id": "job-2", "job_record": {"status": "ERROR", "pages": 5}, "tags": []},
+    ],
+    "metadata": {"source": "test", "owner": {"name": "ops"}},
+    "total_count": 2,
+}
+
+
+@pytest.fixture
+def json_path(tmp_path):
+    path = tmp_path / "jobs.json"
+    path.write_text(json.dumps(DOCUMENT))
+    return str(path)
+
+
+def test_native_backend_keeps_nested_objects_as_structs(json_path):
+    conn = duckdb.connect()
+    assert load_sections(conn, json_path, backend="native") == ["jobs", "metadata"]
+    columns = dict(conn.execute("SELECT column_name, data_type FROM information_schema.columns WHERE table_name = 'jobs'").fetchall())
+    assert columns["job_record"].startswith("STRUCT(")
+    assert columns["tags"] == "VARCHAR[]"
+    # The access pattern the prompts document
+    assert "job_record.status" in NESTED_FIELDS_HINTS["native"]
+    assert conn.execute("SELECT id FROM jobs WHERE job_record.status = 'ERROR'").fetchall() == [("job-2",)]
+    assert conn.execute("SELECT owner.name FROM metadata").fetchall() == [("ops",)]
+
+
+def test_pandas_backend_flattens_nested_objects_into_quoted_columns(json_path):
+    conn = duckdb.connect()
+    assert load_sections(conn, json_path, backend="pandas") == ["jobs", "metadata"]
+    columns = [row[0] for row in conn.execute("DESCRIBE jobs").fetchall()]
+    assert {"id", "job_record.status", "job_record.pages", "tags"} <= set(columns)
+    assert '"job_record.status"' in NESTED_FIELDS_HINTS["pandas"]
+    assert conn.execute("""SELECT id FROM jobs WHERE "job_record.status" = 'ERROR'""").fetchall() == [("job-2",)]
+
+
+def test_missing_and_scalar_sections_are_rejected(json_path):
+    conn = duckdb.connect()
+    for backend in ("native", "pandas"):
+        with pytest.raises(KeyError):
+            load_sections(conn, json_path, ["missing"], backend=backend)
+        with pytest.raises(ValueError):
+            load_sections(conn, json_path, ["total_count"], backend=backend)
@@ -0,0 +1,76 @@
+import datetime
+
+import duckdb
+import pytest
+
+import data_prep
+
+DOCUMENT = {
+    "jobs": [
+        {
+            "job_record": {"id": "a", "status": "SUCCESS", "created": "2024-01-02T03:04:05"},
+            "usage_metrics": {"feature_usage": {"pdf-pages": 12}},
+            "tags": [{"name": "x", "ok": True}],
+        },
+        {
+            "job_record": {"id": "b", "status": "FAILED", "created": "2024-02-01T00:00:00"},
+            "usage_metrics": {"feature_usage": {"pdf-pages": 3}},
+            "tags": [],
+        },
+    ],
+    "meta": {"count": 2},
+}
+
+
+def index(tmp_path, id_mode="sequential"):
+    db_name = str(tmp_path / "jobs")
+    data_prep.index_json(db_name, DOCUMENT, db_name, id_mode=id_mode)
+    return duckdb.connect(f"{db_name}.duckdb", read_only=True)
+
+
+def test_every_scalar_is_a_typed_leaf_of_its_top_level_record(tmp_path):
+    conn = index(tmp_path)
+    leaves = conn.execute("SELECT root_id, path, num_value, str_value, ts_value, bool_value FROM json_leaves").fetchall()
+    conn.close()
+    assert leaves == [
+        (1, "jobs[].job_record.created", None, None, datetime.datetime(2024, 1, 2, 3, 4, 5), None),
+        (2, "jobs[].job_record.created", None, None, datetime.datetime(2024, 2, 1), None),
+        (1, "jobs[].job_record.id", None, "a", None, None),
+        (2, "jobs[].job_record.id", None, "b", None, None),
+        # Sorted by path, then value
+        (2, "jobs[].job_record.status", None, "FAILED", None, None),
+        (1, "jobs[].job_record.status", None, "SUCCESS", None, None),
+        (1, "jobs[].tags[].name", None, "x", None, None),
+        (1, "jobs[].tags[].ok", None, None, None, True),
+        (2, "jobs[].usage_metrics.feature_usage.pdf-pages", 3.0, None, None, None),
+        (1, "jobs[].usage_metrics.feature_usage.pdf-pages", 12.0, None, None, None),
+        (1, "meta.count", 2.0, None, None, None),
+    ]
+
+
+def test_range_lookups_match_the_join_through_child_tables(tmp_path):
+    conn = index(tmp_path)
+    by_leaf = conn.execute("""
+        SELECT root_id FROM json_leaves
+        WHERE path = 'jobs[].usage_metrics.feature_usage.pdf-pages' AND num_value > 10
+    """).fetchall()
+    by_join = conn.execute("""
+        SELECT j.record_id FROM jobs j
+        JOIN jobs_usage_metrics u ON u.parent_id = j.record_id
+        JOIN jobs_usage_metrics_feature_usage f ON f.parent_id = u.record_id
+        WHERE f."pdf-pages" > 10
+    """).fetchall()
+    conn.close()
+    assert by_leaf == by_join == [(1,)]
+
+
+@pytest.mark.parametrize("id_mode", ["sequential", "uuid"])
+def test_root_ids_use_the_id_type_of_the_records(tmp_path, id_mode):
+    conn = index(tmp_path, id_mode)
+    assert conn.execute("SELECT data_type FROM information_schema.columns WHERE table_name = 'json_leaves' AND column_name = 'root_id'").fetchone() == (data_prep.ID_TYPES[id_mode],)
+    # Every leaf of a tag leads back to the job that has it
+    assert conn.execute("""
+        SELECT DISTINCT j.job_record->>'id' FROM json_leaves l JOIN jobs j ON j.record_id = l.root_id
+        WHERE l.path LIKE 'jobs[].tags[].%'
+    """).fetchall() == [("a",)]
+    conn.close()
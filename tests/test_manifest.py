@@ -0,0 +1,25 @@
+import json
+
+import pytest
+
+import data_prep
+
+
+def test_failed_indexing_leaves_no_manifest(tmp_path, monkeypatch):
+    db_name, json_path = str(tmp_path / "items"), str(tmp_path / "items.json")
+    with open(json_path, "w") as f:
+        json.dump({"items": [{"id": i} for i in range(10)]}, f)
+
+    def fail(conn, *args, **kwargs):
+        conn.close()
+        raise RuntimeError("finalize failed")
+    monkeypatch.setattr(data_prep, "finalize_index", fail)
+
+    with pytest.raises(RuntimeError):
+        data_prep.index_json_file(db_name, json_path, db_name)
+    assert not data_prep.read_manifest(db_name)
+
+    monkeypatch.undo()
+    assert data_prep.sync_json_file(db_name, json_path, db_name)
+    assert list(data_prep.read_manifest(db_name)) == [json_path]
+    assert not data_prep.sync_json_file(db_name, json_path, db_name)
@@ -0,0 +1,71 @@
+import json
+
+import duckdb
+import pytest
+
+import data_prep
+
+NATURAL_KEYS = {"jobs": "job_record.id"}
+
+
+def relations(conn):
+    """ Columns of every table and view, with ENUM columns as the VARCHAR they are exported as. """
+    rows = conn.execute("""
+        SELECT table_name, column_name, CASE WHEN data_type LIKE 'ENUM%' THEN 'VARCHAR' ELSE data_type END
+        FROM duckdb_columns() WHERE database_name = current_database() AND schema_name = 'main' AND NOT internal
+        ORDER BY table_name, column_index
+    """).fetchall()
+    columns = {}
+    for table_name, column_name, data_type in rows:
+        columns.setdefault(table_name, []).append((column_name, data_type))
+    return columns
+
+
+def contents(conn, relation, exclude=()):
+    columns = ", ".join(f'"{name}"' for name, _ in relations(conn)[relation] if name not in exclude)
+    return sorted(conn.execute(f'SELECT {columns} FROM "{relation}"').fetchall(), key=repr)
+
+
+@pytest.fixture
+def indexed(tmp_path):
+    jobs = [
+        {"job_record": {"id": f"job-{i}", "status": "ERROR" if i % 3 else "SUCCESS"}, "usage_metrics": {"feature_usage": {"pdf-pages": i}}, "tags": ["a", f"t{i}"]}
+        for i in range(20)
+    ]
+    json_path = tmp_path / "jobs.json"
+    json_path.write_text(json.dumps({"jobs": jobs, "total_count": len(jobs), "meta": {"source": "test"}}))
+    db_name = str(tmp_path / "indexed")
+    data_prep.index_json_file(db_name, str(json_path), db_name, wide_tables=True, natural_keys=NATURAL_KEYS)
+    return db_name, str(json_path)
+
+
+@pytest.mark.parametrize("materialize", [False, True])
+def test_loaded_export_matches_the_indexed_database(tmp_path, indexed, materialize):
+    db_name, json_path = indexed
+    export_dir = str(tmp_path / "export")
+    data_prep.export_database(db_name, export_dir)
+    loaded_name = str(tmp_path / "loaded")
+    data_prep.load_exported_database(loaded_name, export_dir, json_path, materialize)
+
+    original = duckdb.connect(f"{db_name}.duckdb", read_only=True)
+    loaded = duckdb.connect(f"{loaded_name}.duckdb", read_only=True)
+    assert relations(loaded) == relations(original)
+    for relation in relations(original):
+        exclude = ("indexed_at",) if relation == "ingestion_manifest" else ("built_at",) if relation == "prompt_context" else ()
+        assert contents(loaded, relation, exclude) == contents(original, relation, exclude), relation
+    assert contents(loaded, "item_keys")
+    original.close()
+    loaded.close()
+
+    # The loaded database records the local source file, so it is up to date
+    assert not data_prep.sync_json_file(loaded_name, json_path, loaded_name, natural_keys=NATURAL_KEYS)
+
+
+def test_exports_of_another_schema_version_are_rejected(tmp_path, indexed, monkeypatch):
+    db_name, _ = indexed
+    export_dir = str(tmp_path / "export")
+    data_prep.export_database(db_name, export_dir)
+    monkeypatch.setattr(data_prep, "SCHEMA_VERSION", data_prep.SCHEMA_VERSION + 1)
+    assert data_prep.read_export_manifest(export_dir) is None
+    with pytest.raises(ValueError):
+        data_prep.load_exported_database(str(tmp_path / "loaded"), export_dir)
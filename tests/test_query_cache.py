@@ -0,0 +1,130 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from agents import connections, query_cache
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    query_cache.invalidate()
+    monkeypatch.setattr(query_cache, "cache_bytes", 0)
+    monkeypatch.setattr(query_cache, "stats", {key: 0 for key in query_cache.stats})
+    yield
+    query_cache.invalidate()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(query_cache, "time", SimpleNamespace(monotonic=lambda: now[0], perf_counter=time.perf_counter))
+    return now
+
+
+def test_equivalent_spellings_share_an_entry():
+    assert query_cache.normalize_sql("  SELECT *\n\tFROM  jobs ;  ") == "SELECT * FROM jobs"
+    assert query_cache.normalize_sql("select 1;") == query_cache.normalize_sql("select   1")
+    # Quoted literals and identifiers keep their whitespace
+    assert query_cache.normalize_sql("SELECT 'a  b' AS \"x  y\"") == "SELECT 'a  b' AS \"x  y\""
+    assert query_cache.normalize_sql("SELECT 'a  b'") != query_cache.normalize_sql("SELECT 'a b'")
+
+    query_cache.put("db", 1, "SELECT  *\nFROM jobs;", "rows")
+    assert query_cache.get("db", 1, "SELECT * FROM jobs") == "rows"
+
+
+def test_only_reading_statements_are_cached():
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "result"
+    for query in ["DELETE FROM jobs", "INSERT INTO jobs VALUES (1)", ""]:
+        query_cache.cached("db", 1, query, compute)
+        query_cache.cached("db", 1, query, compute)
+    assert len(calls) == 6
+    assert query_cache.is_cacheable("  (SELECT 1)") and query_cache.is_cacheable("WITH x AS (SELECT 1) SELECT * FROM x")
+
+
+def test_least_recently_used_entries_are_evicted_first(monkeypatch):
+    monkeypatch.setattr(query_cache, "QUERY_CACHE_BYTES", 30)
+    for name in ("a", "b", "c"):
+        query_cache.put("db", 1, f"SELECT '{name}'", name * 10)
+    # Reading a makes b the least recently used
+    assert query_cache.get("db", 1, "SELECT 'a'") == "a" * 10
+    query_cache.put("db", 1, "SELECT 'd'", "d" * 10)
+    assert query_cache.get("db", 1, "SELECT 'b'") is None
+    assert [query_cache.get("db", 1, f"SELECT '{name}'") for name in ("a", "c", "d")] == ["a" * 10, "c" * 10, "d" * 10]
+    assert query_cache.cache_stats()["evictions"] == 1
+
+
+def test_the_byte_budget_caps_the_cache(monkeypatch):
+    monkeypatch.setattr(query_cache, "QUERY_CACHE_BYTES", 100)
+    for i in range(50):
+        query_cache.put("db", 1, f"SELECT {i}", "x" * 30)
+        assert query_cache.cache_stats()["bytes"] <= 100
+    assert query_cache.cache_stats()["entries"] == 3
+    # A single result larger than the budget is not cached at all
+    query_cache.put("db", 1, "SELECT 'huge'", "x" * 101)
+    assert query_cache.get("db", 1, "SELECT 'huge'") is None
+    assert query_cache.cache_stats()["entries"] == 3
+
+    # Replacing an entry does not count its old size twice
+    query_cache.put("db", 1, "SELECT 49", "y" * 30)
+    assert query_cache.cache_stats()["bytes"] == 90
+
+
+def test_entries_expire_after_the_ttl(monkeypatch, clock):
+    monkeypatch.setattr(query_cache, "QUERY_CACHE_TTL", 60)
+    query_cache.put("db", 1, "SELECT 1", "one")
+    clock[0] += 59
+    assert query_cache.get("db", 1, "SELECT 1") == "one"
+    clock[0] += 2
+    assert query_cache.get("db", 1, "SELECT 1") is None
+    assert query_cache.cache_stats()["entries"] == 0
+
+
+def test_invalidate_drops_only_the_given_database():
+    query_cache.put("a", 1, "SELECT 1", "a")
+    query_cache.put("b", 1, "SELECT 1", "b")
+    query_cache.invalidate("a")
+    assert query_cache.get("a", 1, "SELECT 1") is None
+    assert query_cache.get("b", 1, "SELECT 1") == "b"
+
+
+def test_a_reindexed_database_gets_a_new_version(tmp_path):
+    db_name, json_path = str(tmp_path / "jobs"), str(tmp_path / "jobs.json")
+
+    def index(count):
+        with open(json_path, "w") as f:
+            json.dump({"jobs": [{"id": i} for i in range(count)]}, f)
+        # Indexed in another process, like the workers started by main.py
+        subprocess.run([sys.executable, "-c", "import sys, data_prep; data_prep.sync_json_file(*sys.argv[1:])", db_name, json_path, db_name],
+                       cwd=REPO_DIR, check=True)
+
+    def count_jobs():
+        query = "SELECT COUNT(*) FROM jobs"
+
+        def run():
+            with connections.borrow_cursor(db_name) as cursor:
+                return str(cursor.execute(query).fetchone()[0])
+        return query_cache.cached(db_name, connections.get_version(db_name), query, run)
+
+    try:
+        index(3)
+        assert count_jobs() == "3"
+        assert count_jobs() == "3"
+        assert query_cache.cache_stats()["hits"] == 1
+
+        # Rebuilt without invalidating the cache: the new version misses the old entry
+        index(5)
+        assert count_jobs() == "5"
+        assert query_cache.cache_stats()["misses"] == 2
+    finally:
+        connections.invalidate(db_name)
@@ -0,0 +1,66 @@
+import os
+
+import duckdb
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+from agents import connections, tools  # noqa: E402
+
+
+@pytest.fixture
+def db_name(tmp_path):
+    name = str(tmp_path / "numbers")
+    with duckdb.connect(connections.db_path(name)) as conn:
+        conn.execute("CREATE TABLE numbers AS SELECT range AS n, repeat('x', 50) AS padding FROM range(500)")
+    yield name
+    connections.invalidate(name)
+
+
+def footer(output):
+    return output.rstrip("\n").rsplit("\n", 1)[-1]
+
+
+def test_cells_are_single_line_and_bounded():
+    assert tools.format_cell("a\nb|c") == "a b\\|c"
+    assert tools.format_cell("y" * 10, width=8) == "yyyyy..."
+
+
+def test_tables_stop_before_the_byte_budget():
+    rows = [(i, "x" * 20) for i in range(100)]
+    table, shown = tools.format_table(["n", "text"], rows, max_bytes=200)
+    assert len(table) <= 200
+    assert shown == len(table.splitlines()) - 2
+    assert 0 < shown < 100
+
+    # A single row wider than the budget is still shown
+    table, shown = tools.format_table(["text"], [("x" * 500,)], max_bytes=100)
+    assert shown == 1
+
+
+def test_small_results_have_no_footer(db_name):
+    output = tools.run_query(db_name, "SELECT n FROM numbers WHERE n < 3")
+    assert "truncated" not in output
+    assert output.splitlines()[2:] == ["| 0 |", "| 1 |", "| 2 |"]
+    assert tools.run_query(db_name, "SELECT n FROM numbers WHERE n < 0") == "No results found"
+
+
+def test_the_footer_counts_rows_past_the_row_limit(db_name, monkeypatch):
+    monkeypatch.setattr(tools, "QUERY_MAX_ROWS", 10)
+    output = tools.run_query(db_name, "SELECT n FROM numbers;")
+    assert len(output.split("\n\n")[0].splitlines()) == 12
+    assert footer(output).startswith("(truncated, 490 more rows; 500 rows in total.")
+
+    # Statements that can't be counted as a subquery are counted by reading them
+    output = tools.run_query(db_name, "PRAGMA table_info('numbers')")
+    assert "truncated" not in output
+    monkeypatch.setattr(tools, "QUERY_MAX_ROWS", 1)
+    assert footer(tools.run_query(db_name, "PRAGMA table_info('numbers')")).startswith("(truncated, 1 more rows; 2 rows in total.")
+
+
+def test_the_footer_counts_rows_cut_by_the_byte_limit(db_name, monkeypatch):
+    monkeypatch.setattr(tools, "QUERY_MAX_BYTES", 1000)
+    output = tools.run_query(db_name, "SELECT * FROM numbers WHERE n < 50")
+    table = output.split("\n\n")[0]
+    shown = len(table.splitlines()) - 2
+    assert len(table) <= 1000
+    assert footer(output).startswith(f"(truncated, {50 - shown} more rows; 50 rows in total.")
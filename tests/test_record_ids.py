@@ -0,0 +1,82 @@
+import json
+
+import duckdb
+import pytest
+
+import data_prep
+
+DOCUMENT = {
+    "jobs": [
+        {"name": "a", "owner": {"team": "t1"}, "steps": [{"cmd": "x", "args": [{"v": 1}]}, {"cmd": "y"}]},
+        {"name": "b", "owner": {"team": "t2"}, "steps": [{"cmd": "z"}]},
+    ]
+}
+TABLES = ["jobs", "jobs_owner", "jobs_steps", "jobs_steps_args"]
+
+
+def snapshot(db_name):
+    """Ids of every table and the relationship graph of a database."""
+    conn = duckdb.connect(f"{db_name}.duckdb", read_only=True)
+    rows = {table: conn.execute(f"SELECT * EXCLUDE (record_id), record_id FROM {table} ORDER BY record_id").fetchall() for table in TABLES}
+    rows["record_relationships"] = conn.execute("SELECT * FROM record_relationships ORDER BY ALL").fetchall()
+    conn.close()
+    return rows
+
+
+def test_ids_are_dense_per_table_and_children_point_at_their_parent(tmp_path):
+    db_name = str(tmp_path / "jobs")
+    data_prep.index_json(db_name, DOCUMENT, db_name)
+    conn = duckdb.connect(f"{db_name}.duckdb", read_only=True)
+
+    assert conn.execute("SELECT record_id, name FROM jobs ORDER BY record_id").fetchall() == [(1, "a"), (2, "b")]
+    assert conn.execute("SELECT record_id, parent_id, team FROM jobs_owner ORDER BY record_id").fetchall() == [(1, 1, "t1"), (2, 2, "t2")]
+    assert conn.execute("SELECT record_id, parent_id, cmd FROM jobs_steps ORDER BY record_id").fetchall() == [(1, 1, "x"), (2, 1, "y"), (3, 2, "z")]
+    assert conn.execute("SELECT record_id, parent_id FROM jobs_steps_args").fetchall() == [(1, 1)]
+
+    # parent_id on the child tables agrees with the relationship graph
+    for table in TABLES[1:]:
+        assert conn.execute(f"""
+            SELECT COUNT(*) FROM {table} t
+            LEFT JOIN record_relationships r ON r.child_table = '{table}' AND r.child_id = t.record_id
+            WHERE r.parent_id IS DISTINCT FROM t.parent_id
+        """).fetchone() == (0,)
+    assert conn.execute("SELECT relationship_type FROM record_relationships WHERE child_table = 'jobs_steps' ORDER BY child_id").fetchall() == [
+        ("array_item[0]",), ("array_item[1]",), ("array_item[0]",)
+    ]
+    conn.close()
+
+
+def test_table_names_are_an_enum_of_the_indexed_tables(tmp_path):
+    db_name = str(tmp_path / "jobs")
+    data_prep.index_json(db_name, DOCUMENT, db_name)
+    conn = duckdb.connect(f"{db_name}.duckdb", read_only=True)
+    types = dict(conn.execute("SELECT column_name, data_type FROM information_schema.columns WHERE table_name = 'record_relationships'").fetchall())
+    conn.close()
+    assert types["child_id"] == types["parent_id"] == "BIGINT"
+    assert types["child_table"] == types["parent_table"] == "ENUM(" + ", ".join(f"'{table}'" for table in TABLES) + ")"
+
+
+def test_reindexing_produces_the_same_ids(tmp_path):
+    json_path = str(tmp_path / "jobs.json")
+    with open(json_path, "w") as f:
+        json.dump(DOCUMENT, f)
+    data_prep.index_json(str(tmp_path / "first"), DOCUMENT, "first")
+    data_prep.index_json(str(tmp_path / "second"), DOCUMENT, "second")
+    # The streaming file loader assigns ids the same way
+    data_prep.index_json_file(str(tmp_path / "streamed"), json_path, "streamed")
+    assert snapshot(str(tmp_path / "first")) == snapshot(str(tmp_path / "second")) == snapshot(str(tmp_path / "streamed"))
+
+
+@pytest.mark.parametrize("id_mode", ["sequential", "uuid"])
+def test_hierarchy_joins_follow_parent_id(tmp_path, id_mode):
+    db_name = str(tmp_path / "jobs")
+    data_prep.index_json(db_name, DOCUMENT, db_name, id_mode=id_mode)
+    conn = duckdb.connect(f"{db_name}.duckdb", read_only=True)
+    assert conn.execute("SELECT data_type FROM information_schema.columns WHERE table_name = 'jobs_steps' AND column_name = 'parent_id'").fetchone() == (data_prep.ID_TYPES[id_mode],)
+    assert conn.execute("""
+        SELECT j.name, s.cmd, a.v FROM jobs j
+        JOIN jobs_steps s ON s.parent_id = j.record_id
+        LEFT JOIN jobs_steps_args a ON a.parent_id = s.record_id
+        ORDER BY ALL
+    """).fetchall() == [("a", "x", 1), ("a", "y", None), ("b", "z", None)]
+    conn.close()
@@ -0,0 +1,83 @@
+import json
+import os
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+from agents import agent  # noqa: E402
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "users": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "profile": {"type": "object", "properties": {"security": {"type": "object", "properties": {"mfa": {"type": "boolean"}}}}},
+                },
+            },
+        },
+        "version": {"type": "string"},
+    },
+}
+
+
+@pytest.fixture
+def schema_path(tmp_path):
+    path = str(tmp_path / "schema.json")
+    with open(path, "w") as f:
+        json.dump(SCHEMA, f)
+    yield path
+    agent.schema_indexes.pop(os.path.abspath(path), None)
+
+
+def section(schema_path, section_path):
+    return json.loads(agent.load_json_schema_section(schema_path, section_path))
+
+
+def test_sections_are_looked_up_by_dot_path(schema_path):
+    assert section(schema_path, "") == SCHEMA
+    assert section(schema_path, "users") == SCHEMA["properties"]["users"]
+    # Arrays are stepped through to their items
+    assert section(schema_path, "users.profile.security.mfa") == {"type": "boolean"}
+    assert agent.get_schema_index(schema_path)["children"]["users.profile"] == ["security"]
+
+
+def test_subsections_are_listed(schema_path):
+    assert agent.view_available_sections.invoke({"schema_path": schema_path}) == "Available sections: users, version"
+    assert agent.view_available_sections.invoke({"schema_path": schema_path, "section_path": "users"}) == "Available sections: users.name, users.profile"
+    assert agent.view_available_sections.invoke({"schema_path": schema_path, "section_path": "version"}) == "No subsections available at this path"
+    assert agent.view_available_sections.invoke({"schema_path": schema_path, "section_path": "missing"}) == "No subsections available at this path"
+
+
+def test_invalid_paths_are_reported_and_not_memoized(schema_path):
+    assert section(schema_path, "users.nickname") == {"error": "Invalid path: users.nickname"}
+    assert section(schema_path, "version.length") == {"error": "Invalid path: version.length"}
+    assert list(agent.get_schema_index(schema_path)["rendered"]) == []
+
+    section(schema_path, "users.name")
+    assert list(agent.get_schema_index(schema_path)["rendered"]) == ["users.name"]
+
+
+def test_the_index_is_built_once_per_schema_version(schema_path, monkeypatch):
+    index = agent.get_schema_index(schema_path)
+    built = []
+    build_schema_index = agent.build_schema_index
+
+    def counting_build(schema):
+        built.append(schema)
+        return build_schema_index(schema)
+    monkeypatch.setattr(agent, "build_schema_index", counting_build)
+
+    section(schema_path, "users")
+    assert agent.get_schema_index(schema_path) is index and built == []
+
+    with open(schema_path, "w") as f:
+        json.dump({"properties": {"orders": {"type": "object"}}}, f)
+    stat = os.stat(schema_path)
+    os.utime(schema_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert section(schema_path, "orders") == {"type": "object"}
+    assert section(schema_path, "users") == {"error": "Invalid path: users"}
+    assert len(built) == 1
@@ -0,0 +1,95 @@
+import json
+import os
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+from agents import agent  # noqa: E402
+
+SECTIONS = {name: [{"n": i} for i in range(100)] for name in ("a", "b", "c")}
+
+
+@pytest.fixture
+def json_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "sections.json")
+    with open(path, "w") as f:
+        json.dump(SECTIONS, f)
+    # The pandas backend sizes sections by their data frames, which is deterministic
+    monkeypatch.setattr(agent, "JSON_BACKEND", "pandas")
+    yield path
+    with agent.sections_lock:
+        for key in list(agent.loaded_sections):
+            agent.drop_section(key)
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    paths = []
+    read_json_file = agent.read_json_file
+
+    def counting_read(path):
+        paths.append(path)
+        return read_json_file(path)
+    monkeypatch.setattr(agent, "read_json_file", counting_read)
+    return paths
+
+
+def cached_sections():
+    return [key[2] for key in agent.loaded_sections]
+
+
+def test_repeated_queries_reuse_the_loaded_section(json_path, reads):
+    assert "4950" in agent.query_json("SELECT SUM(n) FROM json_data", json_path, "a")
+    entry = agent.load_section(json_path, "a")
+    assert "100" in agent.query_json("SELECT COUNT(*) FROM json_data", json_path, "a")
+    assert len(reads) == 1
+    assert agent.load_section(json_path, "a") is entry
+    assert agent.sections_bytes == entry["bytes"] > 0
+
+
+def test_a_changed_file_replaces_its_stale_sections(json_path, reads):
+    old = agent.load_section(json_path, "a")
+    with open(json_path, "w") as f:
+        json.dump({"a": [{"n": 7}]}, f)
+    stat = os.stat(json_path)
+    os.utime(json_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    assert agent.query_json("SELECT MAX(n) AS total FROM json_data", json_path, "a").split()[-1] == "7"
+    assert len(reads) == 2
+    assert old["cursor"] is None
+    assert cached_sections() == ["a"]
+
+
+def test_least_recently_used_sections_are_evicted(json_path, monkeypatch):
+    size = agent.load_section(json_path, "a")["bytes"]
+    monkeypatch.setattr(agent, "SECTION_CACHE_BYTES", 2 * size)
+    evicted = agent.load_section(json_path, "b")
+    # Using a makes b the least recently used
+    agent.load_section(json_path, "a")
+    agent.load_section(json_path, "c")
+
+    assert cached_sections() == ["a", "c"]
+    assert evicted["cursor"] is None
+    assert agent.sections_bytes == 2 * size
+    # An evicted section is loaded again on its next query
+    assert "4950" in agent.query_json("SELECT SUM(n) FROM json_data", json_path, "b")
+    assert cached_sections() == ["c", "b"]
+
+
+def test_the_section_just_loaded_is_kept_over_budget(json_path, monkeypatch):
+    monkeypatch.setattr(agent, "SECTION_CACHE_BYTES", 1)
+    agent.load_section(json_path, "a")
+    agent.load_section(json_path, "b")
+    assert cached_sections() == ["b"]
+    assert "4950" in agent.query_json("SELECT SUM(n) FROM json_data", json_path, "b")
+
+
+def test_native_sections_are_dropped_with_their_table(json_path, monkeypatch):
+    monkeypatch.setattr(agent, "JSON_BACKEND", "native")
+    entry = agent.load_section(json_path, "a")
+    assert entry["table"] and "4950" in agent.query_json("SELECT SUM(n) FROM json_data", json_path, "a")
+
+    with agent.sections_lock:
+        agent.drop_section(next(iter(agent.loaded_sections)))
+    tables = agent.section_conn.execute("SELECT table_name FROM duckdb_tables()").fetchall()
+    assert (entry["table"],) not in tables
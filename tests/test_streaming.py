@@ -0,0 +1,103 @@
+import json
+from types import GeneratorType
+
+import duckdb
+import pytest
+
+import data_prep
+from data_prep import iter_json_sections
+
+
+def sections(path, chunk_size=7, with_text=False):
+    """ Consumes iter_json_sections, turning array generators into lists. """
+    return [
+        (key, list(value) if isinstance(value, GeneratorType) else value)
+        for key, value in iter_json_sections(str(path), chunk_size, with_text)
+    ]
+
+
+def write(tmp_path, text):
+    path = tmp_path / "document.json"
+    path.write_text(text, encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 1 << 20])
+def test_sections_match_the_parsed_document(tmp_path, chunk_size):
+    document = {
+        "jobs": [{"id": i, "name": f"job {i}", "score": i * 1.5, "tags": ["a", None]} for i in range(50)],
+        "empty": [],
+        "nested": [[1, 2], [], [[3]]],
+        "meta": {"source": "tést ✓", "escaped": "quote \" and \\u0041", "limits": {"max": 12345678901234567890}},
+        "count": 1234567,
+        "ratio": -0.000125e-3,
+        "flag": False,
+        "missing": None,
+        "label": "done",
+    }
+    path = write(tmp_path, json.dumps(document, indent=2, ensure_ascii=False))
+    assert dict(sections(path, chunk_size)) == document
+
+
+def test_empty_documents_and_arrays(tmp_path):
+    assert sections(write(tmp_path, "{}")) == []
+    assert sections(write(tmp_path, ' \n { } \n')) == []
+    assert sections(write(tmp_path, '{"a": [], "b": [ ], "c": [\n]}')) == [("a", []), ("b", []), ("c", [])]
+
+
+@pytest.mark.parametrize("text", ["42", '"text"', "null", "[1, 2]", ""])
+def test_a_root_that_is_not_an_object_is_rejected(tmp_path, text):
+    with pytest.raises(ValueError):
+        sections(write(tmp_path, text))
+
+
+@pytest.mark.parametrize("text", ['{"a": [1, 2', '{"a": 1 "b": 2}', '{"a": [1 2]}', '{"a": '])
+def test_malformed_documents_are_rejected(tmp_path, text):
+    with pytest.raises(ValueError):
+        sections(write(tmp_path, text))
+
+
+def test_values_larger_than_the_chunk_size(tmp_path):
+    huge = "x" * 100000 + "é" * 1000 + "\\" * 10
+    document = {"before": 1, "items": [{"text": huge}, huge, 12345678901234567890], "after": huge}
+    path = write(tmp_path, json.dumps(document))
+    assert dict(sections(path, chunk_size=64)) == document
+
+
+def test_with_text_yields_the_source_text_of_array_items(tmp_path):
+    path = write(tmp_path, '{"items": [ {"id": 1,  "v": [1, 2]} ,\n"s", 3.50 ], "meta": {"a": 1}}')
+    assert sections(path, chunk_size=4, with_text=True) == [
+        ("items", [({"id": 1, "v": [1, 2]}, '{"id": 1,  "v": [1, 2]}'), ("s", '"s"'), (3.5, "3.50")]),
+        ("meta", {"a": 1}),
+    ]
+
+
+def test_unconsumed_array_items_are_skipped(tmp_path):
+    path = write(tmp_path, json.dumps({"items": list(range(100)), "after": "end"}))
+    parsed = {}
+    for key, value in iter_json_sections(str(path), chunk_size=8):
+        if isinstance(value, GeneratorType):
+            parsed[key] = next(value)
+        else:
+            parsed[key] = value
+    assert parsed == {"items": 0, "after": "end"}
+
+
+def test_scalar_arrays_are_stored_like_the_streaming_path(tmp_path):
+    document = {"tags": ["a", "b", 3], "mixed": [{"id": 1}, "x"], "jobs": [{"id": 1}]}
+    path = write(tmp_path, json.dumps(document))
+    data_prep.index_json(str(tmp_path / "loaded"), document, "loaded")
+    data_prep.index_json_file(str(tmp_path / "streamed"), str(path), "streamed")
+
+    rows = {}
+    for name in ("loaded", "streamed"):
+        conn = duckdb.connect(str(tmp_path / f"{name}.duckdb"), read_only=True)
+        rows[name] = (
+            conn.execute("SELECT record_id, value FROM tags ORDER BY record_id").fetchall(),
+            conn.execute("SELECT id, value FROM mixed ORDER BY record_id").fetchall(),
+            conn.execute("SELECT table_name, is_array, count FROM schema_info ORDER BY table_name").fetchall(),
+        )
+        conn.close()
+    assert rows["loaded"][0] == [(1, "a"), (2, "b"), (3, "3")]
+    assert rows["loaded"][1] == [(1, None), (None, "x")]
+    assert rows["loaded"] == rows["streamed"]
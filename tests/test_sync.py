@@ -0,0 +1,86 @@
+import json
+import os
+
+import duckdb
+
+import data_prep
+
+
+def write_jobs(path, count, status="SUCCESS"):
+    with open(path, "w") as f:
+        json.dump({"jobs": [{"job_record": {"id": f"job-{i}", "status": status}} for i in range(count)], "total_count": count}, f)
+
+
+def job_count(db_name):
+    conn = duckdb.connect(f"{db_name}.duckdb", read_only=True)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_unchanged_files_are_skipped(tmp_path, monkeypatch):
+    db_name, json_path = str(tmp_path / "jobs"), str(tmp_path / "jobs.json")
+    write_jobs(json_path, 5)
+    assert data_prep.sync_json_file(db_name, json_path, db_name)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the file should not be read")
+    monkeypatch.setattr(data_prep, "hash_file", fail)
+    monkeypatch.setattr(data_prep, "index_json_file", fail)
+    assert not data_prep.sync_json_file(db_name, json_path, db_name)
+
+
+def test_a_touched_file_with_the_same_content_refreshes_the_manifest(tmp_path, monkeypatch):
+    db_name, json_path = str(tmp_path / "jobs"), str(tmp_path / "jobs.json")
+    write_jobs(json_path, 5)
+    data_prep.sync_json_file(db_name, json_path, db_name)
+    stat = os.stat(json_path)
+    os.utime(json_path, (stat.st_atime, stat.st_mtime + 60))
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the database should not be rebuilt")
+    monkeypatch.setattr(data_prep, "index_json_file", fail)
+    assert not data_prep.sync_json_file(db_name, json_path, db_name)
+    assert data_prep.read_manifest(db_name)[json_path]["mtime"] == stat.st_mtime + 60
+
+
+def test_changed_files_are_rebuilt_without_duplicating_rows(tmp_path):
+    db_name, json_path = str(tmp_path / "jobs"), str(tmp_path / "jobs.json")
+    write_jobs(json_path, 5)
+    data_prep.sync_json_file(db_name, json_path, db_name)
+    write_jobs(json_path, 8)
+    assert data_prep.sync_json_file(db_name, json_path, db_name)
+    assert job_count(db_name) == 8
+    assert data_prep.read_manifest(db_name)[json_path]["content_hash"] == data_prep.hash_file(json_path)
+
+
+def test_databases_of_an_older_schema_version_are_rebuilt(tmp_path, monkeypatch):
+    db_name, json_path = str(tmp_path / "jobs"), str(tmp_path / "jobs.json")
+    write_jobs(json_path, 5)
+    monkeypatch.setattr(data_prep, "SCHEMA_VERSION", data_prep.SCHEMA_VERSION - 1)
+    data_prep.sync_json_file(db_name, json_path, db_name)
+    monkeypatch.undo()
+    assert data_prep.sync_json_file(db_name, json_path, db_name)
+    assert data_prep.read_manifest(db_name)[json_path]["schema_version"] == data_prep.SCHEMA_VERSION
+
+
+def test_changed_files_are_appended_with_matching_natural_keys(tmp_path, monkeypatch):
+    db_name, json_path = str(tmp_path / "jobs"), str(tmp_path / "jobs.json")
+    keys = {"jobs": "job_record.id"}
+    write_jobs(json_path, 5)
+    data_prep.sync_json_file(db_name, json_path, db_name, natural_keys=keys)
+    write_jobs(json_path, 8)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the database should not be rebuilt")
+    monkeypatch.setattr(data_prep, "index_json_file", fail)
+    assert data_prep.sync_json_file(db_name, json_path, db_name, natural_keys=keys)
+    assert job_count(db_name) == 8
+
+    # Different keys cannot be appended to, so the database is rebuilt
+    monkeypatch.undo()
+    write_jobs(json_path, 9)
+    assert data_prep.sync_json_file(db_name, json_path, db_name, natural_keys={"jobs": "job_record.status"})
+    assert data_prep.read_natural_keys(db_name)["jobs"] == "job_record.status"
+    assert job_count(db_name) == 9
@@ -0,0 +1,172 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import wait
+
+import pytest
+from fastapi.testclient import TestClient
+from smolagents import ActionStep, FinalAnswerStep, PlanningStep
+from smolagents.memory import ToolCall
+from smolagents.monitoring import Timing
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+import main  # noqa: E402
+
+
+class FakeAgent:
+    """Stands in for the task agent; run blocks until the test releases it."""
+
+    name = None
+
+    def __init__(self, release, error=None):
+        self.release, self.error = release, error
+
+    def run(self, task, additional_args=None):
+        assert self.release.wait(10)
+        if self.error:
+            raise RuntimeError(self.error)
+        return f"answer for {additional_args['db_name']}"
+
+
+class SteppingAgent(FakeAgent):
+    """Reports a planning step, an action step and the final answer to its step callbacks."""
+
+    def __init__(self, release, step_callbacks, error=None):
+        super().__init__(release, error)
+        self.step_callbacks = step_callbacks
+
+    def run(self, task, additional_args=None):
+        steps = [
+            PlanningStep(model_input_messages=[], model_output_message=None, plan="Count the jobs", timing=Timing(0.0, 0.1)),
+            ActionStep(step_number=1, timing=Timing(0.1, 0.6), tool_calls=[ToolCall(name="query_duckdb", arguments={"query": "SELECT 1"}, id="1")],
+                       code_action="query_duckdb('SELECT 1')", observations="1"),
+        ]
+        for step in steps:
+            self.step_callbacks[type(step)](step, self)
+        output = super().run(task, additional_args)
+        self.step_callbacks[FinalAnswerStep](FinalAnswerStep(output=output), self)
+        return output
+
+
+@pytest.fixture
+def release(monkeypatch):
+    event = threading.Event()
+    monkeypatch.setattr(main, "create_task_agent", lambda step_callbacks=None: FakeAgent(event))
+    monkeypatch.setattr(main, "agent_jobs", {})
+    monkeypatch.setattr(main, "agent_slots", threading.BoundedSemaphore(2))
+    yield event
+    # Never leave a worker blocked, and let jobs release their slot before it is restored
+    event.set()
+    wait([job["future"] for job in main.agent_jobs.values()])
+
+
+@pytest.fixture
+def client():
+    # Not entered as a context manager, so the startup indexer does not run
+    return TestClient(main.app)
+
+
+def wait_for_status(client, job_id, status):
+    for _ in range(500):
+        job = client.get(f"/task_agent/jobs/{job_id}").json()
+        if job["status"] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} never reached {status}: {job}")
+
+
+def test_a_job_goes_from_queued_to_succeeded(client, release):
+    response = client.post("/task_agent/jobs", json={"task": "count jobs", "db_name": "jobs"})
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] in ("queued", "running")
+    assert job["prompt_assembly_ms"] is not None
+
+    running = wait_for_status(client, job["job_id"], "running")
+    assert running["queue_ms"] is not None and running["run_ms"] is None
+
+    release.set()
+    done = wait_for_status(client, job["job_id"], "succeeded")
+    assert done["output"] == "answer for jobs"
+    assert done["run_ms"] is not None and done["error"] is None
+
+
+def test_a_failed_job_reports_its_error(client, release, monkeypatch):
+    monkeypatch.setattr(main, "create_task_agent", lambda step_callbacks=None: FakeAgent(release, error="boom"))
+    job_id = client.post("/task_agent/jobs", json={"task": "count jobs", "db_name": "jobs"}).json()["job_id"]
+    release.set()
+    assert wait_for_status(client, job_id, "failed")["error"] == "boom"
+
+
+def test_unknown_jobs_are_404(client):
+    assert client.get("/task_agent/jobs/missing").status_code == 404
+
+
+def test_a_full_queue_is_rejected_with_429(client, release):
+    job_ids = [client.post("/task_agent/jobs", json={"task": "t", "db_name": "jobs"}).json()["job_id"] for _ in range(2)]
+    response = client.post("/task_agent/jobs", json={"task": "t", "db_name": "jobs"})
+    assert response.status_code == 429
+    assert client.post("/task_agent", json={"task": "t", "db_name": "jobs"}).status_code == 429
+
+    # Finished jobs free their slot
+    release.set()
+    for job_id in job_ids:
+        wait_for_status(client, job_id, "succeeded")
+    assert client.post("/task_agent/jobs", json={"task": "t", "db_name": "jobs"}).status_code == 202
+
+
+def test_the_prompt_is_built_off_the_event_loop(client, release, monkeypatch):
+    build_task_prompt = main.build_task_prompt
+
+    def build_outside_loop(input):
+        with pytest.raises(RuntimeError):
+            asyncio.get_running_loop()
+        return build_task_prompt(input)
+    monkeypatch.setattr(main, "build_task_prompt", build_outside_loop)
+
+    release.set()
+    response = client.post("/task_agent", json={"task": "count jobs", "db_name": "jobs"})
+    assert response.status_code == 200
+    assert response.json()["output"] == "answer for jobs"
+
+
+def stream(client, release, monkeypatch, format, error=None):
+    monkeypatch.setattr(main, "create_task_agent", lambda step_callbacks=None: SteppingAgent(release, step_callbacks, error))
+    release.set()
+    response = client.post(f"/task_agent/stream?format={format}", json={"task": "count jobs", "db_name": "jobs"})
+    assert response.status_code == 200
+    return response
+
+
+def test_ndjson_events_arrive_in_step_order(client, release, monkeypatch):
+    response = stream(client, release, monkeypatch, "ndjson")
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in response.text.splitlines()]
+
+    assert [event["type"] for event in events] == ["queued", "planning", "action", "final_answer", "result"]
+    assert events[1]["plan"] == "Count the jobs"
+    assert events[2]["tool_calls"] == [{"name": "query_duckdb", "arguments": {"query": "SELECT 1"}}]
+    assert events[2]["duration_ms"] == 500.0
+    assert events[3]["output"] == events[4]["output"] == "answer for jobs"
+
+
+def test_sse_events_name_their_type(client, release, monkeypatch):
+    response = stream(client, release, monkeypatch, "sse")
+    assert response.headers["content-type"].startswith("text/event-stream")
+    messages = [message.split("\n") for message in response.text.strip().split("\n\n")]
+
+    assert [lines[0] for lines in messages] == [f"event: {name}" for name in ("queued", "planning", "action", "final_answer", "result")]
+    for lines in messages:
+        assert json.loads(lines[1].removeprefix("data: "))["type"] == lines[0].removeprefix("event: ")
+
+
+def test_a_failed_stream_ends_with_an_error_event(client, release, monkeypatch):
+    events = [json.loads(line) for line in stream(client, release, monkeypatch, "ndjson", error="boom").text.splitlines()]
+    assert [event["type"] for event in events] == ["queued", "planning", "action", "error"]
+    assert events[-1]["error"] == "boom"
+
+
+def test_unknown_stream_formats_are_rejected(client):
+    assert client.post("/task_agent/stream?format=xml", json={"task": "t", "db_name": "jobs"}).status_code == 400
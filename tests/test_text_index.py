@@ -0,0 +1,82 @@
+import math
+import re
+
+import duckdb
+import pytest
+
+import data_prep
+from agents import text_index
+
+DOCUMENT = {
+    "jobs": [
+        {"name": "nightly build", "owner": {"team": "infra"}, "steps": [{"cmd": "make build"}, {"cmd": "deploy release"}]},
+        {"name": "weekly report", "owner": {"team": "data"}, "steps": [{"cmd": "build report report"}]},
+    ],
+    "meta": {"title": "release notes"},
+}
+
+
+@pytest.fixture
+def conn(tmp_path):
+    db_name = str(tmp_path / "jobs")
+    data_prep.index_json(db_name, DOCUMENT, db_name)
+    conn = duckdb.connect(f"{db_name}.duckdb", read_only=True)
+    yield conn
+    conn.close()
+
+
+def bm25(query, values):
+    """Reference BM25 scores of each value, computed in Python."""
+    documents = [re.findall(r"\w+", value.lower()) for value in values]
+    avg_length = sum(map(len, documents)) / len(documents)
+    scores = []
+    for terms in documents:
+        score = 0.0
+        for term in set(re.findall(r"\w+", query.lower())):
+            df = sum(term in other for other in documents)
+            tf = terms.count(term)
+            if tf:
+                idf = math.log(1 + (len(documents) - df + 0.5) / (df + 0.5))
+                score += idf * tf * (text_index.BM25_K1 + 1) / (tf + text_index.BM25_K1 * (1 - text_index.BM25_B + text_index.BM25_B * len(terms) / avg_length))
+        scores.append(score)
+    return scores
+
+
+def test_every_string_leaf_is_indexed(conn):
+    leaves = conn.execute("SELECT table_name, column_name, value FROM text_leaves ORDER BY leaf_id").fetchall()
+    assert [leaf[2] for leaf in leaves] == [
+        "nightly build", "weekly report", "infra", "data", "make build", "deploy release", "build report report", "release notes"
+    ]
+    assert conn.execute("SELECT leaves, avg_length FROM text_index_stats").fetchone() == (8, 15 / 8)
+
+
+def test_scores_match_bm25(conn):
+    values = [row[0] for row in conn.execute("SELECT value FROM text_leaves ORDER BY leaf_id").fetchall()]
+    for query in ["build", "report release", "deploy"]:
+        expected = {value: score for value, score in zip(values, bm25(query, values), strict=True) if score}
+        found = {leaf["value"]: leaf["score"] for leaf in text_index.search_leaves(conn, query)}
+        assert found == pytest.approx(expected)
+
+
+def test_rarer_and_repeated_terms_rank_higher(conn):
+    # "report" occurs twice in the step command, once in the job name
+    assert [leaf["value"] for leaf in text_index.search_leaves(conn, "REPORT!")] == ["build report report", "weekly report"]
+    # "deploy" occurs in a single leaf, so it outweighs the common "build"
+    assert text_index.search_leaves(conn, "build deploy", limit=1)[0]["value"] == "deploy release"
+    assert text_index.search_leaves(conn, "nothing matches") == []
+
+
+def test_resolved_records_lead_back_to_the_top_level_item(conn):
+    leaves = text_index.search_leaves(conn, "build")
+    text_index.resolve_records(conn, leaves)
+    assert [(leaf["json_path"], leaf["root_path"], leaf["root_table"], leaf["root_record_id"]) for leaf in leaves] == [
+        ("jobs[0].name", "jobs[0]", "jobs", "1"),
+        ("jobs[0].steps[0].cmd", "jobs[0]", "jobs", "1"),
+        ("jobs[1].steps[0].cmd", "jobs[1]", "jobs", "2"),
+    ]
+
+    leaves = text_index.search_leaves(conn, "release") + text_index.search_leaves(conn, "infra")
+    text_index.resolve_records(conn, leaves)
+    assert [leaf["json_path"] for leaf in leaves] == ["jobs[0].steps[1].cmd", "meta.title", "jobs[0].owner.team"]
+    assert leaves[1]["root_path"] == "meta"
+
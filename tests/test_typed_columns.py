@@ -0,0 +1,65 @@
+import json
+
+import duckdb
+
+import data_prep
+
+
+def index_jobs(tmp_path, jobs, **kwargs):
+    db_name, json_path = str(tmp_path / "jobs"), str(tmp_path / "jobs.json")
+    with open(json_path, "w") as f:
+        json.dump({"jobs": jobs}, f)
+    data_prep.index_json_file(db_name, json_path, db_name, **kwargs)
+    return duckdb.connect(f"{db_name}.duckdb", read_only=True)
+
+
+def column_types(conn, table_name):
+    return dict(conn.execute("SELECT column_name, data_type FROM information_schema.columns WHERE table_name = ?", [table_name]).fetchall())
+
+
+def test_values_get_native_types(tmp_path):
+    conn = index_jobs(tmp_path, [
+        {"id": 1, "score": 1.5, "done": True, "at": "2024-01-01T10:00:00Z", "uid": "123e4567-e89b-12d3-a456-426614174000", "name": "a"},
+        {"id": 2, "score": 2, "done": False, "at": "2024-02-29", "uid": None, "name": "b"},
+    ])
+    assert column_types(conn, "jobs") == {
+        "record_id": "BIGINT", "id": "BIGINT", "score": "DOUBLE", "done": "BOOLEAN",
+        "at": "TIMESTAMP", "uid": "UUID", "name": "VARCHAR",
+    }
+
+
+def test_invalid_dates_stay_text(tmp_path):
+    conn = index_jobs(tmp_path, [{"id": 1, "day": "2024-02-30"}, {"id": 2, "day": "2024-01-01T24:00:00"}])
+    assert column_types(conn, "jobs")["day"] == "VARCHAR"
+    assert conn.execute("SELECT day FROM jobs ORDER BY id").fetchall() == [("2024-02-30",), ("2024-01-01T24:00:00",)]
+
+
+def test_an_invalid_date_outside_the_type_sample_widens_the_column(tmp_path):
+    jobs = [{"id": i, "day": f"2024-01-{i % 28 + 1:02d}"} for i in range(5000)]
+    jobs[4321]["day"] = "2024-02-30"
+    conn = index_jobs(tmp_path, jobs)
+    assert column_types(conn, "jobs")["day"] == "VARCHAR"
+    assert conn.execute("SELECT id FROM jobs WHERE day = '2024-02-30'").fetchall() == [(4321,)]
+
+
+def test_values_duckdb_cannot_convert_widen_the_column(tmp_path, monkeypatch):
+    # Stand in for a string that passes the Python check but that DuckDB rejects
+    monkeypatch.setattr(data_prep, "is_timestamp", lambda value: True)
+    conn = index_jobs(tmp_path, [{"id": 1, "day": "2024-01-01"}, {"id": 2, "day": "2024-02-30"}])
+    assert column_types(conn, "jobs")["day"] == "VARCHAR"
+    assert conn.execute("SELECT COUNT(*) FROM jobs").fetchone() == (2,)
+
+
+def test_appends_widen_columns_before_inserting(tmp_path, monkeypatch):
+    keys = {"jobs": "id"}
+    conn = index_jobs(tmp_path, [{"id": 1, "day": "2024-01-01"}], natural_keys=keys)
+    assert column_types(conn, "jobs")["day"] == "TIMESTAMP"
+    conn.close()
+
+    monkeypatch.setattr(data_prep, "is_timestamp", lambda value: True)
+    with open(tmp_path / "jobs.json", "w") as f:
+        json.dump({"jobs": [{"id": 1, "day": "2024-01-01"}, {"id": 2, "day": "2024-02-30"}]}, f)
+    assert data_prep.append_json_file(str(tmp_path / "jobs"), str(tmp_path / "jobs.json"), keys) == 1
+    conn = duckdb.connect(str(tmp_path / "jobs.duckdb"), read_only=True)
+    assert column_types(conn, "jobs")["day"] == "VARCHAR"
+    assert conn.execute("SELECT COUNT(*) FROM jobs").fetchone() == (2,)
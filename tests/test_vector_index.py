@@ -0,0 +1,102 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from agents import vector_index
+
+
+def build(db_name, vectors, ivf_min_vectors):
+    writer = vector_index.create_writer(db_name)
+    points = [SimpleNamespace(vector=vector.tolist(), payload={"id": i}) for i, vector in enumerate(vectors)]
+    # Written in several batches, like the embedding flushes during indexing
+    for start in range(0, len(points), 100):
+        vector_index.add_points(writer, points[start:start + 100])
+    vector_index.finish_writer(writer, ivf_min_vectors)
+
+
+def exact_ids(vectors, query, k):
+    scores = vector_index.normalize(vectors) @ vector_index.normalize(query)
+    return np.argsort(-scores, kind="stable")[:k].tolist()
+
+
+def result_ids(results):
+    return [result["payload"]["id"] for result in results]
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(1).normal(size=(1000, 16)).astype(np.float32)
+
+
+def test_brute_force_search_is_exact(tmp_path, vectors):
+    db_name = str(tmp_path / "db")
+    build(db_name, vectors, ivf_min_vectors=10**9)
+    assert vector_index.load_index(db_name)["meta"]["lists"] == 0
+    for query in vectors[:5] + 0.1:
+        results = vector_index.search(db_name, query, limit=10)
+        assert result_ids(results) == exact_ids(vectors, query, 10)
+        assert results[0]["score"] == pytest.approx(float(vector_index.normalize(vectors[result_ids(results)[0]]) @ vector_index.normalize(query)), abs=1e-5)
+
+
+def test_ivf_search_probing_every_list_matches_brute_force(tmp_path, vectors):
+    db_name = str(tmp_path / "db")
+    build(db_name, vectors, ivf_min_vectors=1)
+    lists = vector_index.load_index(db_name)["meta"]["lists"]
+    assert lists == int(4 * np.sqrt(len(vectors)))
+    query = vectors[7]
+    assert result_ids(vector_index.search(db_name, query, limit=10, nprobe=lists)) == exact_ids(vectors, query, 10)
+    assert result_ids(vector_index.search(db_name, query, limit=10, exact=True)) == exact_ids(vectors, query, 10)
+    # With few lists probed the nearest vector, which sits in the closest list, is still found
+    assert result_ids(vector_index.search(db_name, query, limit=1, nprobe=1)) == [7]
+
+
+def test_ivf_on_fewer_vectors_than_lists(tmp_path, vectors):
+    db_name = str(tmp_path / "db")
+    # 4 * sqrt(5) lists would exceed the 5 vectors available to train them
+    build(db_name, vectors[:5], ivf_min_vectors=1)
+    assert vector_index.load_index(db_name)["meta"]["lists"] == 5
+    assert sorted(result_ids(vector_index.search(db_name, vectors[0], limit=10, nprobe=5))) == [0, 1, 2, 3, 4]
+
+
+def test_index_is_reloaded_after_a_rebuild(tmp_path, vectors):
+    db_name = str(tmp_path / "db")
+    build(db_name, vectors[:10], ivf_min_vectors=10**9)
+    first = vector_index.load_index(db_name)
+    assert vector_index.load_index(db_name) is first
+
+    build(db_name, vectors[10:30], ivf_min_vectors=10**9)
+    meta_path = os.path.join(vector_index.index_dir(db_name), "index.json")
+    os.utime(meta_path, ns=(first["mtime"] + 10**9, first["mtime"] + 10**9))
+    reloaded = vector_index.load_index(db_name)
+    assert reloaded is not first
+    assert reloaded["meta"]["count"] == 20
+    assert result_ids(vector_index.search(db_name, vectors[15], limit=1)) == [5]
+
+
+def test_empty_and_missing_indexes(tmp_path, vectors):
+    db_name = str(tmp_path / "db")
+    with pytest.raises(FileNotFoundError):
+        vector_index.search(db_name, vectors[0])
+    build(db_name, vectors[:0], ivf_min_vectors=1)
+    assert vector_index.search(db_name, vectors[0]) == []
+    vector_index.remove_index(db_name)
+    assert not os.path.exists(vector_index.index_dir(db_name))
+
+
+def test_vectors_of_another_dimension_are_rejected(tmp_path, vectors):
+    writer = vector_index.create_writer(str(tmp_path / "db"))
+    vector_index.add_points(writer, [SimpleNamespace(vector=vectors[0].tolist(), payload={})])
+    with pytest.raises(ValueError):
+        vector_index.add_points(writer, [SimpleNamespace(vector=[1.0, 2.0], payload={})])
+
+
+def test_removing_a_linked_index_keeps_its_target(tmp_path, vectors):
+    build(str(tmp_path / "export"), vectors[:3], ivf_min_vectors=10**9)
+    db_name = str(tmp_path / "db")
+    os.symlink(vector_index.index_dir(str(tmp_path / "export")), vector_index.index_dir(db_name))
+    assert vector_index.load_index(db_name)["meta"]["count"] == 3
+    vector_index.remove_index(db_name)
+    assert not os.path.lexists(vector_index.index_dir(db_name))
+    assert os.path.exists(os.path.join(vector_index.index_dir(str(tmp_path / "export")), "index.json"))
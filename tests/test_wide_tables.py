@@ -0,0 +1,80 @@
+import json
+
+import duckdb
+
+import data_prep
+
+JOBS = [
+    {"name": "a", "job_record": {"status": "SUCCESS", "owner": {"team": "infra"}}, "tags": [{"name": "x", "n": 1}, {"name": "y", "n": 2}]},
+    {"name": "b", "job_record": {"status": "FAILED"}, "tags": []},
+    {"name": "c"},
+]
+
+
+def test_one_row_per_item_with_a_column_per_path(tmp_path):
+    db_name = str(tmp_path / "jobs")
+    data_prep.index_json(db_name, {"jobs": JOBS, "meta": {"count": 3}}, db_name, wide_tables=True)
+    conn = duckdb.connect(f"{db_name}.duckdb", read_only=True)
+
+    columns = conn.execute("SELECT column_name, data_type FROM information_schema.columns WHERE table_name = 'jobs_wide' ORDER BY ordinal_position").fetchall()
+    assert columns == [
+        ("record_id", "BIGINT"),
+        ("name", "VARCHAR"),
+        ("job_record.status", "VARCHAR"),
+        ("job_record.owner.team", "VARCHAR"),
+        ("tags", 'STRUCT("name" VARCHAR, n BIGINT)[]'),
+    ]
+    # Items missing a nested object or array keep their row
+    assert conn.execute("SELECT * FROM jobs_wide").fetchall() == [
+        (1, "a", "SUCCESS", "infra", [{"name": "x", "n": 1}, {"name": "y", "n": 2}]),
+        (2, "b", "FAILED", None, None),
+        (3, "c", None, None, None),
+    ]
+    assert conn.execute("SELECT parent_table, is_array, count, flattened_from FROM schema_info WHERE table_name = 'jobs_wide'").fetchone() == (None, True, 3, "jobs")
+    # Only top-level arrays are flattened
+    assert conn.execute("SELECT table_name FROM schema_info WHERE flattened_from IS NOT NULL").fetchall() == [("jobs_wide",)]
+    conn.close()
+
+
+def test_wide_tables_answer_the_join_query(tmp_path):
+    db_name = str(tmp_path / "jobs")
+    data_prep.index_json(db_name, {"jobs": JOBS}, db_name, wide_tables=True)
+    conn = duckdb.connect(f"{db_name}.duckdb", read_only=True)
+    wide = conn.execute("""
+        SELECT "job_record.status", SUM(list_sum(list_transform(tags, t -> t.n))) FROM jobs_wide
+        WHERE "job_record.status" IS NOT NULL GROUP BY ALL ORDER BY ALL
+    """).fetchall()
+    joined = conn.execute("""
+        SELECT r.status, SUM(t.n) FROM jobs j
+        JOIN jobs_job_record r ON r.parent_id = j.record_id
+        LEFT JOIN jobs_tags t ON t.parent_id = j.record_id
+        GROUP BY ALL ORDER BY ALL
+    """).fetchall()
+    conn.close()
+    assert wide == joined == [("FAILED", None), ("SUCCESS", 3)]
+
+
+def test_wide_tables_are_optional(tmp_path):
+    db_name = str(tmp_path / "jobs")
+    data_prep.index_json(db_name, {"jobs": JOBS}, db_name, wide_tables=False)
+    conn = duckdb.connect(f"{db_name}.duckdb", read_only=True)
+    assert conn.execute("SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = 'jobs_wide'").fetchone() == (0,)
+    conn.close()
+
+
+def test_appended_items_are_added_to_the_wide_table(tmp_path):
+    db_name, json_path = str(tmp_path / "jobs"), str(tmp_path / "jobs.json")
+    jobs = [dict(job, id=i) for i, job in enumerate(JOBS)]
+    with open(json_path, "w") as f:
+        json.dump({"jobs": jobs}, f)
+    data_prep.index_json_file(db_name, json_path, db_name, wide_tables=True, natural_keys={"jobs": "id"})
+
+    with open(json_path, "w") as f:
+        json.dump({"jobs": jobs + [{"id": 3, "name": "d", "job_record": {"status": "QUEUED"}, "tags": [{"name": "z", "n": 5}]}]}, f)
+    assert data_prep.append_json_file(db_name, json_path, {"jobs": "id"}) == 1
+
+    conn = duckdb.connect(f"{db_name}.duckdb", read_only=True)
+    assert conn.execute('SELECT name, "job_record.status", tags FROM jobs_wide ORDER BY record_id').fetchall()[-1] == ("d", "QUEUED", [{"name": "z", "n": 5}])
+    assert conn.execute("SELECT COUNT(*) FROM jobs_wide").fetchone() == (4,)
+    assert conn.execute("SELECT count FROM schema_info WHERE table_name = 'jobs_wide'").fetchone() == (4,)
+    conn.close()